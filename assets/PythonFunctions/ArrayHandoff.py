@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import sys
+import json
+import struct
+import numpy as np
+
+
+# Contains
+# 1. pack_arrays
+# 2. write_arrays
+# 3. read_arrays
+# 4. share_arrays
+# 5. open_shared_arrays
+# 6. handoff_arrays
+
+
+# Arrays handed from the host to a figure script without a text round trip
+# through DIR_TMP, either as a binary stream on stdin or in a named
+# shared-memory segment, both with the same layout:
+#   MAGIC (8 bytes) | header length (uint32, little-endian) | JSON header |
+#   zero padding | arrays (C order, each starting at a multiple of ALIGNMENT)
+# The JSON header holds one entry per array in "arrays", with "name" (e.g.
+# ENSdM, ENSdM_ROT, CNTR_68, CNTR_ROT_68), "shape", "dtype" (numpy string,
+# e.g. "<f8") and "offset" (bytes from the start of the message), plus any
+# optional keys such as "units". Contours are sent as their CNTR rows (NaN
+# rows between rings).
+MAGIC = b"MYRHND01"
+ALIGNMENT = 64
+
+# Handoff sources given to the figure scripts:
+#   "stdin"        binary stream on the standard input (direct script runs
+#                  only: RenderWorker rejects it, as stdin holds its jobs)
+#   "shm:<name>"   named shared-memory segment, created and unlinked by the
+#                  host (e.g. MemoryMappedFile.CreateNew(name) on Windows)
+STDIN_SOURCE = "stdin"
+SHARED_PREFIX = "shm:"
+
+# Segments created by this process (see share_arrays)
+_created = set()
+
+
+
+def _aligned(nBytes):
+
+    return -(-nBytes // ALIGNMENT) * ALIGNMENT
+
+
+
+def _layout(arrays, extra=None):
+
+    # Header entries and total size of a message (offsets from its start)
+    extra = extra or {}
+    entries = [dict(extra.get(name, {}), name=name, shape=list(np.shape(data)),
+                    dtype=np.asarray(data).dtype.newbyteorder("<").str, offset=0)
+               for name, data in arrays.items()]
+
+    # Offsets are written in the header, so repeat until its length settles
+    dataStart = -1
+    while True:
+        payload = json.dumps({"arrays" : entries}).encode("utf-8")
+        if _aligned(len(MAGIC) + 4 + len(payload)) == dataStart:
+            break
+
+        dataStart = position = _aligned(len(MAGIC) + 4 + len(payload))
+        for entry, data in zip(entries, arrays.values()):
+            entry["offset"] = position
+            position = _aligned(position + np.asarray(data).nbytes)
+
+    return payload, entries, position
+
+
+
+def pack_arrays(arrays, extra=None):
+    """
+    Encodes arrays as one handoff message.
+
+    Parameters
+    ----------
+    arrays : dict
+        Arrays keyed by name.
+    extra : dict, optional
+        Optional header keys of each array (e.g. {"ENSdM": {"units": "N*m"}}).
+
+    Returns
+    -------
+    bytes
+
+    """
+
+    payload, entries, size = _layout(arrays, extra)
+
+    message = bytearray(size)
+    block = MAGIC + struct.pack("<I", len(payload)) + payload
+    message[:len(block)] = block
+
+    for entry, data in zip(entries, arrays.values()):
+        data = np.ascontiguousarray(data, dtype=entry["dtype"])
+        message[entry["offset"]:entry["offset"] + data.nbytes] = data.tobytes()
+
+    return bytes(message)
+
+
+
+def write_arrays(stream, arrays, extra=None):
+    """
+    Writes arrays as one handoff message to a binary stream (see
+    pack_arrays).
+
+    Returns
+    -------
+    None.
+
+    """
+
+    stream.write(pack_arrays(arrays, extra))
+    stream.flush()
+
+
+
+def _read_exactly(stream, nBytes):
+
+    block = stream.read(nBytes)
+    if len(block) != nBytes:
+        raise EOFError("Handoff stream ended after %d of %d bytes." %(len(block), nBytes))
+
+    return block
+
+
+
+def _parse_header(block):
+
+    if block[:len(MAGIC)] != MAGIC:
+        raise ValueError("Input is not a MYRIAM array handoff.")
+
+    length = struct.unpack("<I", block[len(MAGIC):len(MAGIC)+4])[0]
+
+    return length
+
+
+
+def read_arrays(stream):
+    """
+    Reads one handoff message from a binary stream, e.g. sys.stdin.buffer.
+    Each array is read straight into its buffer, without parsing.
+
+    Parameters
+    ----------
+    stream : file object
+        Binary stream positioned at the start of a message.
+
+    Returns
+    -------
+    arrays : dict
+        Arrays keyed by name.
+    header : dict
+        Header entries keyed by name.
+
+    """
+
+    start = _read_exactly(stream, len(MAGIC) + 4)
+    length = _parse_header(start)
+    entries = json.loads(_read_exactly(stream, length).decode("utf-8"))["arrays"]
+
+    position = len(start) + length
+    arrays, header = {}, {}
+
+    for entry in entries:
+        _read_exactly(stream, entry["offset"] - position)
+
+        data = np.empty(entry["shape"], dtype=entry["dtype"])
+        view = memoryview(data.reshape(-1).view(np.uint8))
+
+        filled = 0
+        while filled < data.nbytes:
+            nRead = stream.readinto(view[filled:])
+            if not nRead:
+                raise EOFError("Handoff stream ended inside array '%s'." %entry["name"])
+            filled += nRead
+
+        position = entry["offset"] + data.nbytes
+        arrays[entry["name"]], header[entry["name"]] = data, entry
+
+    return arrays, header
+
+
+
+def share_arrays(name, arrays, extra=None):
+    """
+    Creates a named shared-memory segment holding arrays as one handoff
+    message, as the host does. The caller closes and unlinks it.
+
+    Parameters
+    ----------
+    name : string
+        Segment name.
+    arrays : dict
+        Arrays keyed by name.
+    extra : dict, optional
+        Optional header keys of each array.
+
+    Returns
+    -------
+    multiprocessing.shared_memory.SharedMemory
+
+    """
+
+    from multiprocessing.shared_memory import SharedMemory
+
+    message = pack_arrays(arrays, extra)
+
+    segment = SharedMemory(name=name, create=True, size=len(message))
+    segment.buf[:len(message)] = message
+    _created.add(segment._name)
+
+    return segment
+
+
+
+def open_shared_arrays(name):
+    """
+    Maps the arrays of a named shared-memory segment, without copying them.
+    The segment is owned by its creator: it is not unlinked here.
+
+    Parameters
+    ----------
+    name : string
+        Segment name.
+
+    Returns
+    -------
+    arrays : dict
+        Read-only arrays keyed by name, valid while the segment is open.
+    header : dict
+        Header entries keyed by name.
+    segment : multiprocessing.shared_memory.SharedMemory
+        Open segment, to close once the arrays are no longer used.
+
+    """
+
+    from multiprocessing.shared_memory import SharedMemory
+
+    segment = SharedMemory(name=name)
+
+    # Only the creator may unlink the segment (POSIX tracks attached ones too)
+    if os.name == "posix" and segment._name not in _created:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(segment._name, "shared_memory")
+
+    buffer = segment.buf
+    length = _parse_header(bytes(buffer[:len(MAGIC) + 4]))
+    entries = json.loads(bytes(buffer[len(MAGIC) + 4:len(MAGIC) + 4 + length]).decode("utf-8"))["arrays"]
+
+    arrays, header = {}, {}
+    for entry in entries:
+        data = np.frombuffer(buffer, dtype=entry["dtype"], count=int(np.prod(entry["shape"])),
+                             offset=entry["offset"]).reshape(entry["shape"])
+        data.flags.writeable = False
+        arrays[entry["name"]], header[entry["name"]] = data, entry
+
+    return arrays, header, segment
+
+
+
+def handoff_arrays(source):
+    """
+    Reads the arrays handed to a figure script. Shared-memory arrays are
+    copies, not views: the segment is closed before returning, so the
+    arrays stay valid whenever the host unlinks it. The copy is a single
+    memcpy per array, still far cheaper than formatting and parsing text;
+    use open_shared_arrays for zero-copy views.
+
+    Parameters
+    ----------
+    source : string or None
+        "stdin", "shm:<name>" or None (no handoff).
+
+    Returns
+    -------
+    dict
+        Arrays keyed by name (empty without a handoff).
+
+    """
+
+    if source is None:
+        return {}
+
+    if source == STDIN_SOURCE:
+        return read_arrays(sys.stdin.buffer)[0]
+
+    if not source.startswith(SHARED_PREFIX):
+        raise ValueError("Unknown handoff source '%s'. Must be '%s' or '%s<name>'."
+                         %(source, STDIN_SOURCE, SHARED_PREFIX))
+
+    views, _, segment = open_shared_arrays(source[len(SHARED_PREFIX):])
+    arrays = {name : np.array(data) for name, data in views.items()}
+
+    del views
+    segment.close()
+
+    return arrays
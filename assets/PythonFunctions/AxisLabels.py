@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import numpy as np
+
+
+# Contains
+# 1. setCartographic_AxisLabels
+
+
+# Degree tick labels of plain (non-projected) lon/lat axes. Kept apart from
+# MapFeatures so figures without a map projection do not import cartopy.
+
+
+
+def setCartographic_AxisLabels(ax):
+    
+    # Ticks range
+    ymin0, ymax0 = ax.get_ylim()
+    xmin0, xmax0 = ax.get_xlim()
+        
+    
+    # Ensure min starts at factor of 5 (if extent is not too small)
+    if ymax0 - ymin0 > 5: 
+        ymin, ymax = np.round( (ymin0-5)/5 ) * 5, ymax0
+    else:
+        ymin, ymax = np.floor(ymin0), np.ceil(ymax0)
+        
+        
+    if xmax0 - xmin0 > 5: 
+        xmin, xmax = np.round( (xmin0-5)/5 ) * 5, xmax0
+    else:
+        xmin, xmax = np.floor(xmin0), np.ceil(xmax0)
+        
+    
+    # Set ticks
+    yTickList = []
+    xTickList = []
+    step_sizes = [10, 5, 2, 1, 0.5]
+
+    for step in step_sizes:
+        yTickList = np.arange(ymin, ymax, step)
+        if len(yTickList) >= 5:
+            break
+        
+    for step in step_sizes:
+        xTickList = np.arange(xmin, xmax, step)
+        if len(xTickList) >= 5:
+            break
+    
+    
+    # Set labels
+    xTickLabels = [""] * len(xTickList)
+    for i in range(len(xTickList)):
+        xtick = xTickList[i]
+        
+        if step >= 1:
+            xTickLabels[i] = "%d$^\circ$" %xtick
+        else:
+            xTickLabels[i] = "%.1f$^\circ$" %xtick
+        
+        if xtick < 0:
+            xTickLabels[i] += "W"
+        elif xtick > 0:
+            xTickLabels[i] += "E"
+            
+            
+    yTickLabels = [""] * len(yTickList)
+    for i in range(len(yTickList)):
+        ytick = yTickList[i]
+        
+        if step >= 1:
+            yTickLabels[i] = "%d$^\circ$" %ytick
+        else:
+            yTickLabels[i] = "%.1f$^\circ$" %ytick
+        
+        if ytick < 0:
+            yTickLabels[i] += "S"
+        elif ytick > 0:
+            yTickLabels[i] += "N" 
+    
+    
+    ax.set(
+        yticks = yTickList,
+        xticks = xTickList,
+        yticklabels = yTickLabels,
+        xticklabels = xTickLabels,
+        ylim = (ymin0, ymax0),
+        xlim = (xmin0, xmax0),
+    )
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import time
+import hashlib
+import numpy as np
+from pathlib import Path
+import matplotlib.pyplot as plt
+from matplotlib.transforms import Bbox
+import cartopy.crs as ccrs
+
+
+from MapFeatures import globalFeatures, gridLabels_inside
+from GeometryCache import cacheFolder, save_cache_file
+from RenderProfile import profile_stage
+from FigureEncoding import parse_bbox, bbox_slices, save_image
+
+
+# Contains
+# 1. basemap_figure
+# 2. save_basemap_figure
+# 3. render_basemap
+# 4. evict_basemaps
+
+
+# Main project workspace
+projFolder = Path(__file__).parents[2]
+
+
+# Shapefiles drawn on the base map (any change to them makes cached layers stale)
+SHAPEFILES = ['Coastlines_Polygon.shp', 'PlateBoundaries_PolyLine.shp']
+
+
+# Axes rectangle (figure fraction) shared by the cached layer and the overlays
+BASEMAP_RECT = (0.02, 0.02, 0.96, 0.96)
+
+
+# Bump when the base-map styling changes, so older layers are not reused
+STYLE_VERSION = 1
+
+
+# Eviction policy: most recently used variants kept, and maximum age in days
+MAX_VARIANTS = 4
+MAX_AGE_DAYS = 30
+
+
+
+def _basemap_key(projection, figsize, dpi, xLinspace, yLinspace, simplify=0.0):
+
+    stamps = []
+    for shapefileName in SHAPEFILES:
+        stat = os.stat(os.path.join(projFolder, 'assets', 'Shapefiles', shapefileName))
+        stamps.append("%d-%d" %(stat.st_mtime_ns, stat.st_size))
+
+    keyItems = [STYLE_VERSION, projection.proj4_init, tuple(figsize), dpi, BASEMAP_RECT,
+                tuple(np.round(xLinspace, 6)), tuple(np.round(yLinspace, 6)), stamps]
+
+    # Simplified (draft) geometries only enter the key when used, so the
+    # full-detail layers keep their existing keys
+    if simplify > 0:
+        keyItems.append(simplify)
+
+    return hashlib.sha1(repr(keyItems).encode("utf-8")).hexdigest()[:16]
+
+
+
+def render_basemap(projection, figsize, dpi, xLinspace, yLinspace, simplify=0.0):
+    """
+    Renders the global background of a map figure: coastlines, plate
+    boundaries, grid lines and grid labels.
+
+    Parameters
+    ----------
+    projection : cartopy.crs.Projection
+        Map projection.
+    figsize : tuple
+        Figure width and height in inches.
+    dpi : int
+        Figure resolution.
+    xLinspace, yLinspace : array
+        Longitudes and latitudes of the grid lines, in degrees.
+    simplify : float, optional
+        Tolerance (degrees) used to simplify the shapefile geometries. The
+        default is 0.0 (full detail).
+
+    Returns
+    -------
+    image : array
+        Opaque RGB canvas of the whole figure, first row at the top.
+    tightBbox : array
+        Tight bounding box of the background artists in inches, as
+        (x0, y0, x1, y1).
+
+    """
+
+    fig = plt.figure(figsize=figsize, dpi=dpi)
+    ax = fig.add_axes(BASEMAP_RECT, projection=projection)
+
+    with profile_stage("globalFeatures"):
+        globalFeatures(ax, plotGridLines=False, simplify=simplify)
+
+    with profile_stage("gridLabels_inside"):
+        gridLabels_inside(ax, xLinspace, yLinspace)
+
+    with profile_stage("basemap_draw"):
+        fig.canvas.draw()
+    image = np.asarray(fig.canvas.buffer_rgba())[..., :3].copy()
+    tightBbox = fig.get_tightbbox(fig.canvas.get_renderer()).extents
+
+    plt.close(fig)
+
+    return image, tightBbox
+
+
+
+def evict_basemaps(maxVariants=MAX_VARIANTS, maxAgeDays=MAX_AGE_DAYS):
+    """
+    Deletes cached base-map layers unused for more than maxAgeDays, and the
+    least recently used ones beyond the maxVariants most recent. Layers
+    evicted while another process still uses them are rendered again by
+    save_basemap_figure.
+
+    Returns
+    -------
+    None.
+
+    """
+
+    folder = cacheFolder()
+
+    # Other processes may evict or rewrite layers meanwhile
+    layers = []
+    for fileName in os.listdir(folder):
+        if fileName.startswith("BASEMAP_") and fileName.endswith(".npz"):
+            try:
+                layers.append((os.path.getmtime(os.path.join(folder, fileName)), fileName))
+            except FileNotFoundError:
+                pass
+    layers.sort(reverse=True)
+
+    oldest = time.time() - maxAgeDays * 86400
+
+    for i, (mtime, fileName) in enumerate(layers):
+        if i >= maxVariants or mtime < oldest:
+            try:
+                os.remove(os.path.join(folder, fileName))
+            except OSError:
+                pass    # Already evicted, or open by its reader on Windows
+
+
+
+def _basemap_layer(projection, figsize, dpi, xLinspace, yLinspace, simplify=0.0):
+
+    # Path to the cached layer of a base-map variant, rendered if missing
+    layerPath = os.path.join(cacheFolder(), "BASEMAP_%s.npz"
+                             %_basemap_key(projection, figsize, dpi, xLinspace, yLinspace, simplify))
+
+    try:
+        os.utime(layerPath)     # Mark as recently used
+        return layerPath
+    except FileNotFoundError:
+        pass
+
+    with profile_stage("render_basemap"):
+        image, tightBbox = render_basemap(projection, figsize, dpi, xLinspace, yLinspace, simplify)
+
+    # Another process rendering the same variant may have saved it first
+    if save_cache_file(layerPath, image=image, tight_bbox=tightBbox):
+        evict_basemaps()
+
+    return layerPath
+
+
+
+def basemap_figure(xLinspace, yLinspace, figsize=(9,9), dpi=360, projection=None, simplify=0.0):
+    """
+    Creates a transparent global map figure for the run-specific overlays.
+    The background (coastlines, plate boundaries, grid lines and labels) is
+    not drawn; it is taken from the base-map cache by save_basemap_figure,
+    rendering the layer first if this variant is not cached yet.
+
+    Parameters
+    ----------
+    xLinspace, yLinspace : array
+        Longitudes and latitudes of the grid lines, in degrees.
+    figsize : tuple, optional
+        Figure width and height in inches. The default is (9,9).
+    dpi : int, optional
+        Figure resolution. The default is 360.
+    projection : cartopy.crs.Projection, optional
+        Map projection. The default is None (PlateCarree).
+    simplify : float, optional
+        Tolerance (degrees) used to simplify the coastlines and plate
+        boundaries, e.g. for draft renders. The default is 0.0 (full detail).
+
+    Returns
+    -------
+    fig : matplotlib.figure.Figure
+    ax : cartopy.mpl.geoaxes.GeoAxes
+
+    """
+
+    if projection is None:
+        projection = ccrs.PlateCarree()
+
+    basemapArgs = (projection, figsize, dpi, xLinspace, yLinspace, simplify)
+    layerPath = _basemap_layer(*basemapArgs)
+
+
+    # Set transparent figure, with the same axes box as the cached layer
+    fig = plt.figure(figsize=figsize, dpi=dpi)
+    fig.patch.set_alpha(0)
+    fig.basemapLayer = layerPath
+    fig.basemapArgs = basemapArgs
+
+    ax = fig.add_axes(BASEMAP_RECT, projection=projection)
+    ax.set_global()
+    ax.patch.set_visible(False)
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+
+    return fig, ax
+
+
+
+def save_basemap_figure(fig, figpath, pad_inches=0.1, bbox=None, compression=None):
+    """
+    Draws the overlays of a figure created by basemap_figure, composites them
+    onto the cached background and saves the result cropped to the tight
+    bounding box of both, as savefig(..., bbox_inches='tight') would. The
+    encoding runs in the encoder pool when it is running (see FigureEncoding).
+
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+        Figure created by basemap_figure.
+    figpath : string
+        Path to the output .png (or .webp) file.
+    pad_inches : float, optional
+        Padding around the tight bounding box. The default is 0.1.
+    bbox : Bbox, tuple or string, optional
+        Fixed crop in inches, as x0,y0,x1,y1 extents, when the layout is
+        known. The default is None (tight bounding box).
+    compression : int, optional
+        Compression level. The default is None (see compression_level).
+
+    Returns
+    -------
+    matplotlib.transforms.Bbox
+        Crop used, in inches.
+
+    """
+
+    with profile_stage("load_basemap"):
+        try:
+            layer = np.load(fig.basemapLayer)
+        except FileNotFoundError:
+            # Evicted by another process since basemap_figure
+            layer = np.load(_basemap_layer(*fig.basemapArgs))
+
+        with layer:
+            background = layer["image"]
+            layerBbox = Bbox.from_extents(*layer["tight_bbox"])
+
+    with profile_stage("draw_overlays"):
+        fig.canvas.draw()
+        overlay = np.asarray(fig.canvas.buffer_rgba())
+
+        bbox = parse_bbox(bbox)
+        if bbox is None:
+            overlayBbox = fig.get_tightbbox(fig.canvas.get_renderer())
+            bbox = Bbox.union([layerBbox, overlayBbox]).padded(pad_inches)
+
+
+    # Crop both canvases to the bounding box
+    rows, cols = bbox_slices(bbox, fig.dpi, *background.shape[:2])
+
+    image = background[rows, cols].copy()
+    overlay = overlay[rows, cols]
+
+
+    # Alpha-blend only the pixels the overlays touch
+    with profile_stage("composite"):
+        drawn = overlay[..., 3] != 0
+        alpha = overlay[drawn, 3:4].astype(np.float32) / 255
+        image[drawn] = (overlay[drawn, :3] * alpha + image[drawn] * (1 - alpha) + 0.5).astype(np.uint8)
+
+    with profile_stage("encode"):
+        save_image(image, figpath, compression, fig.dpi)
+
+    return bbox
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import sys
+import glob
+import json
+import time
+import queue
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from RenderWorker import load_scripts, start_job, finish_job
+from GridBundle import GRID_LAYERS, bundle_path
+from RenderQuality import render_tier
+from FigureEncoding import start_encoder
+from RunLabels import parse_runLabel     # Formerly defined here
+
+
+# Contains
+# 1. find_jobs
+# 2. tier_jobs
+# 3. render_jobs
+# 4. write_summary
+
+
+# Relative cost of each figure, used to start the slowest jobs first
+SCRIPT_COST = {
+    "GridMaps.py" : 3,
+    "RotatedEnsembleMap.py" : 2,
+    "ContourMap.py" : 2,
+    "MagnitudeHistogram.py" : 1,
+    }
+
+# Module-level state of each pool process: figure scripts, reply thread and
+# the queue replies are sent back on
+_modules = None
+_replies = None
+_replyQueue = None
+
+
+
+def _stem(path, prefix):
+
+    return os.path.splitext(os.path.basename(path))[0][len(prefix):]
+
+
+
+def find_jobs(dM_PDD_Dir, MTX_w2M_Dir, TMP_Dir=None):
+    """
+    Scans a DIR_dM_PPD / DIR_MTX_w2M pair for every figure whose input files
+    are present, and builds the matching figure jobs.
+
+    Parameters
+    ----------
+    dM_PDD_Dir : string
+        Folder with the MAGHIST and CNTR files of one or several runs.
+    MTX_w2M_Dir : string
+        Folder with the GRID (text files or bundle) and BDR files.
+    TMP_Dir : string, optional
+        Folder with the ENSdM/ENSdM_ROT ensembles and CNTR_68/CNTR_ROT_68
+        contours of a single run. The default is None (no rotated ensemble map).
+
+    Returns
+    -------
+    jobs : list
+        Figure jobs in the RenderWorker format (dicts with "id", "script"
+        and "args").
+    skipped : list
+        Replies for the figures that cannot be produced, with the reason.
+
+    """
+
+    jobs, skipped = [], []
+
+    def add_job(script, args):
+        jobs.append({"id" : "%s:%s" %(script, args[0]), "script" : script, "args" : args})
+
+    def skip_job(script, label, reason):
+        skipped.append({"id" : "%s:%s" %(script, label), "script" : script,
+                        "outputs" : [], "status" : "skipped", "error" : reason})
+
+    def has_boundary(plateLabel, modelStages):
+        return all(os.path.exists(os.path.join(MTX_w2M_Dir, "%s_%s_%s.txt" %(prefix, plateLabel, modelStages)))
+                   for prefix in ["BDR", "BDRin"])
+
+
+    # Runs whose outputs are stored in the PDD folder
+    runLabels = set()
+    for path in glob.glob(os.path.join(dM_PDD_Dir, "ENSdM_STGs_*.txt")):
+        runLabels.add(_stem(path, "ENSdM_STGs_"))
+
+
+    # Magnitude histograms (MAGHIST_<run>_<bins>.txt)
+    for path in sorted(glob.glob(os.path.join(dM_PDD_Dir, "MAGHIST_*.txt"))):
+        histLabel = _stem(path, "MAGHIST_")
+        runLabels.add(histLabel.rsplit("_", 1)[0])
+        add_job("MagnitudeHistogram.py", [histLabel, dM_PDD_Dir])
+
+
+    # Confidence contour maps (CNTR68_<run>_r<step>.txt)
+    for path in sorted(glob.glob(os.path.join(dM_PDD_Dir, "CNTR68_*.txt"))):
+        contourLabel = _stem(path, "CNTR68")
+        runLabel = contourLabel[1:].rsplit("_r", 1)[0]
+        runLabels.add(runLabel)
+
+        runInfo = parse_runLabel(runLabel)
+        if runInfo is None:
+            skip_job("ContourMap.py", contourLabel, "Unrecognised run label '%s'." %runLabel)
+        elif not has_boundary(runInfo[1], runInfo[0]):
+            skip_job("ContourMap.py", contourLabel, "Plate boundary files not found in %s." %MTX_w2M_Dir)
+        else:
+            add_job("ContourMap.py", [contourLabel, runInfo[1], runInfo[0], MTX_w2M_Dir, dM_PDD_Dir])
+
+
+    # Grid maps, once per model (the plate contour is taken from one of its runs)
+    runInfos = sorted(filter(None, map(parse_runLabel, runLabels)))
+    boundaries = [_stem(path, "BDR_").split("_", 1)[::-1]
+                  for path in sorted(glob.glob(os.path.join(MTX_w2M_Dir, "BDR_*.txt")))]
+
+    modelLabels = set(_stem(path, "GRID_MuA_") for path in glob.glob(os.path.join(MTX_w2M_Dir, "GRID_MuA_*.txt")))
+    modelLabels |= set(_stem(path, "GRID_") for path in glob.glob(os.path.join(MTX_w2M_Dir, "GRID_*.grd")))
+
+    for modelLabel in sorted(modelLabels):
+
+        candidates = [(stages, plate) for stages, plate, model in runInfos if model == modelLabel]
+        candidates = [(stages, plate) for stages, plate in candidates + boundaries
+                      if has_boundary(plate, stages)]
+
+        gridFiles = ["GRID_%s_%s.txt" %(layer, modelLabel) for layer in GRID_LAYERS]
+        hasGrids = os.path.exists(bundle_path(MTX_w2M_Dir, modelLabel)) or \
+            all(os.path.exists(os.path.join(MTX_w2M_Dir, name)) for name in gridFiles)
+
+        if not hasGrids:
+            skip_job("GridMaps.py", modelLabel, "Incomplete GRID files in %s." %MTX_w2M_Dir)
+        elif not candidates:
+            skip_job("GridMaps.py", modelLabel, "Plate boundary files not found in %s." %MTX_w2M_Dir)
+        else:
+            modelStages, plateLabel = candidates[0]
+            add_job("GridMaps.py", [modelLabel, modelStages, plateLabel, MTX_w2M_Dir])
+
+
+    # Rotated ensemble map (the TMP folder holds a single run)
+    if TMP_Dir is not None:
+        tmpFiles = ["CNTR_68.txt", "CNTR_ROT_68.txt"]
+        hasEnsembles = all(glob.glob(os.path.join(TMP_Dir, stem + ".*")) for stem in ["ENSdM", "ENSdM_ROT"])
+
+        if len(runLabels) != 1:
+            skip_job("RotatedEnsembleMap.py", TMP_Dir,
+                     "%d runs found in %s, the TMP folder must match a single run."
+                     %(len(runLabels), dM_PDD_Dir))
+        elif not hasEnsembles or not all(os.path.exists(os.path.join(TMP_Dir, name)) for name in tmpFiles):
+            skip_job("RotatedEnsembleMap.py", TMP_Dir, "Incomplete TMP files in %s." %TMP_Dir)
+        else:
+            runLabel = runLabels.pop()
+            modelStages, plateLabel, _ = parse_runLabel(runLabel)
+            add_job("RotatedEnsembleMap.py", [plateLabel, modelStages, TMP_Dir,
+                                              MTX_w2M_Dir, dM_PDD_Dir, runLabel])
+            jobs[-1]["id"] = "RotatedEnsembleMap.py:%s" %runLabel
+
+    return jobs, skipped
+
+
+
+def tier_jobs(jobs, qualities):
+    """
+    Repeats figure jobs for several render tiers (see RenderQuality).
+
+    Parameters
+    ----------
+    jobs : list
+        Figure jobs, as returned by find_jobs.
+    qualities : list
+        Render tiers, e.g. ["draft", "final"].
+
+    Returns
+    -------
+    list
+        One job per figure and tier, with the tier in its options and id.
+
+    """
+
+    tierJobs = []
+    for quality in qualities:
+        render_tier(quality)
+
+        for job in jobs:
+            options = dict(job.get("options", {}), quality=quality)
+            tierJobs.append(dict(job, id="%s:%s" %(job["id"], quality), options=options))
+
+    return tierJobs
+
+
+
+def _job_priority(job):
+
+    # Cheaper tiers first (drafts are ready before any final starts), then
+    # the slowest figures of each tier
+    tier = render_tier(job.get("options", {}).get("quality"))
+
+    return tier["dpi"], -SCRIPT_COST.get(job["script"], 1)
+
+
+
+def _init_worker(replyQueue):
+
+    global _modules, _replies, _replyQueue
+    _modules = load_scripts()
+    start_encoder()
+
+    _replies = ThreadPoolExecutor(max_workers=1, thread_name_prefix="replies")
+    _replyQueue = replyQueue
+
+
+
+def _finish_reply(index, reply, pending):
+
+    _replyQueue.put((index, finish_job(reply, pending)))
+
+
+
+def _run_job(index, job):
+
+    # The reply is sent once the figures are encoded, while this process
+    # already draws its next job
+    reply, pending = start_job(_modules, job)
+    _replies.submit(_finish_reply, index, reply, pending)
+
+
+
+def render_jobs(jobs, nWorkers=None, progress=None):
+    """
+    Renders figure jobs across a pool of processes. Each process imports the
+    figure scripts once (see RenderWorker) and then runs jobs until the queue
+    is empty, encoding the figures of a job while it draws the next one.
+    Draft-tier jobs are started before final-tier ones, and the slowest
+    figures of each tier first.
+
+    Parameters
+    ----------
+    jobs : list
+        Figure jobs, as returned by find_jobs.
+    nWorkers : int, optional
+        Number of processes. The default is None (one per CPU, but never
+        more than the number of jobs).
+    progress : callable, optional
+        Called with each reply as soon as its job finishes.
+
+    Returns
+    -------
+    list
+        RenderWorker replies, in the order of jobs.
+
+    """
+
+    if not jobs:
+        return []
+
+    nWorkers = min(nWorkers or os.cpu_count() or 1, len(jobs))
+    order = sorted(range(len(jobs)), key=lambda i: _job_priority(jobs[i]))
+    replies = [None] * len(jobs)
+
+    replyQueue = multiprocessing.Queue()
+
+    with ProcessPoolExecutor(max_workers=nWorkers, initializer=_init_worker,
+                             initargs=(replyQueue,)) as executor:
+        futures = [executor.submit(_run_job, i, jobs[i]) for i in order]
+
+        for _ in jobs:
+            while True:
+                try:
+                    index, reply = replyQueue.get(timeout=1.0)
+                    break
+                except queue.Empty:
+                    # A crashed worker never replies: raise its error
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            raise future.exception()
+
+            replies[index] = reply
+
+            if progress is not None:
+                progress(reply)
+
+    return replies
+
+
+
+def write_summary(replies, summaryPath, wall_s=None, nWorkers=None):
+    """
+    Saves the per-figure status and timing of a batch as a JSON file.
+
+    Parameters
+    ----------
+    replies : list
+        RenderWorker replies (rendered and skipped figures).
+    summaryPath : string
+        Path to the output JSON file.
+    wall_s : float, optional
+        Total wall time of the batch, in seconds.
+    nWorkers : int, optional
+        Number of processes used.
+
+    Returns
+    -------
+    dict
+        The saved summary.
+
+    """
+
+    statuses = [reply["status"] for reply in replies]
+
+    summary = {
+        "workers" : nWorkers,
+        "wall_s" : wall_s,
+        "cpu_s" : sum(reply.get("cpu_s", 0.0) for reply in replies),
+        "counts" : {status : statuses.count(status) for status in sorted(set(statuses))},
+        "figures" : replies,
+        }
+
+    with open(summaryPath, "w") as datafile_id:
+        json.dump(summary, datafile_id, indent=1)
+
+    return summary
+
+
+
+def _print_reply(reply):
+
+    print("%-8s %7.2fs  %s" %(reply["status"], reply.get("wall_s", 0.0), reply["id"]))
+    if reply["status"] != "ok":
+        print("         %s" %reply.get("error"))
+    sys.stdout.flush()
+
+
+
+if __name__ == "__main__":
+
+    # Cmd inputs: one "--pair DIR_dM_PPD DIR_MTX_w2M [DIR_TMP]" per run folder
+    parser = argparse.ArgumentParser(description="Render every MYRIAM figure found in run folders.")
+    parser.add_argument("-p", "--pair", nargs="+", action="append", required=True,
+                        metavar="DIR", help="DIR_dM_PPD DIR_MTX_w2M [DIR_TMP]")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of processes (default: one per CPU)")
+    parser.add_argument("-q", "--quality", default=None,
+                        help="render tiers, e.g. 'draft' or 'draft,final' (default: MYRIAM_QUALITY, else final)")
+    parser.add_argument("-s", "--summary", default=None,
+                        help="JSON summary path (default: BATCH_SUMMARY.json in the first DIR_dM_PPD)")
+    inputs = parser.parse_args()
+
+    jobs, skipped = [], []
+    for pair in inputs.pair:
+        if len(pair) not in (2, 3):
+            parser.error("--pair takes DIR_dM_PPD DIR_MTX_w2M [DIR_TMP], %d given." %len(pair))
+
+        pairJobs, pairSkipped = find_jobs(*pair)
+        jobs += pairJobs
+        skipped += pairSkipped
+
+    if inputs.quality is not None:
+        jobs = tier_jobs(jobs, inputs.quality.split(","))
+
+    for reply in skipped:
+        _print_reply(reply)
+
+    wall0 = time.perf_counter()
+    replies = render_jobs(jobs, inputs.workers, progress=_print_reply)
+    wall_s = time.perf_counter() - wall0
+
+    nWorkers = min(inputs.workers or os.cpu_count() or 1, max(len(jobs), 1))
+    summaryPath = inputs.summary or os.path.join(inputs.pair[0][0], "BATCH_SUMMARY.json")
+    summary = write_summary(replies + skipped, summaryPath, wall_s, nWorkers)
+
+    print("%d figures in %.1fs with %d workers (%s). Summary: %s"
+          %(len(replies), wall_s, nWorkers,
+            ", ".join("%d %s" %(n, status) for status, n in summary["counts"].items()),
+            summaryPath))
+
+    sys.exit(1 if summary["counts"].get("error") else 0)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import warnings
+import numpy as np
+
+
+# Contains
+# 1. split_rings
+# 2. load_contours
+# 3. write_contours
+# 4. contour_collection
+
+
+# Contours are kept as ragged arrays: one flat (nVertices, 2) lon/lat buffer
+# plus offsets, so ring i is vertices[offsets[i]:offsets[i+1]]. In the CNTR
+# text files rings are stacked and separated by NaN rows.
+
+
+
+def split_rings(coordinates):
+    """
+    Splits NaN-separated stacked rings into a ragged array. Empty rings
+    (consecutive or trailing NaN rows) are dropped.
+
+    Parameters
+    ----------
+    coordinates : array
+        Two-column array of lon/lat coordinates with NaN separator rows.
+
+    Returns
+    -------
+    vertices : array
+        Two-column array with the vertices of all rings.
+    offsets : array
+        Ring start indices into vertices, followed by the number of vertices.
+
+    """
+
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+
+    separator = np.isnan(coordinates).any(axis=1)
+    vertices = np.ascontiguousarray(coordinates[~separator])
+
+
+    # Ring number of each vertex, from the separators found before it
+    ringNr = np.cumsum(separator)[~separator]
+    ringSizes = np.unique(ringNr, return_counts=True)[1]
+
+    offsets = np.zeros(len(ringSizes) + 1, dtype=np.int64)
+    np.cumsum(ringSizes, out=offsets[1:])
+
+    return vertices, offsets
+
+
+
+def load_contours(path):
+    """
+    Reads a CNTR file (NaN-separated stacked rings) into a ragged array.
+
+    Parameters
+    ----------
+    path : string
+        Path to the contour file. Empty files give zero rings.
+
+    Returns
+    -------
+    vertices : array
+        Two-column array of lon/lat vertices.
+    offsets : array
+        Ring start indices into vertices, followed by the number of vertices.
+
+    """
+
+    # Empty files give (0, 2) with a warning
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        coordinates = np.loadtxt(path, dtype=np.float64, usecols=(0, 1), ndmin=2)
+
+    return split_rings(coordinates)
+
+
+
+def write_contours(path, vertices, offsets, fmt="%.3f"):
+    """
+    Saves a ragged array of rings as a CNTR file, one "lon lat" row per
+    vertex and a "NaN NaN" row between rings.
+
+    Parameters
+    ----------
+    path : string
+        Path to the output file.
+    vertices : array
+        Two-column array of lon/lat vertices.
+    offsets : array
+        Ring start indices into vertices, followed by the number of vertices.
+    fmt : string, optional
+        Format of each coordinate. The default is "%.3f".
+
+    Returns
+    -------
+    None.
+
+    """
+
+    vertices = np.asarray(vertices, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+
+    # Insert one NaN row before every ring but the first
+    nRings = len(offsets) - 1
+    stacked = np.full((len(vertices) + max(nRings - 1, 0), 2), np.nan)
+
+    rowShift = np.repeat(np.arange(nRings), np.diff(offsets))
+    stacked[np.arange(len(vertices)) + rowShift] = vertices
+
+    with open(path, "w") as datafile_id:
+        if len(stacked):
+            np.savetxt(datafile_id, stacked, fmt=fmt, delimiter=" ")
+
+
+
+def contour_collection(contours, transform=None, zorder=9):
+    """
+    Builds a single collection holding every ring of several contour sets,
+    so that they are transformed and drawn in one batch.
+
+    Parameters
+    ----------
+    contours : list
+        One dict per contour set, with keys "vertices" and "offsets" (as
+        returned by load_contours) and the optional line styles
+        "edgecolor", "linestyle" and "linewidth".
+    transform : matplotlib transform, optional
+        Coordinate transform of the vertices, e.g. ccrs.PlateCarree(). The
+        default is None (data coordinates).
+    zorder : float, optional
+        Drawing order. The default is 9.
+
+    Returns
+    -------
+    matplotlib.collections.PolyCollection
+        Closed, unfilled rings (not yet added to any axes).
+
+    """
+
+    from matplotlib.collections import PolyCollection
+
+    rings, edgecolors, linestyles, linewidths = [], [], [], []
+
+    for contour in contours:
+
+        offsets = contour["offsets"]
+        nRings = len(offsets) - 1
+
+        rings += np.split(contour["vertices"], offsets[1:-1])[:nRings]
+        edgecolors += [contour.get("edgecolor", "r")] * nRings
+        linestyles += [contour.get("linestyle", "-")] * nRings
+        linewidths += [contour.get("linewidth", 0.8)] * nRings
+
+    collectionParams = {"closed" : True, "facecolors" : "none", "edgecolors" : edgecolors,
+                        "linestyles" : linestyles or "-", "linewidths" : linewidths,
+                        "zorder" : zorder}
+
+    if transform is not None:
+        collectionParams["transform"] = transform
+
+    return PolyCollection(rings, **collectionParams)
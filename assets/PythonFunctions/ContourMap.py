@@ -9,83 +9,117 @@ Created on Tue Sep 20 11:25:49 2022
 import os
 import sys
 import numpy as np
-import pandas as pd
 import cartopy.crs as ccrs
+import matplotlib
 import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
 
 
-from MapFeatures import globalFeatures, gridLabels_inside
+from MapFeatures import plateContour_feature
+from BaseMapCache import basemap_figure, save_basemap_figure
+from RenderQuality import render_tier, tier_figpath
+from ContourIO import load_contours, contour_collection
+from RenderProfile import start_profile, profile_stage, finish_profile
+from FigureEncoding import compression_level
 
 
-# Cmd inputs
-contourLabel = sys.argv[1]
-plateAccronym = sys.argv[2]
-modelStages = sys.argv[3]
-MTX_w2M_Dir = sys.argv[4]
-dM_PDD_Dir = sys.argv[5]
 
+def main(args, quality=None, profile=None, bbox=None):
+    """
+    Plots the 20% and 68% confidence contours of the torque-variation poles.
 
-# Load confidence contours
-cntr20_fileName = "CNTR20%s.txt" %contourLabel
-cntr68_fileName = "CNTR68%s.txt" %contourLabel
+    Parameters
+    ----------
+    args : list
+        Cmd inputs: contour label, plate label, model stages, DIR_MTX_w2M
+        and DIR_dM_PPD.
+    quality : string, optional
+        Render tier, "final" or "draft" (see RenderQuality). The default is
+        None (MYRIAM_QUALITY environment variable, else "final").
+    profile : string, optional
+        Per-stage instrumentation, "off", "time" or "memory" (see
+        RenderProfile). The default is None (MYRIAM_PROFILE environment
+        variable, else "off").
+    bbox : string, optional
+        Fixed crop "x0,y0,x1,y1" in inches, used instead of the tight
+        bounding box when the layout is known. The default is None.
 
-cntr20_path = os.path.join(dM_PDD_Dir, cntr20_fileName)
-cntr68_path = os.path.join(dM_PDD_Dir, cntr68_fileName)
+    Returns
+    -------
+    list
+        Path to the saved figure.
 
-try:
-    cntr20 = pd.read_csv(cntr20_path, delimiter=' ', header=None)
-except pd.errors.EmptyDataError:
-    cntr20 = pd.DataFrame()
+    """
 
-try:
-    cntr68 = pd.read_csv(cntr68_path, delimiter=' ', header=None)
-except pd.errors.EmptyDataError:
-    cntr68 = pd.DataFrame()
+    tier = render_tier(quality)
+    profiler = start_profile("ContourMap", args, profile)
 
+    # Cmd inputs
+    contourLabel = args[0]
+    plateAccronym = args[1]
+    modelStages = args[2]
+    MTX_w2M_Dir = args[3]
+    dM_PDD_Dir = args[4]
 
-# Plate contour path
-contourName = "BDR_%s_%s.txt" %(plateAccronym, modelStages)
-contourPath = os.path.join(MTX_w2M_Dir, contourName)
 
+    # Load confidence contours
+    cntr20_fileName = "CNTR20%s.txt" %contourLabel
+    cntr68_fileName = "CNTR68%s.txt" %contourLabel
 
-# Set Figure
-fig = plt.figure(constrained_layout=True, figsize=(9,9), dpi=360 )    
-ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    cntr20_path = os.path.join(dM_PDD_Dir, cntr20_fileName)
+    cntr68_path = os.path.join(dM_PDD_Dir, cntr68_fileName)
 
+    with profile_stage("load_contours"):
+        cntr20_vertices, cntr20_offsets = load_contours(cntr20_path)
+        cntr68_vertices, cntr68_offsets = load_contours(cntr68_path)
 
-# Plot plate and continent contours
-globalFeatures(ax, contourPath, plotGridLines=False)
 
+    # Plate contour path
+    contourName = "BDR_%s_%s.txt" %(plateAccronym, modelStages)
+    contourPath = os.path.join(MTX_w2M_Dir, contourName)
 
-# Plot grid lines
-xLinspace = np.arange(-180, 181, 20)[1:-1]
-yLinspace = np.arange(-90, 91, 15)[1:-1]
-gridLabels_inside(ax, xLinspace, yLinspace)
 
+    # Set Figure over the cached base map (continent contours, plate boundaries and grid lines)
+    xLinspace = np.arange(-180, 181, 20)[1:-1]
+    yLinspace = np.arange(-90, 91, 15)[1:-1]
+    with profile_stage("basemap_figure"):
+        fig, ax = basemap_figure(xLinspace, yLinspace, figsize=(9,9), dpi=tier["dpi"],
+                                 simplify=tier["simplify"])
 
-# Figure title
-plt.title('Torque-variation pole distribution (20% and 68%)', fontsize=13, pad=10)
 
+    # Plot plate contour
+    with profile_stage("plateContour_feature"):
+        plateContour_feature(ax, contourPath, edgecolor = '0.7', lw=1.7)
 
-# Plot Ellipse Contour    
-for contour, lwidth, lstyle in zip([cntr20, cntr68], [1.2, 0.8], [":", "-"]):
-    
-    if not contour.empty:
 
-        # Split Dataframes where nan rows appear (when multiple contours are stacked)
-        contour["cntrNr"] = contour.isnull().all(axis=1).cumsum()
+    # Figure title
+    plt.title('Torque-variation pole distribution (20% and 68%)', fontsize=13, pad=10)
 
-        for n, rows in contour.groupby("cntrNr").groups.items():
 
-            indCntr = contour.iloc[rows].drop(columns="cntrNr", axis=1).dropna()
+    # Plot Ellipse Contour (all rings of both levels as one collection)
+    contours = [
+        {"vertices" : cntr20_vertices, "offsets" : cntr20_offsets,
+         "edgecolor" : 'r', "linestyle" : ":", "linewidth" : 1.2},
+        {"vertices" : cntr68_vertices, "offsets" : cntr68_offsets,
+         "edgecolor" : 'r', "linestyle" : "-", "linewidth" : 0.8},
+        ]
 
-            poly = mpatches.Polygon(indCntr, closed=True, ec='r', fill=False, ls=lstyle,
-                                    lw=lwidth, fc=None, transform=ccrs.PlateCarree(), zorder=9)
-            ax.add_patch(poly)
+    with profile_stage("contour_collection"):
+        ax.add_collection(contour_collection(contours, transform=ccrs.PlateCarree(), zorder=9))
 
 
-# Save figure as png
-figName = "MAP_CNTR20c68%s.png" %contourLabel
-figpath = os.path.join(dM_PDD_Dir, figName)       
-plt.savefig(figpath, bbox_inches='tight', dpi=360)
\ No newline at end of file
+    # Save figure as png
+    figName = "MAP_CNTR20c68%s.png" %contourLabel
+    figpath = tier_figpath(os.path.join(dM_PDD_Dir, figName), tier)
+    with profile_stage("save_basemap_figure"):
+        save_basemap_figure(fig, figpath, bbox=bbox, compression=compression_level(tier))
+    plt.close(fig)
+
+    finish_profile(profiler, [figpath])
+
+    return [figpath]
+
+
+
+if __name__ == "__main__":
+    matplotlib.use("Agg")
+    main(sys.argv[1:6], **dict(arg.split("=", 1) for arg in sys.argv[6:]))
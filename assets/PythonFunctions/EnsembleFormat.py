@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import re
+import sys
+import json
+import struct
+import numpy as np
+
+
+# Contains
+# 1. is_binary_ensemble
+# 2. write_ensemble
+# 3. write_ensemble_chunks
+# 4. open_ensemble
+# 5. load_ensemble
+# 6. ensemble_chunks
+# 7. find_ensemble
+# 8. text_to_binary
+# 9. binary_to_text
+
+
+# Binary ensemble layout:
+#   MAGIC (8 bytes) | header length (uint32, little-endian) | JSON header |
+#   space padding up to DATA_OFFSET | contiguous C-order data
+# The JSON header holds "shape", "dtype", "units", "columns" and
+# "coordinates" ("cartesian" or "spherical").
+MAGIC = b"MYRENS01"
+DATA_OFFSET = 512
+BINARY_EXTENSION = ".ens"
+
+
+
+def _pack_header(header):
+
+    payload = json.dumps(header).encode("utf-8")
+    if len(MAGIC) + 4 + len(payload) > DATA_OFFSET:
+        raise ValueError("Ensemble header too long (%d bytes)." %len(payload))
+
+    block = MAGIC + struct.pack("<I", len(payload)) + payload
+
+    return block + b" " * (DATA_OFFSET - len(block))
+
+
+
+def _read_header(path):
+
+    with open(path, "rb") as datafile_id:
+        block = datafile_id.read(DATA_OFFSET)
+
+    if block[:len(MAGIC)] != MAGIC:
+        raise ValueError("%s is not a binary MYRIAM ensemble." %path)
+
+    length = struct.unpack("<I", block[len(MAGIC):len(MAGIC)+4])[0]
+
+    return json.loads(block[len(MAGIC)+4:len(MAGIC)+4+length].decode("utf-8"))
+
+
+
+def _parse_text_header(line, nColumns):
+    """
+    Reads column names and units from a '!x(deg/Myr) y(deg/Myr) ...' line.
+    """
+
+    columns, units = [], []
+    for item in line.lstrip("!").split():
+        match = re.match(r"([^(]+)(?:\((.*)\))?", item)
+        columns.append(match.group(1))
+        units.append(match.group(2) or "")
+
+    if len(columns) != nColumns:
+        columns = ["x", "y", "z"] if nColumns == 3 else ["c%d" %i for i in range(nColumns)]
+        units = [""]
+
+    coordinates = "spherical" if columns[:2] in (["lon", "lat"], ["lat", "lon"]) else "cartesian"
+    units = units[0] if len(set(units)) == 1 else ",".join(units)
+
+    return columns, units, coordinates
+
+
+
+def is_binary_ensemble(path):
+
+    with open(path, "rb") as datafile_id:
+        return datafile_id.read(len(MAGIC)) == MAGIC
+
+
+
+def write_ensemble(path, data, units="", coordinates="cartesian", columns=None):
+    """
+    Saves an ensemble in the binary format.
+
+    Parameters
+    ----------
+    path : string
+        Path to the output file (by convention with the .ens extension).
+    data : array
+        Two-dimensional array, one ensemble member per row.
+    units : string, optional
+        Units of the values, e.g. "deg/Myr" or "N*m". The default is "".
+    coordinates : string, optional
+        "cartesian" or "spherical". The default is "cartesian".
+    columns : list, optional
+        Column names. The default is None (x, y, z for three columns).
+
+    Returns
+    -------
+    None.
+
+    """
+
+    data = np.ascontiguousarray(data)
+    if data.ndim != 2:
+        raise ValueError("Input data must be a two-dimensional array.")
+
+    if columns is None:
+        columns = ["x", "y", "z"][:data.shape[1]]
+
+    header = {"shape" : list(data.shape), "dtype" : data.dtype.newbyteorder("<").str,
+              "units" : units, "columns" : list(columns), "coordinates" : coordinates}
+
+    with open(path, "wb") as datafile_id:
+        datafile_id.write(_pack_header(header))
+        datafile_id.write(data.astype(header["dtype"], copy=False).tobytes())
+
+
+
+def _text_header(columns, units):
+
+    if "," in units:
+        units = units.split(",")
+    else:
+        units = [units] * len(columns)
+
+    return " ".join("%s(%s)" %(column, unit) if unit else column
+                    for column, unit in zip(columns, units))
+
+
+
+def write_ensemble_chunks(path, chunks, units="", coordinates="cartesian", columns=None,
+                          fmt="%1.5e", textHeader=True, dtype=np.float64):
+    """
+    Saves an ensemble given as a sequence of row blocks, so the whole
+    ensemble is never held in memory. Paths with the .ens extension are
+    written in the binary format, any other path in the text layout.
+
+    Parameters
+    ----------
+    path : string
+        Path to the output file.
+    chunks : iterable
+        Two-dimensional arrays with the same number of columns.
+    units, coordinates, columns : optional
+        As in write_ensemble.
+    fmt : string, optional
+        numpy.savetxt format of the text layout. The default is "%1.5e".
+    textHeader : bool, optional
+        Start the text layout with a '!' line holding the column names and
+        units. The default is True.
+    dtype : numpy dtype, optional
+        Stored data type of the binary format. The default is float64.
+
+    Returns
+    -------
+    int
+        Number of rows written.
+
+    """
+
+    binary = path.lower().endswith(BINARY_EXTENSION)
+    dtype = np.dtype(dtype).newbyteorder("<")
+    nRows, nColumns = 0, None
+
+    with open(path, "wb" if binary else "w") as datafile_id:
+
+        if binary:
+            datafile_id.write(b" " * DATA_OFFSET)
+
+        for chunk in chunks:
+            chunk = np.asarray(chunk).reshape(len(chunk), -1)
+
+            if nColumns is None:
+                nColumns = chunk.shape[1]
+                if columns is None:
+                    columns = ["x", "y", "z"][:nColumns] if nColumns <= 3 else \
+                              ["c%d" %i for i in range(nColumns)]
+                if not binary and textHeader:
+                    datafile_id.write("!" + _text_header(columns, units) + "\n")
+
+            elif chunk.shape[1] != nColumns:
+                raise ValueError("All chunks must have the same number of columns.")
+
+            if binary:
+                datafile_id.write(np.ascontiguousarray(chunk, dtype=dtype).tobytes())
+            else:
+                np.savetxt(datafile_id, chunk, fmt=fmt)
+
+            nRows += len(chunk)
+
+        if binary:
+            header = {"shape" : [nRows, nColumns or 0], "dtype" : dtype.str, "units" : units,
+                      "columns" : list(columns or []), "coordinates" : coordinates}
+
+            datafile_id.seek(0)
+            datafile_id.write(_pack_header(header))
+
+    return nRows
+
+
+
+def open_ensemble(path, mode="r"):
+    """
+    Memory-maps a binary ensemble. Only the pages actually accessed are read
+    from disk.
+
+    Parameters
+    ----------
+    path : string
+        Path to a binary ensemble file.
+    mode : string, optional
+        numpy.memmap mode ("r" read-only, "r+" read-write). The default is "r".
+
+    Returns
+    -------
+    data : numpy.memmap
+        Ensemble values, one member per row.
+    header : dict
+        Ensemble header (shape, dtype, units, columns, coordinates).
+
+    """
+
+    header = _read_header(path)
+
+    if header["shape"][0] == 0:
+        data = np.empty(header["shape"], dtype=header["dtype"])
+    else:
+        data = np.memmap(path, dtype=header["dtype"], mode=mode,
+                         offset=DATA_OFFSET, shape=tuple(header["shape"]))
+
+    return data, header
+
+
+
+def load_ensemble(path):
+    """
+    Loads an ensemble stored either in the binary format (memory-mapped) or
+    in the whitespace-delimited text layout (optionally preceded by a '!'
+    header line with column names and units).
+
+    Parameters
+    ----------
+    path : string
+        Path to an ensemble file.
+
+    Returns
+    -------
+    data : array
+        Ensemble values, one member per row.
+    header : dict
+        Ensemble header (shape, dtype, units, columns, coordinates).
+
+    """
+
+    if is_binary_ensemble(path):
+        return open_ensemble(path)
+
+    with open(path, "r") as datafile_id:
+        firstLine = datafile_id.readline()
+
+    data = np.loadtxt(path, dtype=np.float64, comments="!", ndmin=2)
+
+    textHeader = firstLine if firstLine.startswith("!") else ""
+    columns, units, coordinates = _parse_text_header(textHeader, data.shape[1])
+
+    header = {"shape" : list(data.shape), "dtype" : data.dtype.str, "units" : units,
+              "columns" : columns, "coordinates" : coordinates}
+
+    return data, header
+
+
+
+def ensemble_chunks(path, chunk_rows=1000000):
+    """
+    Reads an ensemble (binary or text) in blocks of at most chunk_rows rows,
+    so the whole ensemble is never held in memory.
+
+    Parameters
+    ----------
+    path : string
+        Path to an ensemble file.
+    chunk_rows : int, optional
+        Rows per chunk. The default is 1000000.
+
+    Yields
+    ------
+    array
+        Two-dimensional float64 arrays, one ensemble member per row.
+
+    """
+
+    if is_binary_ensemble(path):
+        data = open_ensemble(path)[0]
+
+        for start in range(0, len(data), chunk_rows):
+            yield np.asarray(data[start:start+chunk_rows], dtype=np.float64)
+        return
+
+    import pandas as pd
+
+    try:
+        for chunk in pd.read_csv(path, sep=r"\s+", header=None, comment="!",
+                                 chunksize=chunk_rows):
+            yield chunk.to_numpy(dtype=np.float64)
+    except pd.errors.EmptyDataError:
+        return
+
+
+
+def find_ensemble(folder, stem):
+    """
+    Path to the ensemble named stem in folder, preferring the binary file
+    (stem.ens) over the text file (stem.txt) unless the text file is newer,
+    i.e. it was rewritten after the conversion.
+    """
+
+    binaryPath = os.path.join(folder, stem + BINARY_EXTENSION)
+    textPath = os.path.join(folder, stem + ".txt")
+
+    if not os.path.exists(binaryPath):
+        return textPath
+
+    if os.path.exists(textPath) and os.stat(textPath).st_mtime_ns > os.stat(binaryPath).st_mtime_ns:
+        return textPath     # Stale binary file
+
+    return binaryPath
+
+
+
+def text_to_binary(txt_path, bin_path=None, units=None, coordinates=None,
+                   chunk_rows=1000000, dtype=np.float64):
+    """
+    Converts a text ensemble to the binary format, reading chunk_rows rows at
+    a time so the whole ensemble is never held in memory.
+
+    Parameters
+    ----------
+    txt_path : string
+        Path to the text ensemble.
+    bin_path : string, optional
+        Path to the binary output. The default is txt_path with the .ens
+        extension.
+    units, coordinates : string, optional
+        Override the values read from the text header line.
+    chunk_rows : int, optional
+        Rows per chunk. The default is 1000000.
+    dtype : numpy dtype, optional
+        Stored data type. The default is float64.
+
+    Returns
+    -------
+    string
+        Path to the binary output.
+
+    """
+
+    import pandas as pd
+
+    if bin_path is None:
+        bin_path = os.path.splitext(txt_path)[0] + BINARY_EXTENSION
+
+    with open(txt_path, "r") as datafile_id:
+        firstLine = datafile_id.readline()
+
+    nRows, nColumns = 0, None
+
+    with open(bin_path, "wb") as datafile_id:
+        datafile_id.write(b" " * DATA_OFFSET)
+
+        for chunk in pd.read_csv(txt_path, sep=r"\s+", header=None, comment="!",
+                                 chunksize=chunk_rows):
+            values = np.ascontiguousarray(chunk.to_numpy(dtype=dtype))
+            datafile_id.write(values.astype(np.dtype(dtype).newbyteorder("<"), copy=False).tobytes())
+            nRows += len(values)
+            nColumns = values.shape[1]
+
+        textHeader = firstLine if firstLine.startswith("!") else ""
+        columns, textUnits, textCoordinates = _parse_text_header(textHeader, nColumns or 0)
+
+        header = {"shape" : [nRows, nColumns or 0],
+                  "dtype" : np.dtype(dtype).newbyteorder("<").str,
+                  "units" : textUnits if units is None else units,
+                  "columns" : columns,
+                  "coordinates" : textCoordinates if coordinates is None else coordinates}
+
+        datafile_id.seek(0)
+        datafile_id.write(_pack_header(header))
+
+    return bin_path
+
+
+
+def binary_to_text(bin_path, txt_path=None, fmt="%1.5e", chunk_rows=1000000):
+    """
+    Converts a binary ensemble to the text layout, with a '!' header line
+    holding the column names and units.
+
+    Parameters
+    ----------
+    bin_path : string
+        Path to the binary ensemble.
+    txt_path : string, optional
+        Path to the text output. The default is bin_path with the .txt
+        extension.
+    fmt : string, optional
+        numpy.savetxt format for every value. The default is "%1.5e".
+    chunk_rows : int, optional
+        Rows per chunk. The default is 1000000.
+
+    Returns
+    -------
+    string
+        Path to the text output.
+
+    """
+
+    if txt_path is None:
+        txt_path = os.path.splitext(bin_path)[0] + ".txt"
+
+    data, header = open_ensemble(bin_path)
+    textHeader = _text_header(header["columns"], header["units"])
+
+    with open(txt_path, "w") as datafile_id:
+        datafile_id.write("!" + textHeader + "\n")
+        for start in range(0, len(data), chunk_rows):
+            np.savetxt(datafile_id, data[start:start+chunk_rows], fmt=fmt)
+
+    return txt_path
+
+
+
+if __name__ == "__main__":
+
+    # Cmd inputs: "to-binary" or "to-text", followed by the files to convert
+    action = sys.argv[1]
+
+    for path in sys.argv[2:]:
+        if action == "to-binary":
+            print(text_to_binary(path))
+        elif action == "to-text":
+            print(binary_to_text(path))
+        else:
+            raise ValueError("Unknown action '%s'. Must be 'to-binary' or 'to-text'." %action)
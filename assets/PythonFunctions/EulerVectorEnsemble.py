@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from EnsembleFormat import write_ensemble_chunks
+from SphericalGeometry import sph2cart
+
+
+# Contains
+# 1. load_stage
+# 2. parse_stage
+# 3. correlation_transform
+# 4. ensemble_blocks
+# 5. generate_ensemble
+# 6. stage_to_ensemble
+
+
+# Python counterpart of EulerVector.Generate_Ensemble (src/dep.EulerVector/
+# Generate_Ensemble.cs). A stage line holds:
+#   [1-2] pole longitude and latitude (deg), [3] angular velocity (deg/Myr),
+#   [4-9] covariance C11 C12 C13 C22 C23 C33 (rad^2/Myr^2), [10] ensemble size
+# Lines of 3-4 values (no covariance) use a 5% standard deviation of the
+# angular velocity; without a size, 1000000 members are drawn.
+#
+# Members are drawn in blocks of BLOCK_SIZE, block i from its own random
+# stream (SeedSequence(seed, spawn_key=(i,))), so an ensemble is the same
+# whether its blocks are drawn in one process or spread over several.
+BLOCK_SIZE = 100000
+DEFAULT_SIZE = 1000000
+
+EV_COLUMNS = ["x", "y", "z"]
+EV_UNITS = "deg/Myr"
+
+# Module-level state of each pool process
+_stage = None
+
+
+
+def load_stage(path):
+    """
+    Reads a single-line Euler-vector stage file (e.g. STG_EV_AT_OLD.txt).
+    """
+
+    values = np.loadtxt(path, dtype=np.float64, comments="!", ndmin=2)
+
+    if len(values) != 1:
+        raise ValueError("%s must hold a single stage line (found %d)." %(path, len(values)))
+
+    return values[0]
+
+
+
+def parse_stage(values):
+    """
+    Mean Euler vector, covariance and ensemble size of a stage line.
+
+    Parameters
+    ----------
+    values : array
+        Stage line of 3, 4, 9 or 10 values (see module notes).
+
+    Returns
+    -------
+    dict
+        "mean" (Cartesian, deg/Myr), "cov" (3x3, deg^2/Myr^2) and "size".
+
+    """
+
+    values = np.asarray(values, dtype=np.float64).ravel()
+
+    if len(values) <= 4:
+        covValues = np.array([1, 0, 0, 1, 0, 1]) * (0.05 * values[2] * np.pi / 180)**2
+    elif len(values) >= 9:
+        covValues = values[3:9]
+    else:
+        raise ValueError("Stage lines must hold 3, 4, 9 or 10 values (found %d)." %len(values))
+
+    size = int(values[-1]) if len(values) in (4, 10) else DEFAULT_SIZE
+
+
+    # Pole and angular velocity to Cartesian coordinates
+    mean = sph2cart(values[1], values[0], values[2])
+
+
+    # Covariance from rad^2/Myr^2 to deg^2/Myr^2
+    C11, C12, C13, C22, C23, C33 = covValues * (180 / np.pi)**2
+    cov = np.array([[C11, C12, C13], [C12, C22, C23], [C13, C23, C33]])
+
+    return {"mean" : mean, "cov" : cov, "size" : size}
+
+
+
+def correlation_transform(cov):
+    """
+    Matrix turning independent standard-normal draws (rows) into draws with
+    covariance cov, as in CorrelatedEnsemble3D: eigenvectors scaled by the
+    square root of the (absolute) eigenvalues.
+    """
+
+    eigenValues, eigenVectors = np.linalg.eigh(cov)
+
+    return (eigenVectors * np.sqrt(np.abs(eigenValues))).T
+
+
+
+def _block_rng(entropy, blockNr):
+
+    return np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(blockNr,)))
+
+
+
+def _draw_block(stage, transform, entropy, blockNr, size):
+
+    # Members of one block
+    nMembers = min(BLOCK_SIZE, size - blockNr * BLOCK_SIZE)
+    draws = _block_rng(entropy, blockNr).standard_normal((nMembers, 3))
+
+    return stage["mean"] + draws @ transform
+
+
+
+def ensemble_blocks(stage, seed, start=0, stop=None):
+    """
+    Draws ensemble members start to stop of a stage, block by block.
+
+    Parameters
+    ----------
+    stage : array or dict
+        Stage line, or its parse_stage dict.
+    seed : int
+        Seed of the ensemble (the same seed always gives the same members).
+    start, stop : int, optional
+        Range of members. The default is the whole ensemble.
+
+    Yields
+    ------
+    array
+        Euler vectors of shape (n, 3), Cartesian, in deg/Myr.
+
+    """
+
+    if not isinstance(stage, dict):
+        stage = parse_stage(stage)
+
+    size = stage["size"]
+    stop = size if stop is None else min(stop, size)
+    transform = correlation_transform(stage["cov"])
+
+    for blockNr in range(start // BLOCK_SIZE, -(-stop // BLOCK_SIZE)):
+        block = _draw_block(stage, transform, seed, blockNr, size)
+
+        first = blockNr * BLOCK_SIZE
+        yield block[max(start - first, 0):stop - first]
+
+
+
+def _init_worker(stage, seed):
+
+    global _stage
+    _stage = (stage, correlation_transform(stage["cov"]), seed)
+
+
+
+def _worker_block(blockNr):
+
+    stage, transform, seed = _stage
+
+    return _draw_block(stage, transform, seed, blockNr, stage["size"])
+
+
+
+def generate_ensemble(stage, seed=None, nWorkers=1):
+    """
+    Samples the Euler-vector ensemble of a stage.
+
+    Parameters
+    ----------
+    stage : array or dict
+        Stage line, or its parse_stage dict.
+    seed : int, optional
+        Seed of the ensemble. The default is None (fresh entropy).
+    nWorkers : int, optional
+        Number of processes drawing blocks. The default is 1; the result
+        does not depend on it.
+
+    Returns
+    -------
+    array
+        Euler vectors of shape (size, 3), Cartesian, in deg/Myr.
+
+    """
+
+    if not isinstance(stage, dict):
+        stage = parse_stage(stage)
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    nBlocks = -(-stage["size"] // BLOCK_SIZE)
+
+    if nWorkers == 1 or nBlocks <= 1:
+        return np.concatenate(list(ensemble_blocks(stage, seed)) or [np.empty((0, 3))])
+
+    nWorkers = min(nWorkers or os.cpu_count() or 1, nBlocks)
+    with ProcessPoolExecutor(max_workers=nWorkers, initializer=_init_worker,
+                             initargs=(stage, seed)) as executor:
+        return np.concatenate(list(executor.map(_worker_block, range(nBlocks))))
+
+
+
+def stage_to_ensemble(stage_path, output_path, seed=None, size=None, fmt="%1.5e"):
+    """
+    Samples the ensemble of a stage file and writes it block by block, in the
+    binary format (.ens) or as an ENS_EV text file, without holding the whole
+    ensemble in memory.
+
+    Parameters
+    ----------
+    stage_path : string
+        Path to a single-line stage file.
+    output_path : string
+        Path to the ensemble file.
+    seed : int, optional
+        Seed of the ensemble. The default is None (fresh entropy).
+    size : int, optional
+        Ensemble size, overriding the one of the stage line.
+    fmt : string, optional
+        Number format of text outputs. The default is "%1.5e".
+
+    Returns
+    -------
+    int
+        Number of members written.
+
+    """
+
+    stage = parse_stage(load_stage(stage_path))
+
+    if size is not None:
+        stage["size"] = int(size)
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    return write_ensemble_chunks(output_path, ensemble_blocks(stage, seed), units=EV_UNITS,
+                                 columns=EV_COLUMNS, fmt=fmt)
+
+
+
+if __name__ == "__main__":
+
+    # Cmd inputs: stage file and output ensemble (.txt or .ens), then
+    # optional seed=<int> and size=<int>
+    options = dict(arg.split("=", 1) for arg in sys.argv[3:])
+
+    print(stage_to_ensemble(sys.argv[1], sys.argv[2],
+                            seed=int(options["seed"]) if "seed" in options else None,
+                            size=int(options["size"]) if "size" in options else None))
@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import io
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib.transforms import Bbox
+from PIL import Image
+
+
+# Contains
+# 1. compression_level
+# 2. parse_bbox
+# 3. bbox_slices
+# 4. figure_rgba
+# 5. encode_image
+# 6. start_encoder
+# 7. stop_encoder
+# 8. save_image
+# 9. take_pending
+# 10. wait_figures
+# 11. wait_encoder
+# 12. save_figure
+
+
+# Figures are rasterized on the drawing thread (Agg canvas, cropped to the
+# tight bounding box instead of the second savefig pass when possible) and the
+# PNG/WebP encoding of the RGBA buffer is handed to an encoder pool, so it
+# overlaps with drawing the next figure. Without a pool (single script runs)
+# figures are encoded inline. Pillow releases the GIL while compressing, so
+# the pool is a thread pool and buffers are never copied between processes.
+
+
+# Compression level: zlib level (0-9) of PNG figures, or effort (0-6) of
+# the lossless WebP figures. Taken from MYRIAM_COMPRESSION when it is set,
+# else from the render tier (see RenderQuality)
+COMPRESSION_ENV = "MYRIAM_COMPRESSION"
+DEFAULT_COMPRESSION = 6
+
+
+# Encoder threads started by start_encoder when not given
+ENCODE_WORKERS_ENV = "MYRIAM_ENCODE_WORKERS"
+DEFAULT_ENCODE_WORKERS = 1
+
+
+# Encoder pool of the process, and figures not yet encoded
+_encoder = None
+_pending = []
+
+
+
+def compression_level(tier=None):
+    """
+    Compression level of the saved figures.
+
+    Parameters
+    ----------
+    tier : dict, optional
+        Render tier, as returned by render_tier. The default is None.
+
+    Returns
+    -------
+    int
+        MYRIAM_COMPRESSION when it is set, else tier["compression"], else
+        DEFAULT_COMPRESSION.
+
+    """
+
+    level = os.environ.get(COMPRESSION_ENV)
+
+    if level is None:
+        level = (tier or {}).get("compression", DEFAULT_COMPRESSION)
+
+    level = int(level)
+    if not 0 <= level <= 9:
+        raise ValueError("Compression level must be between 0 and 9, %d given." %level)
+
+    return level
+
+
+
+def parse_bbox(bbox):
+    """
+    Fixed crop of a figure, in inches.
+
+    Parameters
+    ----------
+    bbox : Bbox, tuple, string or None
+        Bbox, (x0, y0, x1, y1) extents or "x0,y0,x1,y1" string.
+
+    Returns
+    -------
+    matplotlib.transforms.Bbox or None
+
+    """
+
+    if bbox is None or isinstance(bbox, Bbox):
+        return bbox
+
+    if isinstance(bbox, str):
+        bbox = [float(value) for value in bbox.split(",")]
+
+    return Bbox.from_extents(*bbox)
+
+
+
+def bbox_slices(bbox, dpi, nRows, nCols):
+    """
+    Rows and columns of a canvas inside a bounding box (rows run top to
+    bottom), clipped to the canvas.
+
+    Parameters
+    ----------
+    bbox : matplotlib.transforms.Bbox
+        Bounding box in inches.
+    dpi : float
+        Canvas resolution.
+    nRows, nCols : int
+        Canvas size in pixels.
+
+    Returns
+    -------
+    tuple
+        Row and column slices.
+
+    """
+
+    c0, c1 = max(int(round(bbox.x0 * dpi)), 0), min(int(round(bbox.x1 * dpi)), nCols)
+    r0, r1 = max(nRows - int(round(bbox.y1 * dpi)), 0), min(nRows - int(round(bbox.y0 * dpi)), nRows)
+
+    return slice(r0, r1), slice(c0, c1)
+
+
+
+def figure_rgba(fig, bbox=None, pad_inches=0.1):
+    """
+    Draws a figure on its Agg canvas and returns the RGBA buffer cropped to
+    a bounding box. When the box lies within the canvas, this replaces the
+    second rendering pass of savefig(..., bbox_inches='tight') with a crop;
+    otherwise (e.g. labels outside the figure) the figure is rendered again
+    over the box, as savefig does.
+
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+        Figure to rasterize (at fig.dpi).
+    bbox : Bbox, tuple or string, optional
+        Fixed crop in inches (see parse_bbox), used as given when the layout
+        is known. The default is None (tight bounding box of the figure,
+        padded by pad_inches).
+    pad_inches : float, optional
+        Padding around the tight bounding box. The default is 0.1.
+
+    Returns
+    -------
+    image : array
+        RGBA canvas (uint8), first row at the top.
+    bbox : matplotlib.transforms.Bbox
+        Crop used, in inches (reusable as a fixed crop).
+
+    """
+
+    fig.canvas.draw()
+
+    bbox = parse_bbox(bbox)
+    if bbox is None:
+        bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(pad_inches)
+
+    width, height = fig.get_size_inches()
+
+    if bbox.x0 >= 0 and bbox.y0 >= 0 and bbox.x1 <= width and bbox.y1 <= height:
+        canvas = np.asarray(fig.canvas.buffer_rgba())
+        rows, cols = bbox_slices(bbox, fig.dpi, *canvas.shape[:2])
+        return canvas[rows, cols].copy(), bbox
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="rgba", dpi=fig.dpi, bbox_inches=bbox)
+
+    nCols = int(bbox.width * fig.dpi)
+    image = np.frombuffer(buffer.getbuffer(), dtype=np.uint8).reshape(-1, nCols, 4)
+
+    return image, bbox
+
+
+
+def encode_image(image, figpath, compression=None, dpi=None):
+    """
+    Encodes an RGB(A) buffer as a PNG or lossless WebP file, as given by
+    the extension of figpath.
+
+    Parameters
+    ----------
+    image : array
+        RGB or RGBA canvas (uint8), first row at the top.
+    figpath : string
+        Path to the output .png or .webp file.
+    compression : int, optional
+        Compression level (see compression_level). The default is None
+        (compression_level()).
+    dpi : float, optional
+        Resolution saved in the file metadata. The default is None.
+
+    Returns
+    -------
+    string
+        figpath.
+
+    """
+
+    if compression is None:
+        compression = compression_level()
+
+    extension = os.path.splitext(figpath)[1].lower()
+    options = {} if dpi is None else {"dpi" : (dpi, dpi)}
+
+    if extension == ".png":
+        options.update(compress_level=compression)
+    elif extension == ".webp":
+        options.update(lossless=True, exact=True, method=min(compression, 6))
+    else:
+        raise ValueError("Unsupported figure format '%s'. Must be .png or .webp." %extension)
+
+    Image.fromarray(image).save(figpath, **options)
+
+    return figpath
+
+
+
+def start_encoder(nWorkers=None):
+    """
+    Starts the encoder pool of the process: figures saved afterwards are
+    encoded in the background, and wait_encoder must be called before
+    their files are used.
+
+    Parameters
+    ----------
+    nWorkers : int, optional
+        Encoder threads. The default is None (MYRIAM_ENCODE_WORKERS, else
+        DEFAULT_ENCODE_WORKERS). Zero encodes inline.
+
+    Returns
+    -------
+    None.
+
+    """
+
+    global _encoder
+
+    if nWorkers is None:
+        nWorkers = int(os.environ.get(ENCODE_WORKERS_ENV, DEFAULT_ENCODE_WORKERS))
+
+    stop_encoder()
+
+    if nWorkers > 0:
+        _encoder = ThreadPoolExecutor(max_workers=nWorkers, thread_name_prefix="encoder")
+
+
+
+def stop_encoder():
+    """
+    Waits for the pending figures and shuts the encoder pool down (nothing
+    when it is not running).
+
+    Returns
+    -------
+    None.
+
+    """
+
+    global _encoder
+
+    if _encoder is None:
+        return
+
+    try:
+        wait_encoder()
+    finally:
+        _encoder.shutdown()
+        _encoder = None
+
+
+
+def save_image(image, figpath, compression=None, dpi=None):
+    """
+    Saves an RGB(A) buffer (see encode_image), in the encoder pool when it
+    is running, else inline.
+
+    Returns
+    -------
+    string
+        figpath.
+
+    """
+
+    if _encoder is None:
+        return encode_image(image, figpath, compression, dpi)
+
+    _pending.append(_encoder.submit(encode_image, image, figpath, compression, dpi))
+
+    return figpath
+
+
+
+def take_pending():
+    """
+    Hands over the figures not yet encoded, so they can be waited for later
+    (see wait_figures) while the drawing thread moves on, e.g. to the next
+    job of a worker.
+
+    Returns
+    -------
+    list
+        Futures of the pending figures (empty without a pool).
+
+    """
+
+    futures = list(_pending)
+    _pending.clear()
+
+    return futures
+
+
+
+def wait_figures(futures):
+    """
+    Waits until the figures handed over by take_pending are saved.
+
+    Parameters
+    ----------
+    futures : list
+        Futures returned by take_pending.
+
+    Returns
+    -------
+    list
+        Paths to the saved figures.
+
+    Raises
+    ------
+    Exception
+        The first encoding error, after every figure has finished.
+
+    """
+
+    figpaths, errors = [], []
+    for future in futures:
+        try:
+            figpaths.append(future.result())
+        except Exception as e:
+            errors.append(e)
+
+    if errors:
+        raise errors[0]
+
+    return figpaths
+
+
+
+def wait_encoder():
+    """
+    Waits until every figure handed to the encoder pool is saved (see
+    wait_figures).
+
+    Returns
+    -------
+    list
+        Paths to the saved figures.
+
+    """
+
+    return wait_figures(take_pending())
+
+
+
+def save_figure(fig, figpath, bbox=None, pad_inches=0.1, compression=None):
+    """
+    Saves a figure at fig.dpi, cropped as savefig(..., bbox_inches='tight')
+    would or to a fixed crop, with the encoding done by the encoder pool
+    when it is running.
+
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+        Figure to save.
+    figpath : string
+        Path to the output .png or .webp file.
+    bbox : Bbox, tuple or string, optional
+        Fixed crop in inches (see figure_rgba). The default is None (tight).
+    pad_inches : float, optional
+        Padding around the tight bounding box. The default is 0.1.
+    compression : int, optional
+        Compression level. The default is None (compression_level()).
+
+    Returns
+    -------
+    matplotlib.transforms.Bbox
+        Crop used, in inches, so figures sharing a layout can reuse it.
+
+    """
+
+    image, bbox = figure_rgba(fig, bbox, pad_inches)
+    save_image(image, figpath, compression, fig.dpi)
+
+    return bbox
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import sys
+import hashlib
+import tempfile
+import numpy as np
+from pathlib import Path
+from shapely.geometry import (Polygon, MultiPolygon, LineString, MultiLineString)
+
+
+# Contains
+# 1. cacheFolder
+# 2. load_geometries
+# 3. rebuild_cache
+# 4. invalidate_cache
+# 5. save_cache_file
+
+
+# Main project workspace
+projFolder = Path(__file__).parents[2]
+
+
+# Geometry type codes stored in the cache
+POLYGON, MULTIPOLYGON, LINESTRING, MULTILINESTRING = 0, 1, 2, 3
+
+
+# Geometries already loaded by this process, keyed by (path, mtime)
+_loaded = {}
+
+
+
+def cacheFolder():
+    """
+    Folder holding the on-disk caches. Defaults to assets/Cache, and can be
+    redirected with the MYRIAM_CACHE_DIR environment variable.
+    """
+
+    folder = os.environ.get("MYRIAM_CACHE_DIR",
+                            os.path.join(projFolder, "assets", "Cache"))
+    os.makedirs(folder, exist_ok=True)
+
+    return folder
+
+
+
+def _cache_path(shapefile_path):
+
+    key = hashlib.sha1(os.path.abspath(shapefile_path).encode("utf-8")).hexdigest()[:16]
+    fileName = "GEOM_%s_%s.npz" %(Path(shapefile_path).stem, key)
+
+    return os.path.join(cacheFolder(), fileName)
+
+
+
+def _source_stamp(shapefile_path):
+
+    stat = os.stat(shapefile_path)
+
+    return np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+
+
+def _encode(geometries):
+    """
+    Flattens shapely geometries into a ragged layout: one vertex buffer plus
+    offsets from geometries to parts, from parts to rings and from rings to
+    vertices.
+    """
+
+    coords, ringOffsets, partOffsets, geomOffsets, geomTypes = [], [0], [0], [0], []
+
+    for geom in geometries:
+
+        if isinstance(geom, Polygon):
+            geomTypes.append(POLYGON)
+            parts = [geom]
+        elif isinstance(geom, MultiPolygon):
+            geomTypes.append(MULTIPOLYGON)
+            parts = list(geom.geoms)
+        elif isinstance(geom, LineString):
+            geomTypes.append(LINESTRING)
+            parts = [geom]
+        elif isinstance(geom, MultiLineString):
+            geomTypes.append(MULTILINESTRING)
+            parts = list(geom.geoms)
+        else:
+            raise TypeError("Not implemented shapely datatype: %s." %geom.geom_type)
+
+        for part in parts:
+            if isinstance(part, Polygon):
+                rings = [part.exterior] + list(part.interiors)
+            else:
+                rings = [part]
+
+            for ring in rings:
+                ringCoords = np.asarray(ring.coords, dtype=np.float64)[:, :2]
+                coords.append(ringCoords)
+                ringOffsets.append(ringOffsets[-1] + len(ringCoords))
+
+            partOffsets.append(partOffsets[-1] + len(rings))
+
+        geomOffsets.append(geomOffsets[-1] + len(parts))
+
+
+    return dict(
+        coords = np.vstack(coords) if coords else np.empty((0, 2)),
+        ring_offsets = np.array(ringOffsets, dtype=np.int64),
+        part_offsets = np.array(partOffsets, dtype=np.int64),
+        geom_offsets = np.array(geomOffsets, dtype=np.int64),
+        geom_types = np.array(geomTypes, dtype=np.int8),
+        )
+
+
+
+def _decode(arrays):
+    """
+    Rebuilds shapely geometries from the ragged layout written by _encode.
+    """
+
+    coords = arrays["coords"]
+    ringOffsets = arrays["ring_offsets"]
+    partOffsets = arrays["part_offsets"]
+    geomOffsets = arrays["geom_offsets"]
+
+    rings = [coords[ringOffsets[i]:ringOffsets[i+1]] for i in range(len(ringOffsets)-1)]
+    geometries = []
+
+    for g, geomType in enumerate(arrays["geom_types"]):
+
+        parts = []
+        for p in range(geomOffsets[g], geomOffsets[g+1]):
+            partRings = rings[partOffsets[p]:partOffsets[p+1]]
+
+            if geomType in (POLYGON, MULTIPOLYGON):
+                parts.append(Polygon(partRings[0], partRings[1:]))
+            else:
+                parts.append(LineString(partRings[0]))
+
+        if geomType == MULTIPOLYGON:
+            geometries.append(MultiPolygon(parts))
+        elif geomType == MULTILINESTRING:
+            geometries.append(MultiLineString(parts))
+        else:
+            geometries.append(parts[0])
+
+
+    return geometries
+
+
+
+def rebuild_cache(shapefile_path):
+    """
+    Parses a shapefile and (re)writes its geometry cache, regardless of the
+    state of any existing cache file.
+
+    Parameters
+    ----------
+    shapefile_path : string
+        Path to a .SHP file.
+
+    Returns
+    -------
+    list
+        Shapely geometries of the shapefile, in record order.
+
+    """
+
+    from cartopy.io.shapereader import Reader
+
+    stamp = _source_stamp(shapefile_path)
+    geometries = list(Reader(shapefile_path).geometries())
+
+    save_cache_file(_cache_path(shapefile_path), stamp=stamp, **_encode(geometries))
+
+    _loaded[os.path.abspath(shapefile_path)] = (tuple(stamp), geometries)
+
+    return geometries
+
+
+
+def invalidate_cache(shapefile_path=None):
+    """
+    Deletes the geometry cache of a shapefile, or every geometry cache when no
+    path is given. The next load_geometries call parses the shapefile again.
+
+    Parameters
+    ----------
+    shapefile_path : string, optional
+        Path to a .SHP file. The default is None (all shapefiles).
+
+    Returns
+    -------
+    None.
+
+    """
+
+    if shapefile_path is None:
+        _loaded.clear()
+        for fileName in os.listdir(cacheFolder()):
+            if fileName.startswith("GEOM_") and fileName.endswith(".npz"):
+                os.remove(os.path.join(cacheFolder(), fileName))
+
+    else:
+        _loaded.pop(os.path.abspath(shapefile_path), None)
+        cachePath = _cache_path(shapefile_path)
+        if os.path.exists(cachePath):
+            os.remove(cachePath)
+
+
+
+def save_cache_file(cachePath, **arrays):
+    """
+    Writes arrays to an .npz cache file. Every writer saves to its own
+    temporary file in the cache folder and moves it into place, so
+    processes building the same cache concurrently never share a partial
+    file; when another writer wins the move, its file is kept.
+
+    Parameters
+    ----------
+    cachePath : string
+        Path to the .npz cache file.
+    **arrays : array
+        Arrays to save, keyed by name.
+
+    Returns
+    -------
+    bool
+        True when this file was moved into place, False when the cache file
+        of another writer was kept instead.
+
+    """
+
+    folder, fileName = os.path.split(cachePath)
+    fd, tmpPath = tempfile.mkstemp(dir=folder, prefix=fileName + ".", suffix=".tmp")
+
+    try:
+        with os.fdopen(fd, "wb") as datafile_id:
+            np.savez(datafile_id, **arrays)
+        os.replace(tmpPath, cachePath)
+
+    except OSError:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+        # Lost the race (e.g. the file is open by its writer on Windows)
+        if os.path.exists(cachePath):
+            return False
+        raise
+
+    return True
+
+
+
+def load_geometries(shapefile_path):
+    """
+    Returns the geometries of a shapefile, reading them from the geometry
+    cache when it matches the shapefile's modification time and size, and
+    rebuilding the cache otherwise. Geometries are also kept in memory for
+    the lifetime of the process.
+
+    Parameters
+    ----------
+    shapefile_path : string
+        Path to a .SHP file.
+
+    Returns
+    -------
+    list
+        Shapely geometries of the shapefile, in record order.
+
+    """
+
+    absPath = os.path.abspath(shapefile_path)
+    stamp = _source_stamp(shapefile_path)
+
+    if absPath in _loaded and _loaded[absPath][0] == tuple(stamp):
+        return _loaded[absPath][1]
+
+    cachePath = _cache_path(shapefile_path)
+
+    if os.path.exists(cachePath):
+        try:
+            with np.load(cachePath) as arrays:
+                if np.array_equal(arrays["stamp"], stamp):
+                    geometries = _decode(arrays)
+                    _loaded[absPath] = (tuple(stamp), geometries)
+                    return geometries
+
+        except (OSError, ValueError, KeyError):
+            pass    # Unreadable cache, rebuilt below
+
+
+    return rebuild_cache(shapefile_path)
+
+
+
+if __name__ == "__main__":
+
+    # Cmd inputs: "rebuild" or "invalidate", followed by optional shapefile paths
+    # (defaults to every shapefile in assets/Shapefiles)
+    action = sys.argv[1]
+    paths = sys.argv[2:] or [str(path) for path in
+                             sorted(Path(projFolder, "assets", "Shapefiles").glob("*.shp"))]
+
+    for path in paths:
+        if action == "rebuild":
+            rebuild_cache(path)
+        elif action == "invalidate":
+            invalidate_cache(path)
+        else:
+            raise ValueError("Unknown action '%s'. Must be 'rebuild' or 'invalidate'." %action)
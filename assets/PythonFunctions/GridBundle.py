@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import sys
+import json
+import struct
+import numpy as np
+
+
+# Contains
+# 1. bundle_path
+# 2. grid_geometry
+# 3. grid_coordinates
+# 4. write_bundle
+# 5. open_bundle
+# 6. text_to_bundle
+# 7. load_grids
+
+
+# Grid bundle layout (GRID_<model>.grd):
+#   MAGIC (8 bytes) | header length (uint32, little-endian) | JSON header |
+#   space padding up to DATA_OFFSET | layers, each aligned to LAYER_ALIGN bytes
+# The JSON header holds the grid "shape" (nLat, nLon), the "geometry" and,
+# for every layer, its "dtype" and byte "offset". Rows run north to south and
+# columns west to east, as in the GRID_*.txt files.
+#
+# Regular grids store their geometry as (lonMin, latMax, lonStep, latStep),
+# so that lon[i,j] = lonMin + j*lonStep and lat[i,j] = latMax - i*latStep,
+# and no LON/LAT layers. Irregular grids keep explicit LON and LAT layers.
+MAGIC = b"MYRGRD01"
+DATA_OFFSET = 4096
+LAYER_ALIGN = 64
+BUNDLE_EXTENSION = ".grd"
+
+# Layers written by MYRIAM for every asthenosphere model (GRID_<layer>_<model>.txt)
+GRID_LAYERS = ["LON", "LAT", "MuA", "YM", "MT"]
+
+
+
+def bundle_path(folder, modelLabel):
+
+    return os.path.join(folder, "GRID_%s%s" %(modelLabel, BUNDLE_EXTENSION))
+
+
+
+def grid_geometry(lon, lat, tol=0.051):
+    """
+    Finds the regular geometry of LON/LAT coordinate grids.
+
+    Parameters
+    ----------
+    lon, lat : array
+        Coordinate grids of shape (nLat, nLon), rows north to south.
+    tol : float, optional
+        Largest allowed deviation from the regular grid, in degrees. The
+        default (0.051) covers the one-decimal rounding of the text files.
+
+    Returns
+    -------
+    dict
+        Geometry with keys "lonMin", "latMax", "lonStep" and "latStep", or
+        None if the grids are not regular.
+
+    """
+
+    lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+    nLat, nLon = lon.shape
+
+    lonStep = (lon[0,-1] - lon[0,0]) / max(nLon - 1, 1)
+    latStep = (lat[0,0] - lat[-1,0]) / max(nLat - 1, 1)
+
+    geometry = {"lonMin" : float(lon[0,0]), "latMax" : float(lat[0,0]),
+                "lonStep" : float(lonStep), "latStep" : float(latStep)}
+
+    regularLon, regularLat = grid_coordinates(geometry, lon.shape)
+
+    if np.abs(regularLon - lon).max() > tol or np.abs(regularLat - lat).max() > tol:
+        return None
+
+    return geometry
+
+
+
+def grid_coordinates(geometry, shape):
+    """
+    Builds the LON/LAT coordinate grids of a regular geometry.
+
+    Parameters
+    ----------
+    geometry : dict
+        Grid geometry, as returned by grid_geometry.
+    shape : tuple
+        Grid shape (nLat, nLon).
+
+    Returns
+    -------
+    lon, lat : array
+        Read-only coordinate grids of shape (nLat, nLon), rows north to south
+        (broadcast views of the coordinate vectors, no full matrices).
+
+    """
+
+    nLat, nLon = shape
+
+    lonVector = geometry["lonMin"] + geometry["lonStep"] * np.arange(nLon)
+    latVector = geometry["latMax"] - geometry["latStep"] * np.arange(nLat)
+
+    return (np.broadcast_to(lonVector[np.newaxis,:], shape),
+            np.broadcast_to(latVector[:,np.newaxis], shape))
+
+
+
+def write_bundle(path, layers, geometry=None):
+    """
+    Saves named grid layers in a single bundle file.
+
+    Parameters
+    ----------
+    path : string
+        Path to the output file (by convention GRID_<model>.grd).
+    layers : dict
+        Two-dimensional arrays of the same shape, keyed by layer name.
+    geometry : dict, optional
+        Regular grid geometry, as returned by grid_geometry. The default is
+        None, in which case layers must include "LON" and "LAT".
+
+    Returns
+    -------
+    None.
+
+    """
+
+    layers = {name : np.ascontiguousarray(values) for name, values in layers.items()}
+    shapes = set(values.shape for values in layers.values())
+
+    if len(shapes) != 1 or len(next(iter(shapes))) != 2:
+        raise ValueError("All layers must be two-dimensional arrays of the same shape.")
+
+    if geometry is None and not {"LON", "LAT"} <= set(layers):
+        raise ValueError("Irregular grids must include the LON and LAT layers.")
+
+
+    # Layer offsets
+    header = {"shape" : list(next(iter(shapes))), "geometry" : geometry, "layers" : {}}
+    offset = DATA_OFFSET
+
+    for name, values in layers.items():
+        dtype = values.dtype.newbyteorder("<")
+        header["layers"][name] = {"dtype" : dtype.str, "offset" : offset}
+        offset += -(-values.nbytes // LAYER_ALIGN) * LAYER_ALIGN
+
+
+    # Header block
+    payload = json.dumps(header).encode("utf-8")
+    if len(MAGIC) + 4 + len(payload) > DATA_OFFSET:
+        raise ValueError("Grid bundle header too long (%d bytes)." %len(payload))
+
+    block = MAGIC + struct.pack("<I", len(payload)) + payload
+
+
+    # Write file
+    with open(path, "wb") as datafile_id:
+        datafile_id.write(block + b" " * (DATA_OFFSET - len(block)))
+
+        for name, values in layers.items():
+            datafile_id.seek(header["layers"][name]["offset"])
+            datafile_id.write(values.astype(header["layers"][name]["dtype"], copy=False).tobytes())
+
+
+
+def open_bundle(path):
+    """
+    Memory-maps every layer of a grid bundle.
+
+    Parameters
+    ----------
+    path : string
+        Path to a grid bundle.
+
+    Returns
+    -------
+    layers : dict
+        Read-only numpy.memmap arrays of shape (nLat, nLon), keyed by layer
+        name. "LON" and "LAT" are always present (computed from the geometry
+        for regular grids).
+    header : dict
+        Bundle header (shape, geometry, layers).
+
+    """
+
+    with open(path, "rb") as datafile_id:
+        block = datafile_id.read(DATA_OFFSET)
+
+    if block[:len(MAGIC)] != MAGIC:
+        raise ValueError("%s is not a MYRIAM grid bundle." %path)
+
+    length = struct.unpack("<I", block[len(MAGIC):len(MAGIC)+4])[0]
+    header = json.loads(block[len(MAGIC)+4:len(MAGIC)+4+length].decode("utf-8"))
+    shape = tuple(header["shape"])
+
+    layers = {name : np.memmap(path, dtype=layer["dtype"], mode="r",
+                               offset=layer["offset"], shape=shape)
+              for name, layer in header["layers"].items()}
+
+    if header["geometry"] is not None:
+        layers["LON"], layers["LAT"] = grid_coordinates(header["geometry"], shape)
+
+    return layers, header
+
+
+
+def text_to_bundle(folder, modelLabel, path=None, dtype=np.float64):
+    """
+    Converts the GRID_<layer>_<model>.txt files of a model into a grid bundle.
+
+    Parameters
+    ----------
+    folder : string
+        Folder with the text grids (DIR_MTX_w2M).
+    modelLabel : string
+        Model label used in the file names.
+    path : string, optional
+        Path to the output bundle. The default is GRID_<model>.grd in folder.
+    dtype : numpy dtype, optional
+        Stored data type of the value layers. The default is float64.
+
+    Returns
+    -------
+    string
+        Path to the grid bundle.
+
+    """
+
+    import pandas as pd
+
+    if path is None:
+        path = bundle_path(folder, modelLabel)
+
+    layers = {}
+    for name in GRID_LAYERS:
+        layerPath = os.path.join(folder, "GRID_%s_%s.txt" %(name, modelLabel))
+        layers[name] = pd.read_csv(layerPath, sep=r"\s+", header=None).to_numpy(dtype=dtype)
+
+    geometry = grid_geometry(layers["LON"], layers["LAT"])
+
+    if geometry is not None:
+        del layers["LON"], layers["LAT"]
+
+    write_bundle(path, layers, geometry)
+
+    return path
+
+
+
+def _bundle_is_current(path, folder, modelLabel):
+
+    # A bundle older than any of its text layers predates their last rewrite
+    bundleTime = os.stat(path).st_mtime_ns
+
+    for name in GRID_LAYERS:
+        layerPath = os.path.join(folder, "GRID_%s_%s.txt" %(name, modelLabel))
+        if os.path.exists(layerPath) and os.stat(layerPath).st_mtime_ns > bundleTime:
+            return False
+
+    return True
+
+
+
+def load_grids(folder, modelLabel, layers=None):
+    """
+    Loads the grids of a model, from its bundle (GRID_<model>.grd) when it
+    exists and is not older than the GRID_<layer>_<model>.txt files, or
+    else from the text files.
+
+    Parameters
+    ----------
+    folder : string
+        Folder with the grids (DIR_MTX_w2M).
+    modelLabel : string
+        Model label used in the file names.
+    layers : list, optional
+        Value layers to load besides LON and LAT. The default is None (MuA,
+        YM and MT). Bundle layers are memory-mapped, so all of them are
+        returned at no cost.
+
+    Returns
+    -------
+    dict
+        Arrays of shape (nLat, nLon) keyed by layer name, rows north to south.
+
+    """
+
+    path = bundle_path(folder, modelLabel)
+
+    if os.path.exists(path) and _bundle_is_current(path, folder, modelLabel):
+        return open_bundle(path)[0]
+
+    if layers is None:
+        layers = GRID_LAYERS[2:]
+
+    return {name : np.loadtxt(os.path.join(folder, "GRID_%s_%s.txt" %(name, modelLabel)),
+                              dtype=np.float64, ndmin=2)
+            for name in ["LON", "LAT"] + [layer for layer in layers if layer not in ("LON", "LAT")]}
+
+
+
+if __name__ == "__main__":
+
+    # Cmd inputs: DIR_MTX_w2M, followed by the model labels to convert
+    folder = sys.argv[1]
+
+    for modelLabel in sys.argv[2:]:
+        print(text_to_bundle(folder, modelLabel))
@@ -9,242 +9,275 @@ Created on Wed Sep  7 15:26:31 2022
 import os
 import sys
 import numpy as np
-import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib import cm
 from matplotlib import colormaps
 import matplotlib.colors as mcolors
 from mpl_toolkits.axes_grid1 import make_axes_locatable
-from MapFeatures import setCartographic_AxisLabels
+from AxisLabels import setCartographic_AxisLabels
+from GridBundle import load_grids
+from RenderQuality import render_tier, tier_figpath, subsample
+from RenderProfile import start_profile, profile_stage, finish_profile
+from FigureEncoding import compression_level, save_figure
 
 
-# Cmd inputs
-modelLabel = sys.argv[1]
-modelStages = sys.argv[2]
-boundaryLabel = sys.argv[3]
-repositoryDir = sys.argv[4]
 
+def viscosity_cmap():
 
-# Load grids 
-lon_fileName = "GRID_LON_%s.txt" %modelLabel
-lat_fileName = "GRID_LAT_%s.txt" %modelLabel
-muA_fileName = "GRID_MuA_%s.txt" %modelLabel
-ym_fileName = "GRID_YM_%s.txt" %modelLabel
-mt_fileName = "GRID_MT_%s.txt" %modelLabel
+    # Viridis with the transitions between low, mid and high viscosities removed
+    cmap_viridis = cm.viridis(np.linspace(0., 1, 230))
+    cmap_viridis1 = cmap_viridis[:50]
+    cmap_viridis2 = cmap_viridis[90:140]
+    cmap_viridis3 = cmap_viridis[180:]
 
+    colors = np.vstack((cmap_viridis1, cmap_viridis2, cmap_viridis3))
 
-lon_path = os.path.join(repositoryDir, lon_fileName)
-lat_path = os.path.join(repositoryDir, lat_fileName)
-muA_path = os.path.join(repositoryDir, muA_fileName)
-ym_path = os.path.join(repositoryDir, ym_fileName)
-mt_path = os.path.join(repositoryDir, mt_fileName)
+    return mcolors.LinearSegmentedColormap.from_list('muA_cmap', colors)
 
 
-lon = pd.read_csv(lon_path, delimiter=' ', header=None)
-lat = pd.read_csv(lat_path, delimiter=' ', header=None)
-muA = pd.read_csv(muA_path, delimiter=' ', header=None)
-ym = pd.read_csv(ym_path, delimiter=' ', header=None)
-mt = pd.read_csv(mt_path, delimiter=' ', header=None)
 
+def youngModulus_cmap():
 
-# Load plate contour
-contourName = "BDR_%s_%s.txt" %(boundaryLabel, modelStages)
-contourPath = os.path.join(repositoryDir, contourName)
-contourXY = pd.read_csv(contourPath, delimiter=' ', names=["lon", "lat"])
+    cool = colormaps["cool"]
+    colors = cool(np.linspace(0, 1, 256))
 
-cntr_yMin, cntr_yMax = np.min(contourXY["lat"]), np.max(contourXY["lat"])
-cntr_xMin, cntr_xMax = np.min(contourXY["lon"]), np.max(contourXY["lon"])
-cntr_xExtent = cntr_xMax - cntr_xMin
-cntr_yExtent = cntr_yMax - cntr_yMin
+    return mcolors.LinearSegmentedColormap.from_list('ym_cmap', colors)
 
 
-# Load inContour points
-inContourName = "BDRin_%s_%s.txt" %(boundaryLabel, modelStages)
-inContourPath = os.path.join(repositoryDir, inContourName)
-inContourXYz = pd.read_csv(inContourPath, delimiter=' ', names=["lon", "lat", "z"])
 
+def maxwellTime_cmap():
 
+    jet = colormaps["jet"]
+    colors = jet(np.linspace(1, 0., 100))
 
-# --- General setups
+    return mcolors.LinearSegmentedColormap.from_list('mxw_cmap', colors)
 
-# Set Z extent
-extent = lon[0][0] - 1, lon.iloc[-1].iloc[-1] + 1, lat[0].iloc[-1] - 1, lat[0][0] + 1
 
-# Create grid colormap
-scale_greys = cm.Greys_r(np.linspace(1, 0., 50))
-cmap_greys = mcolors.LinearSegmentedColormap.from_list('buffer_cmap', scale_greys)
 
+# Map styles keyed by grid layer (GRID_<layer>_<model>). A new layer is drawn
+# by adding an entry here, with keys:
+#   figName    figure name prefix (MAP_<figName>_<model>.png)
+#   title      figure title
+#   cmap       function returning the colormap
+#   transform  function applied to the grid values, or None
+#   vmin, vmax colour limits (None to fit the data)
+#   cbarLabel  colour bar label
+#   lw         line width of the plate contour
+GRID_MAPS = {
+    "MuA" : {"figName" : "muA",
+             "title" : r"Depth-average asthenosphere viscosity [Pa$\cdot$s]",
+             "cmap" : viscosity_cmap, "transform" : np.log10, "vmin" : 18, "vmax" : 21,
+             "cbarLabel" : r"$\mathrm{log(\mu_a)}$", "lw" : 0.7},
 
-# =================== Viscosity Map ===================
+    "YM" : {"figName" : "YM",
+            "title" : "Depth-average asthenosphere Young's modulus [Pa]",
+            "cmap" : youngModulus_cmap, "transform" : None, "vmin" : None, "vmax" : None,
+            "cbarLabel" : "", "lw" : 0.8},
 
-# Set figure
-fig = plt.figure(figsize=(10,7), dpi=360 )
-ax = fig.add_subplot(111)
-plt.title("Depth-average asthenosphere viscosity [Pa$\cdot$s]", pad=10)
+    "MT" : {"figName" : "Mtau",
+            "title" : "Depth-average asthenosphere Maxwel time [yr]",
+            "cmap" : maxwellTime_cmap, "transform" : None, "vmin" : None, "vmax" : 10,
+            "cbarLabel" : "", "lw" : 0.8},
+    }
 
 
-# The width of cax will be 5% of ax and the padding between cax and ax will be fixed at 0.05 inch.
-divider = make_axes_locatable(ax)
-cax = divider.append_axes("right", size="4%", pad=0.1)
 
+def main(args, layers=None, output="maps", quality=None, profile=None, bbox=None):
+    """
+    Plots grid layers of an asthenosphere model over the plate contour. The
+    axes, plate contour, rigidity overlay and legend are drawn once and shared
+    by all maps; only the image, colour bar and title change between layers.
 
-# Set log of muA as Z value
-muA_reversed = muA.iloc[::-1]
-Z = np.log10(muA_reversed)
+    Parameters
+    ----------
+    args : list
+        Cmd inputs: model label, model stages, plate label and DIR_MTX_w2M.
+    layers : list or string, optional
+        Layers to plot, as keys of GRID_MAPS (a comma-separated string is
+        also accepted). The default is None (MuA, YM and MT).
+    output : string, optional
+        "maps" saves one PNG map per layer, "tiles" exports the layers as
+        z/x/y tile pyramids (see GridTiles) and "both" does both.
+    quality : string, optional
+        Render tier of the maps, "final" or "draft" (see RenderQuality). The
+        default is None (MYRIAM_QUALITY environment variable, else "final").
+    profile : string, optional
+        Per-stage instrumentation, "off", "time" or "memory" (see
+        RenderProfile). The default is None (MYRIAM_PROFILE environment
+        variable, else "off").
+    bbox : string, optional
+        Crop of the maps: None crops each map to its tight bounding box,
+        "shared" computes it on the first map and reuses it for the rest
+        (the layout is shared by all layers), or "x0,y0,x1,y1" gives a
+        fixed crop in inches. The default is None.
 
+    Returns
+    -------
+    list
+        Paths to the saved figures (and to the tile manifest).
 
-# Create the colormap
-cmap_viridis = cm.viridis(np.linspace(0., 1, 230))
-cmap_viridis1 = cmap_viridis[:50]
-cmap_viridis2 = cmap_viridis[90:140]
-cmap_viridis3 = cmap_viridis[180:]
+    """
 
-colors = np.vstack((cmap_viridis1, cmap_viridis2, cmap_viridis3))
-mymap = mcolors.LinearSegmentedColormap.from_list('muA_cmap', colors)
+    # Cmd inputs
+    modelLabel = args[0]
+    modelStages = args[1]
+    boundaryLabel = args[2]
+    repositoryDir = args[3]
 
+    if layers is None:
+        layers = list(GRID_MAPS)
+    elif isinstance(layers, str):
+        layers = layers.split(",")
 
-# Plot Z surface colormap
-im = ax.imshow(Z, origin='lower', extent=extent, cmap=mymap, vmin=18, vmax=21)
-cbar = fig.colorbar(im, cax=cax)
-cbar.set_label("$\mathrm{log(\mu_a)}$", rotation=270, fontsize=11, labelpad=25)
+    unknown = [layer for layer in layers if layer not in GRID_MAPS]
+    if unknown:
+        raise ValueError("Unknown grid layers: %s. Must be in: %s."
+                         %(", ".join(unknown), ", ".join(GRID_MAPS)))
 
+    if output not in ("maps", "tiles", "both"):
+        raise ValueError("Input output must be 'maps', 'tiles' or 'both'.")
 
-# Enclose map to plate's contour 
-ax.set_ylim(cntr_yMin - 0.2*cntr_yExtent , cntr_yMax + 0.2*cntr_yExtent)
-ax.set_xlim(cntr_xMin - 0.2*cntr_xExtent , cntr_xMax + 0.2*cntr_xExtent)
+    tier = render_tier(quality)
+    profiler = start_profile("GridMaps", args, profile)
 
+    figpaths = []
 
-# Plot plate contour and inContour points
-ax.plot(contourXY["lon"], contourXY["lat"], '-k', lw=0.7)
-scatter = ax.scatter(inContourXYz["lon"], inContourXYz["lat"], s=0.7, 
-                     c=inContourXYz["z"], cmap = cmap_greys, vmin=0)
 
+    # Tile pyramids (regenerated only for layers whose grid changed)
+    if output in ("tiles", "both"):
+        from GridTiles import export_tiles
+        with profile_stage("export_tiles"):
+            figpaths.append(export_tiles(repositoryDir, modelLabel, layers))
 
-legend1 = ax.legend(*scatter.legend_elements(num=5), loc="upper right", 
-                    title="Rigidity", fontsize=8, title_fontsize=10)
-ax.add_artist(legend1)
+        if output == "tiles":
+            finish_profile(profiler, figpaths)
+            return figpaths
 
 
-# Set Labels
-setCartographic_AxisLabels(ax)
+    # Load grids (from the GRID_<model>.grd bundle when it exists, else the text files)
+    with profile_stage("load_grids"):
+        grids = load_grids(repositoryDir, modelLabel, layers)
 
+    lon, lat = grids["LON"], grids["LAT"]
 
-# Save figure as png
-figName = "MAP_muA_%s.png" %modelLabel
-figpath = os.path.join(repositoryDir, figName)       
-plt.savefig(figpath, bbox_inches='tight', dpi=360)
 
+    # Load plate contour
+    contourName = "BDR_%s_%s.txt" %(boundaryLabel, modelStages)
+    contourPath = os.path.join(repositoryDir, contourName)
+    with profile_stage("read_contour"):
+        contourXY = dict(zip(["lon", "lat"], np.loadtxt(contourPath, dtype=np.float64, usecols=(0, 1),
+                                                        ndmin=2, unpack=True)))
 
+    cntr_yMin, cntr_yMax = np.min(contourXY["lat"]), np.max(contourXY["lat"])
+    cntr_xMin, cntr_xMax = np.min(contourXY["lon"]), np.max(contourXY["lon"])
+    cntr_xExtent = cntr_xMax - cntr_xMin
+    cntr_yExtent = cntr_yMax - cntr_yMin
 
 
-# =================== Young's modulus Map ===================
+    # Load inContour points
+    inContourName = "BDRin_%s_%s.txt" %(boundaryLabel, modelStages)
+    inContourPath = os.path.join(repositoryDir, inContourName)
+    with profile_stage("read_inContour"):
+        inContourXYz = np.loadtxt(inContourPath, dtype=np.float64, usecols=(0, 1, 2), ndmin=2)
+    inContourXYz = dict(zip(["lon", "lat", "z"], inContourXYz[subsample(len(inContourXYz), tier)].T))
 
-# Set figure
-fig = plt.figure(figsize=(10,7), dpi=360 )
-ax = fig.add_subplot(111)
-plt.title("Depth-average asthenosphere Young's modulus [Pa]", pad=10)
 
 
-# The width of cax will be 5% of ax and the padding between cax and ax will be fixed at 0.05 inch.
-divider = make_axes_locatable(ax)
-cax = divider.append_axes("right", size="4%", pad=0.1)
+    # --- Shared figure
 
+    with profile_stage("shared_figure"):
 
-# Set log of muA as Z value
-ym_reversed = ym.iloc[::-1]
-Z = ym_reversed
+        # Set Z extent
+        extent = lon[0,0] - 1, lon[-1,-1] + 1, lat[-1,0] - 1, lat[0,0] + 1
 
+        # Create grid colormap
+        scale_greys = cm.Greys_r(np.linspace(1, 0., 50))
+        cmap_greys = mcolors.LinearSegmentedColormap.from_list('buffer_cmap', scale_greys)
 
-# Create the colormap
-cool = colormaps["cool"]
-colors = cool(np.linspace(0, 1, 256))
-mymap = mcolors.LinearSegmentedColormap.from_list('ym_cmap', colors)
 
+        # Set figure
+        fig = plt.figure(figsize=(10,7), dpi=tier["dpi"])
+        ax = fig.add_subplot(111)
 
-# Plot Z surface colormap
-im = ax.imshow(Z, origin='lower', extent=extent, cmap=mymap)
-fig.colorbar(im, cax=cax)
 
+        # The width of cax will be 5% of ax and the padding between cax and ax will be fixed at 0.05 inch.
+        divider = make_axes_locatable(ax)
+        cax = divider.append_axes("right", size="4%", pad=0.1)
 
-# Enclose map to plate's contour 
-ax.set_ylim(cntr_yMin - 0.2*cntr_yExtent , cntr_yMax + 0.2*cntr_yExtent)
-ax.set_xlim(cntr_xMin - 0.2*cntr_xExtent , cntr_xMax + 0.2*cntr_xExtent)
 
+        # Image placeholder, filled in for each layer
+        im = ax.imshow(np.zeros((2,2)), origin='lower', extent=extent)
+        cbar = fig.colorbar(im, cax=cax)
 
-# Plot plate contour and inContour points
-ax.plot(contourXY["lon"], contourXY["lat"], '-k', lw=0.8)
-scatter = ax.scatter(inContourXYz["lon"], inContourXYz["lat"], s=0.7, 
-                     c=inContourXYz["z"], cmap = cmap_greys, vmin=0)
 
+        # Enclose map to plate's contour
+        ax.set_ylim(cntr_yMin - 0.2*cntr_yExtent , cntr_yMax + 0.2*cntr_yExtent)
+        ax.set_xlim(cntr_xMin - 0.2*cntr_xExtent , cntr_xMax + 0.2*cntr_xExtent)
 
-legend1 = ax.legend(*scatter.legend_elements(num=5), loc="upper right", 
-                    title="Rigidity", fontsize=8, title_fontsize=10)
-ax.add_artist(legend1)
 
+        # Plot plate contour and inContour points
+        line, = ax.plot(contourXY["lon"], contourXY["lat"], '-k')
+        scatter = ax.scatter(inContourXYz["lon"], inContourXYz["lat"], s=0.7,
+                             c=inContourXYz["z"], cmap = cmap_greys, vmin=0)
 
-# Set Labels
-setCartographic_AxisLabels(ax)
 
+        legend1 = ax.legend(*scatter.legend_elements(num=5), loc="upper right",
+                            title="Rigidity", fontsize=8, title_fontsize=10)
+        ax.add_artist(legend1)
 
-# Save figure as png
-figName = "MAP_YM_%s.png" %modelLabel
-figpath = os.path.join(repositoryDir, figName)           
-plt.savefig(figpath, bbox_inches='tight', dpi=360)
 
+        # Set Labels
+        setCartographic_AxisLabels(ax)
 
 
 
-# =================== Maxwel Time Map ===================
+    # --- Layer maps
 
-# Set figure
-fig = plt.figure(figsize=(10,7), dpi=360 )
-ax = fig.add_subplot(111)
-plt.title("Depth-average asthenosphere Maxwel time [yr]", pad=10)
+    mapBbox = None if bbox == "shared" else bbox
 
+    for layer in layers:
 
-# The width of cax will be 5% of ax and the padding between cax and ax will be fixed at 0.05 inch.
-divider = make_axes_locatable(ax)
-cax = divider.append_axes("right", size="4%", pad=0.1)
+        style = GRID_MAPS[layer]
 
+        figName = "MAP_%s_%s.png" %(style["figName"], modelLabel)
+        figpath = tier_figpath(os.path.join(repositoryDir, figName), tier)
 
-# Set log of muA as Z value
-TAU_MXWyr_reversed = mt.iloc[::-1]
-Z = TAU_MXWyr_reversed
+        with profile_stage("draw_layer", figure=os.path.basename(figpath)):
 
+            # Set Z value (rows are stored north to south)
+            Z = np.asarray(grids[layer])[::-1]
+            if style["transform"] is not None:
+                Z = style["transform"](Z)
 
-# Create the colormap
-cool = colormaps["jet"]
-colors = cool(np.linspace(1, 0., 100))
-mymap = mcolors.LinearSegmentedColormap.from_list('mxw_cmap', colors)
 
+            # Swap image data, colormap and colour limits
+            im.set_data(Z)
+            im.set_cmap(style["cmap"]())
+            im.set_norm(mcolors.Normalize(style["vmin"], style["vmax"]))
+            im.autoscale_None()
 
-# Plot Z surface colormap
-im = ax.imshow(Z, origin='lower', extent=extent, cmap=mymap, vmax=10)
-fig.colorbar(im, cax=cax)
+            cbar.set_label(style["cbarLabel"], rotation=270, fontsize=11, labelpad=25)
+            ax.set_title(style["title"], pad=10)
+            line.set_linewidth(style["lw"])
 
 
-# Enclose map to plate's contour 
-ax.set_ylim(cntr_yMin - 0.2*cntr_yExtent , cntr_yMax + 0.2*cntr_yExtent)
-ax.set_xlim(cntr_xMin - 0.2*cntr_xExtent , cntr_xMax + 0.2*cntr_xExtent)
+        # Save figure as png
+        with profile_stage("savefig", figure=os.path.basename(figpath)):
+            cropBbox = save_figure(fig, figpath, bbox=mapBbox, compression=compression_level(tier))
+        figpaths.append(figpath)
 
+        if bbox == "shared":
+            mapBbox = cropBbox
 
-# Plot plate contour and inContour points
-ax.plot(contourXY["lon"], contourXY["lat"], '-k', lw=0.8)
-scatter = ax.scatter(inContourXYz["lon"], inContourXYz["lat"], s=0.7, 
-                     c=inContourXYz["z"], cmap = cmap_greys, vmin=0)
+    plt.close(fig)
 
+    finish_profile(profiler, figpaths)
 
-legend1 = ax.legend(*scatter.legend_elements(num=5), loc="upper right", 
-                    title="Rigidity", fontsize=8, title_fontsize=10)
-ax.add_artist(legend1)
+    return figpaths
 
 
-# Set Labels
-setCartographic_AxisLabels(ax)
-
-
-# Save figure as png
-figName = "MAP_Mtau_%s.png" %modelLabel
-figpath = os.path.join(repositoryDir, figName)           
-plt.savefig(figpath, bbox_inches='tight', dpi=360)
 
+if __name__ == "__main__":
+    matplotlib.use("Agg")
+    main(sys.argv[1:5], **dict(arg.split("=", 1) for arg in sys.argv[5:]))
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import sys
+import json
+import shutil
+import hashlib
+import numpy as np
+import matplotlib.image as mimage
+from concurrent.futures import ProcessPoolExecutor
+
+from GridBundle import load_grids
+from GridMaps import GRID_MAPS
+
+
+# Contains
+# 1. tile_bounds
+# 2. tile_range
+# 3. render_tile
+# 4. export_tiles
+
+
+# Tiles follow the standard web-map (z/x/y, spherical Mercator) scheme:
+# TILES_<model>/<layer>/<z>/<x>/<y>.png plus TILES_<model>/manifest.json.
+# Grid cells are sampled by nearest neighbour and coloured with the GridMaps
+# styles; cells outside the grid are transparent.
+TILE_SIZE = 256
+MAX_LATITUDE = 85.0511287798
+TILE_STYLE_VERSION = 1
+
+# Module-level state of each pool process
+_grids = None
+
+
+
+def tile_bounds(z, x, y):
+    """
+    Geographic bounds of a tile.
+
+    Returns
+    -------
+    tuple
+        lonMin, latMin, lonMax, latMax in degrees.
+
+    """
+
+    n = 2.0**z
+    lat = lambda yTile: np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * yTile / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+
+def tile_range(z, lonMin, latMin, lonMax, latMax):
+    """
+    Tile columns and rows covering a geographic extent at zoom level z.
+
+    Returns
+    -------
+    tuple
+        Ranges of x and y tile indices.
+
+    """
+
+    n = 2**z
+
+    def yTile(lat):
+        lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+        return (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n
+
+    xMin = int(np.clip(np.floor((lonMin + 180.0) / 360.0 * n), 0, n - 1))
+    xMax = int(np.clip(np.floor((lonMax + 180.0) / 360.0 * n), 0, n - 1))
+    yMin = int(np.clip(np.floor(yTile(latMax)), 0, n - 1))
+    yMax = int(np.clip(np.floor(yTile(latMin)), 0, n - 1))
+
+    return range(xMin, xMax + 1), range(yMin, yMax + 1)
+
+
+
+def _nearest(vector, values):
+
+    # Nearest cell of an ascending coordinate vector, -1 outside the grid
+    halfStep = 0.5 * (vector[-1] - vector[0]) / max(len(vector) - 1, 1)
+    index = np.searchsorted(0.5 * (vector[1:] + vector[:-1]), values)
+
+    outside = (values < vector[0] - halfStep) | (values > vector[-1] + halfStep)
+    index[outside] = -1
+
+    return index
+
+
+
+def render_tile(values, lonVector, latVector, z, x, y, cmap, norm):
+    """
+    Colours the grid cells under a tile.
+
+    Parameters
+    ----------
+    values : array
+        Grid values of shape (nLat, nLon), rows south to north.
+    lonVector, latVector : array
+        Ascending cell-centre coordinates, in degrees.
+    z, x, y : int
+        Tile indices.
+    cmap : matplotlib colormap
+        Layer colormap.
+    norm : matplotlib.colors.Normalize
+        Layer colour limits.
+
+    Returns
+    -------
+    array
+        RGBA tile of shape (TILE_SIZE, TILE_SIZE, 4), uint8.
+
+    """
+
+    # Pixel-centre coordinates
+    n = 2.0**z * TILE_SIZE
+    pixels = np.arange(TILE_SIZE) + 0.5
+
+    tileLon = (x * TILE_SIZE + pixels) / n * 360.0 - 180.0
+    tileLat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y * TILE_SIZE + pixels) / n))))
+
+
+    # Sample grid and colour
+    iLon, iLat = _nearest(lonVector, tileLon), _nearest(latVector, tileLat)
+
+    Z = values[np.ix_(np.maximum(iLat, 0), np.maximum(iLon, 0))]
+    rgba = cmap(norm(Z), bytes=True)
+
+    rgba[(iLat[:, np.newaxis] < 0) | (iLon[np.newaxis, :] < 0) | ~np.isfinite(Z)] = 0
+
+    return rgba
+
+
+
+def _layer_values(grids, layer):
+
+    # Layer values after the GridMaps transform, rows south to north
+    values = np.asarray(grids[layer], dtype=np.float64)[::-1]
+
+    if GRID_MAPS[layer]["transform"] is not None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = GRID_MAPS[layer]["transform"](values)
+
+    return np.ascontiguousarray(values)
+
+
+
+def _init_worker(folder, modelLabel, layers):
+
+    global _grids
+    grids = load_grids(folder, modelLabel, layers)
+
+    _grids = {layer : _layer_values(grids, layer) for layer in layers}
+    _grids["LON"] = np.array(grids["LON"][0, :], dtype=np.float64)
+    _grids["LAT"] = np.array(grids["LAT"][::-1, 0], dtype=np.float64)
+
+
+
+def _render_column(task):
+
+    # Renders the tiles of one (layer, z, x) column
+    import matplotlib.colors as mcolors
+
+    tileDir, layer, z, x, yRange, vmin, vmax = task
+
+    cmap = GRID_MAPS[layer]["cmap"]()
+    norm = mcolors.Normalize(vmin, vmax)
+
+    columnDir = os.path.join(tileDir, layer, str(z), str(x))
+    os.makedirs(columnDir, exist_ok=True)
+
+    for y in yRange:
+        rgba = render_tile(_grids[layer], _grids["LON"], _grids["LAT"], z, x, y, cmap, norm)
+        mimage.imsave(os.path.join(columnDir, "%d.png" %y), rgba)
+
+    return len(yRange)
+
+
+
+def export_tiles(folder, modelLabel, layers=None, maxZoom=None, nWorkers=None, force=False):
+    """
+    Writes grid layers as z/x/y PNG tile pyramids, rendered across a pool of
+    processes. A layer is only re-rendered when its grid values, colour
+    limits, zoom levels or style change.
+
+    Parameters
+    ----------
+    folder : string
+        Folder with the grids (DIR_MTX_w2M). Tiles are written to
+        TILES_<model> in this folder.
+    modelLabel : string
+        Model label used in the file names.
+    layers : list, optional
+        Layers to export, as keys of GridMaps.GRID_MAPS. The default is None
+        (MuA, YM and MT).
+    maxZoom : int, optional
+        Deepest zoom level. The default is None (the first level whose
+        pixels are finer than the grid cells at the equator).
+    nWorkers : int, optional
+        Number of processes. The default is None (one per CPU); 1 renders in
+        the calling process.
+    force : bool, optional
+        Re-render every layer. The default is False.
+
+    Returns
+    -------
+    string
+        Path to the manifest file.
+
+    """
+
+    if layers is None:
+        layers = list(GRID_MAPS)
+
+    tileDir = os.path.join(folder, "TILES_%s" %modelLabel)
+    manifestPath = os.path.join(tileDir, "manifest.json")
+
+    grids = load_grids(folder, modelLabel, layers)
+    lonVector = np.asarray(grids["LON"][0, :], dtype=np.float64)
+    latVector = np.asarray(grids["LAT"][::-1, 0], dtype=np.float64)
+
+
+    # Grid extent (cell edges) and zoom levels
+    lonStep = (lonVector[-1] - lonVector[0]) / max(len(lonVector) - 1, 1)
+    latStep = (latVector[-1] - latVector[0]) / max(len(latVector) - 1, 1)
+
+    bounds = [lonVector[0] - lonStep/2, max(latVector[0] - latStep/2, -MAX_LATITUDE),
+              lonVector[-1] + lonStep/2, min(latVector[-1] + latStep/2, MAX_LATITUDE)]
+
+    if maxZoom is None:
+        maxZoom = max(int(np.ceil(np.log2(360.0 / (TILE_SIZE * min(lonStep, latStep))))), 0)
+    maxZoom = int(maxZoom)
+
+
+    # Previous manifest
+    try:
+        with open(manifestPath, "r") as datafile_id:
+            manifest = json.load(datafile_id)
+    except (OSError, ValueError):
+        manifest = {"layers" : {}}
+
+    manifest.update({"model" : modelLabel, "tileSize" : TILE_SIZE, "minZoom" : 0,
+                     "maxZoom" : maxZoom, "bounds" : [float(b) for b in bounds]})
+
+
+    # Layers whose tiles must be rendered
+    tasks = []
+    for layer in layers:
+
+        values = _layer_values(grids, layer)
+        finite = values[np.isfinite(values)]
+
+        style = GRID_MAPS[layer]
+        vmin = style["vmin"] if style["vmin"] is not None else float(finite.min())
+        vmax = style["vmax"] if style["vmax"] is not None else float(finite.max())
+
+        digest = hashlib.sha1(values.tobytes())
+        digest.update(json.dumps([TILE_STYLE_VERSION, vmin, vmax, maxZoom, bounds,
+                                  style["cmap"].__name__]).encode())
+
+        layerInfo = {"tiles" : "%s/{z}/{x}/{y}.png" %layer, "vmin" : vmin, "vmax" : vmax,
+                     "title" : style["title"], "hash" : digest.hexdigest()}
+
+        if not force and manifest["layers"].get(layer, {}).get("hash") == layerInfo["hash"] \
+                and os.path.isdir(os.path.join(tileDir, layer)):
+            continue
+
+        shutil.rmtree(os.path.join(tileDir, layer), ignore_errors=True)
+        manifest["layers"][layer] = layerInfo
+
+        for z in range(maxZoom + 1):
+            xRange, yRange = tile_range(z, *bounds)
+            tasks += [(tileDir, layer, z, x, yRange, vmin, vmax) for x in xRange]
+
+
+    # Render tiles, then save the manifest (only once all tiles exist)
+    if tasks:
+        if nWorkers == 1:
+            _init_worker(folder, modelLabel, layers)
+            nTiles = [_render_column(task) for task in tasks]
+
+        else:
+            nWorkers = min(nWorkers or os.cpu_count() or 1, len(tasks))
+            with ProcessPoolExecutor(max_workers=nWorkers, initializer=_init_worker,
+                                     initargs=(folder, modelLabel, layers)) as executor:
+                nTiles = list(executor.map(_render_column, tasks, chunksize=4))
+
+        for task, count in zip(tasks, nTiles):
+            manifest["layers"][task[1]]["count"] = manifest["layers"][task[1]].get("count", 0) + count
+
+    os.makedirs(tileDir, exist_ok=True)
+    with open(manifestPath, "w") as datafile_id:
+        json.dump(manifest, datafile_id, indent=1)
+
+    return manifestPath
+
+
+
+if __name__ == "__main__":
+
+    # Cmd inputs: model label and DIR_MTX_w2M, then optional layers=MuA,YM,
+    # maxZoom=<int>, workers=<int> and force=1
+    options = dict(arg.split("=", 1) for arg in sys.argv[3:])
+
+    print(export_tiles(sys.argv[2], sys.argv[1],
+                       layers=options["layers"].split(",") if "layers" in options else None,
+                       maxZoom=options.get("maxZoom"),
+                       nWorkers=int(options["workers"]) if "workers" in options else None,
+                       force=options.get("force", "0") not in ("0", "false", "False")))
@@ -9,18 +9,21 @@ Created on Tue Oct 18 10:16:31 2022
 import os
 import sys
 import numpy as np
-import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib.ticker import ScalarFormatter
+from RenderQuality import render_tier, tier_figpath
+from RenderProfile import start_profile, profile_stage, finish_profile
+from FigureEncoding import compression_level, save_figure
 
 
 def set_ytickLabels(ax):
 
-    # Set tick class    
+    # Set tick class
     class ScalarFormatterClass(ScalarFormatter):
        def _set_format(self):
           self.format = "%.1f"
-    
+
     # Apply format
     axScalarFormatter = ScalarFormatterClass(useMathText=True)
     axScalarFormatter.set_powerlimits((0,0))
@@ -29,36 +32,78 @@ def set_ytickLabels(ax):
 
 
 
+def main(args, quality=None, profile=None, bbox=None):
+    """
+    Plots the histogram of torque-variation magnitudes.
+
+    Parameters
+    ----------
+    args : list
+        Cmd inputs: histogram label and DIR_dM_PPD.
+    quality : string, optional
+        Render tier, "final" or "draft" (see RenderQuality). The default is
+        None (MYRIAM_QUALITY environment variable, else "final").
+    profile : string, optional
+        Per-stage instrumentation, "off", "time" or "memory" (see
+        RenderProfile). The default is None (MYRIAM_PROFILE environment
+        variable, else "off").
+    bbox : string, optional
+        Fixed crop "x0,y0,x1,y1" in inches, used instead of the tight
+        bounding box when the layout is known. The default is None.
+
+    Returns
+    -------
+    list
+        Path to the saved figure.
+
+    """
+
+    tier = render_tier(quality)
+    profiler = start_profile("MagnitudeHistogram", args, profile)
+
+    # Cmd inputs
+    modelLabel = args[0]
+    repositoryDir = args[1]
+
+
+    # Load file
+    magHist_fileName = "MAGHIST_%s.txt" %modelLabel
+    magHist_path = os.path.join(repositoryDir, magHist_fileName)
+    with profile_stage("load_histogram"):
+        magX, magY = np.loadtxt(magHist_path, dtype=np.float64, usecols=(0, 1), ndmin=2, unpack=True)
+
+    nSize = magY.sum()
+
 
-# Cmd inputs
-modelLabel = sys.argv[1]
-repositoryDir = sys.argv[2]
+    # Set main figure
+    fig = plt.figure(figsize=(5,5), dpi=tier["dpi"])
+    ax = fig.add_subplot(111)
+    set_ytickLabels(ax)
+    ax.grid(True, linewidth=0.3, alpha=0.5)
 
+    ax.set_xlabel('Magnitude [N*m]', labelpad=10)
+    ax.set_ylabel('Frequency (size = %.0e)' %nSize, labelpad=10)
+    ax.set_title("Torque-variation Magnitude", pad=10)
 
-# Load file
-magHist_fileName = "MAGHIST_%s.txt" %modelLabel
-magHist_path = os.path.join(repositoryDir, magHist_fileName)
-magHist = pd.read_csv(magHist_path, delimiter=' ', header=None, names=["x", "y"])
 
-nSize = sum(magHist["y"])
+    # Plot Histogram
+    with profile_stage("hist"):
+        plt.hist(magX, weights=magY, bins = len(magX), ec="1")
 
 
-# Set main figure
-fig = plt.figure(figsize=(5,5), dpi=480)    
-ax = fig.add_subplot(111)
-set_ytickLabels(ax)
-ax.grid(True, linewidth=0.3, alpha=0.5)
+    # Save figure as png
+    figName = "PLOT_MAGHIST_%s.png" %modelLabel
+    figpath = tier_figpath(os.path.join(repositoryDir, figName), tier)
+    with profile_stage("savefig"):
+        save_figure(fig, figpath, bbox=bbox, compression=compression_level(tier))
+    plt.close(fig)
 
-ax.set_xlabel('Magnitude [N*m]', labelpad=10)
-ax.set_ylabel('Frequency (size = %.0e)' %nSize, labelpad=10)
-ax.set_title("Torque-variation Magnitude", pad=10)
+    finish_profile(profiler, [figpath])
 
+    return [figpath]
 
-# Plot Histogram
-plt.hist(magHist["x"], weights=magHist["y"], bins = len(magHist), ec="1")
 
 
-# Save figure as png
-figName = "PLOT_MAGHIST_%s.png" %modelLabel
-figpath = os.path.join(repositoryDir, figName)       
-plt.savefig(figpath, bbox_inches='tight', dpi=360)
\ No newline at end of file
+if __name__ == "__main__":
+    matplotlib.use("Agg")
+    main(sys.argv[1:3], **dict(arg.split("=", 1) for arg in sys.argv[3:]))
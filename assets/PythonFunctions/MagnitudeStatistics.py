@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from EnsembleFormat import ensemble_chunks, open_ensemble, is_binary_ensemble, find_ensemble
+from RunLabels import check_runLabel, ensemble_stem, maghist_fileName
+
+
+# Contains
+# 1. new_sketch
+# 2. update_sketch
+# 3. merge_sketches
+# 4. sketch_quantiles
+# 5. new_histogram
+# 6. update_histogram
+# 7. merge_histograms
+# 8. magnitude_statistics
+# 9. magnitude_histogram
+
+
+# Streaming statistics of torque-variation magnitudes |dM|, read block by
+# block from an ENSdM ensemble (Cartesian, N*m).
+#
+# Quantiles come from a log-bucket sketch: bucket k counts the magnitudes in
+# (gamma^(k-1), gamma^k], gamma = (1 + a)/(1 - a), so every quantile is
+# within a relative error a of the true one. Sketches of separate blocks (or
+# processes) merge by adding bucket counts; memory is bounded by MAX_BUCKETS
+# (the lowest buckets are folded together beyond it).
+#
+# The histogram follows Histogram1D (src/dep.Utilities/Histogram1D.cs):
+# nBins equal bins between the smallest and largest magnitude, saved as
+# MAGHIST_<RUN_LABEL>_<nBins>.txt ("mid-bin count" rows, see RunLabels) for
+# MagnitudeHistogram.py.
+RELATIVE_ACCURACY = 0.005
+MAX_BUCKETS = 4096
+
+DM_MAGHIST_BINS = 50
+DM_MAG_PERCENT = [68, 95]
+
+MAGHIST_FORMAT = ["%.3E", "%d"]
+CHUNK_ROWS = 1000000
+
+# Bin width (relative to the magnitude) of histograms whose magnitudes are
+# all equal: the range is widened around them, with the value in the middle
+EQUAL_MAGNITUDES_BIN_WIDTH = 1e-6
+
+# Module-level state of each pool process
+_workerPath = None
+
+
+
+def new_sketch(relativeAccuracy=RELATIVE_ACCURACY):
+    """
+    Empty quantile sketch.
+
+    Parameters
+    ----------
+    relativeAccuracy : float, optional
+        Relative error of the quantiles. The default is RELATIVE_ACCURACY.
+
+    Returns
+    -------
+    dict
+        "gamma", "count", "zeros", "min", "max", "offset" (key of the first
+        bucket) and "buckets" (bucket counts).
+
+    """
+
+    return {"gamma" : (1 + relativeAccuracy) / (1 - relativeAccuracy), "count" : 0, "zeros" : 0,
+            "min" : np.inf, "max" : -np.inf, "offset" : 0, "buckets" : np.zeros(0, dtype=np.int64)}
+
+
+
+def _add_buckets(sketch, offset, buckets):
+
+    # Adds bucket counts starting at key offset, then folds the lowest
+    # buckets if the sketch grows beyond MAX_BUCKETS
+    if len(buckets) == 0:
+        return
+
+    if len(sketch["buckets"]) == 0:
+        sketch["offset"], sketch["buckets"] = offset, buckets.copy()
+    else:
+        start = min(sketch["offset"], offset)
+        stop = max(sketch["offset"] + len(sketch["buckets"]), offset + len(buckets))
+
+        merged = np.zeros(stop - start, dtype=np.int64)
+        merged[sketch["offset"] - start:sketch["offset"] - start + len(sketch["buckets"])] += sketch["buckets"]
+        merged[offset - start:offset - start + len(buckets)] += buckets
+
+        sketch["offset"], sketch["buckets"] = start, merged
+
+    excess = len(sketch["buckets"]) - MAX_BUCKETS
+    if excess > 0:
+        folded = sketch["buckets"][excess:].copy()
+        folded[0] += sketch["buckets"][:excess].sum()
+        sketch["offset"], sketch["buckets"] = sketch["offset"] + excess, folded
+
+
+
+def update_sketch(sketch, values):
+    """
+    Adds non-negative values (e.g. magnitudes of an ensemble block) to a
+    sketch, in place.
+    """
+
+    values = np.ravel(np.asarray(values, dtype=np.float64))
+
+    if len(values) == 0:
+        return sketch
+
+    if np.any(values < 0) or np.any(np.isnan(values)):
+        raise ValueError("Sketched values must be non-negative numbers.")
+
+    positive = values[values > 0]
+    keys = np.ceil(np.log(positive) / np.log(sketch["gamma"])).astype(np.int64)
+
+    if len(keys):
+        _add_buckets(sketch, keys.min(), np.bincount(keys - keys.min()).astype(np.int64))
+
+    sketch["count"] += len(values)
+    sketch["zeros"] += len(values) - len(positive)
+    sketch["min"] = min(sketch["min"], values.min())
+    sketch["max"] = max(sketch["max"], values.max())
+
+    return sketch
+
+
+
+def merge_sketches(*sketches):
+    """
+    Merges sketches of the same relative accuracy (e.g. from parallel
+    workers) into a new sketch.
+    """
+
+    merged = new_sketch()
+    merged["gamma"] = sketches[0]["gamma"]
+
+    for sketch in sketches:
+        if not np.isclose(sketch["gamma"], merged["gamma"], rtol=1e-12):
+            raise ValueError("Sketches of different relative accuracy can't be merged.")
+
+        _add_buckets(merged, sketch["offset"], sketch["buckets"])
+
+        merged["count"] += sketch["count"]
+        merged["zeros"] += sketch["zeros"]
+        merged["min"] = min(merged["min"], sketch["min"])
+        merged["max"] = max(merged["max"], sketch["max"])
+
+    return merged
+
+
+
+def sketch_quantiles(sketch, q):
+    """
+    Quantiles of the sketched values.
+
+    Parameters
+    ----------
+    sketch : dict
+        Quantile sketch.
+    q : float or array
+        Quantiles, between 0 and 1.
+
+    Returns
+    -------
+    float or array
+        Estimated quantiles (exact at 0 and 1).
+
+    """
+
+    if sketch["count"] == 0:
+        raise ValueError("Empty sketch.")
+
+    q = np.asarray(q, dtype=np.float64)
+    rank = q * (sketch["count"] - 1)
+
+
+    # Bucket holding each rank (zeros come first)
+    cumulative = sketch["zeros"] + np.cumsum(sketch["buckets"])
+    bucketNr = np.minimum(np.searchsorted(cumulative, rank, side="right"), len(cumulative) - 1)
+
+    keys = sketch["offset"] + bucketNr
+    estimate = 2 * sketch["gamma"]**keys / (sketch["gamma"] + 1) if len(cumulative) else np.zeros_like(q)
+    estimate = np.where(rank < sketch["zeros"], 0.0, estimate)
+
+
+    # Exact extremes
+    estimate = np.clip(estimate, sketch["min"], sketch["max"])
+    estimate = np.where(q <= 0, sketch["min"], np.where(q >= 1, sketch["max"], estimate))
+
+    return estimate[()]
+
+
+
+def new_histogram(nBins, magMin, magMax):
+    """
+    Empty histogram of nBins equal bins between magMin and magMax.
+    """
+
+    if nBins <= 0:
+        raise ValueError("nBins must be a positive integer.")
+
+    if not magMax > magMin:
+        raise ValueError("Max must be set to a value higher than min.")
+
+    return {"edges" : np.linspace(magMin, magMax, nBins + 1), "counts" : np.zeros(nBins, dtype=np.int64)}
+
+
+
+def update_histogram(histogram, values):
+    """
+    Adds values to a histogram, in place. Values on the last edge fall in the
+    last bin and values out of range are ignored, as in Histogram1D.
+    """
+
+    edges, nBins = histogram["edges"], len(histogram["counts"])
+    binIndex = np.floor((np.ravel(values) - edges[0]) / ((edges[-1] - edges[0]) / nBins)).astype(np.int64)
+    binIndex[binIndex == nBins] = nBins - 1
+
+    inRange = (binIndex >= 0) & (binIndex < nBins)
+    histogram["counts"] += np.bincount(binIndex[inRange], minlength=nBins)
+
+    return histogram
+
+
+
+def merge_histograms(*histograms):
+    """
+    Adds the counts of histograms with the same bins into a new histogram.
+    """
+
+    edges = histograms[0]["edges"]
+
+    if any(not np.array_equal(histogram["edges"], edges) for histogram in histograms):
+        raise ValueError("Histograms with different bins can't be merged.")
+
+    return {"edges" : edges.copy(), "counts" : np.sum([histogram["counts"] for histogram in histograms], axis=0)}
+
+
+
+def _sketch_range(sketch, nBins):
+
+    # Histogram range of the sketched magnitudes, widened when all are equal
+    magMin, magMax = sketch["min"], sketch["max"]
+
+    if magMax > magMin:
+        return magMin, magMax
+
+    halfWidth = 0.5 * nBins * EQUAL_MAGNITUDES_BIN_WIDTH * (abs(magMin) or 1.0)
+
+    return magMin - halfWidth, magMax + halfWidth
+
+
+
+def _magnitudes(chunk):
+
+    return np.sqrt(np.einsum("ij,ij->i", chunk[:, :3], chunk[:, :3]))
+
+
+
+def _row_ranges(path, nWorkers, chunkRows):
+
+    # Member ranges of the workers, in whole chunks
+    nRows = open_ensemble(path)[1]["shape"][0]
+    nChunks = -(-nRows // chunkRows)
+    bounds = np.linspace(0, nChunks, min(nWorkers, max(nChunks, 1)) + 1).astype(np.int64) * chunkRows
+
+    return [(int(start), int(min(stop, nRows))) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+
+def _init_worker(path):
+
+    global _workerPath
+    _workerPath = path
+
+
+
+def _worker_pass(task):
+
+    # Sketch (first pass) or histogram (second pass) of a range of members
+    (start, stop), chunkRows, histogram = task
+    data = open_ensemble(_workerPath)[0]
+    result = new_sketch() if histogram is None else histogram
+
+    for first in range(start, stop, chunkRows):
+        magnitudes = _magnitudes(np.asarray(data[first:min(first + chunkRows, stop)], dtype=np.float64))
+
+        if histogram is None:
+            update_sketch(result, magnitudes)
+        else:
+            update_histogram(result, magnitudes)
+
+    return result
+
+
+
+def magnitude_statistics(ensemble_path, nBins=DM_MAGHIST_BINS, percents=DM_MAG_PERCENT,
+                         magRange=None, chunkRows=CHUNK_ROWS, nWorkers=1):
+    """
+    Magnitude quantile sketch, histogram and confidence intervals of a
+    torque-variation ensemble, read block by block.
+
+    Parameters
+    ----------
+    ensemble_path : string
+        Path to the dM ensemble (text or binary, Cartesian).
+    nBins : int, optional
+        Number of histogram bins. The default is DM_MAGHIST_BINS.
+    percents : list, optional
+        Percentages of the central magnitude intervals. The default is
+        DM_MAG_PERCENT.
+    magRange : tuple, optional
+        Histogram range. The default is None (smallest to largest
+        magnitude, found by the sketch in a first pass over the ensemble).
+    chunkRows : int, optional
+        Ensemble members per block. The default is CHUNK_ROWS.
+    nWorkers : int, optional
+        Number of processes sharing the members of binary ensembles. The
+        default is 1; the result does not depend on it.
+
+    Returns
+    -------
+    dict
+        "sketch", "histogram", "median" and "intervals" ({percent: (lower,
+        upper)} magnitudes, in N*m).
+
+    """
+
+    chunkRows = int(chunkRows)
+    parallel = nWorkers != 1 and is_binary_ensemble(ensemble_path)
+    histogram = new_histogram(nBins, *magRange) if magRange is not None else None
+
+
+    # Binary ensembles: worker processes share the members (two passes)
+    if parallel:
+        ranges = _row_ranges(ensemble_path, nWorkers or os.cpu_count() or 1, chunkRows)
+
+        with ProcessPoolExecutor(max_workers=len(ranges), initializer=_init_worker,
+                                 initargs=(ensemble_path,)) as executor:
+            sketch = merge_sketches(*executor.map(_worker_pass, [(rows, chunkRows, None) for rows in ranges]))
+
+            if histogram is None and sketch["count"]:
+                histogram = new_histogram(nBins, *_sketch_range(sketch, nBins))
+            if histogram is not None:
+                histogram = merge_histograms(*executor.map(_worker_pass, [(rows, chunkRows, histogram)
+                                                                          for rows in ranges]))
+
+
+    # Sketch and (given a range) histogram in one pass; else the histogram in
+    # a second pass, once the range is known
+    else:
+        sketch = new_sketch()
+        for chunk in ensemble_chunks(ensemble_path, chunkRows):
+            magnitudes = _magnitudes(chunk)
+            update_sketch(sketch, magnitudes)
+
+            if histogram is not None:
+                update_histogram(histogram, magnitudes)
+
+        if histogram is None and sketch["count"]:
+            histogram = new_histogram(nBins, *_sketch_range(sketch, nBins))
+            for chunk in ensemble_chunks(ensemble_path, chunkRows):
+                update_histogram(histogram, _magnitudes(chunk))
+
+    if sketch["count"] == 0:
+        raise ValueError("Empty ensemble.")
+
+
+    # Central intervals
+    tails = (1 - np.asarray(percents, dtype=np.float64) / 100) / 2
+    lower, upper = sketch_quantiles(sketch, tails), sketch_quantiles(sketch, 1 - tails)
+
+    return {"sketch" : sketch, "histogram" : histogram, "median" : float(sketch_quantiles(sketch, 0.5)),
+            "intervals" : {percent : (float(low), float(high)) for percent, low, high in zip(percents, lower, upper)}}
+
+
+
+def magnitude_histogram(ensemble_path, DIR_dM_PDD, runLabel, nBins=DM_MAGHIST_BINS,
+                        percents=DM_MAG_PERCENT, chunkRows=CHUNK_ROWS, nWorkers=1):
+    """
+    Saves the magnitude histogram of a torque-variation ensemble as MYRIAM
+    does (MAGHIST_<RUN_LABEL>_<nBins>.txt), plus its central magnitude
+    intervals (MAGPCT_<RUN_LABEL>.txt, "percent lower upper" rows).
+
+    Parameters
+    ----------
+    ensemble_path : string
+        Path to the dM ensemble (text or binary, Cartesian).
+    DIR_dM_PDD : string
+        Output folder.
+    runLabel : string
+        MYRIAM run label STGs_<stage1>_<stage2>_<plate>_<model> (RUN_LABEL),
+        used in the file names.
+    nBins, percents, chunkRows, nWorkers : optional
+        See magnitude_statistics.
+
+    Returns
+    -------
+    dict
+        Magnitude statistics (see magnitude_statistics).
+
+    """
+
+    check_runLabel(runLabel)
+    statistics = magnitude_statistics(ensemble_path, nBins=nBins, percents=percents,
+                                      chunkRows=chunkRows, nWorkers=nWorkers)
+
+    edges, counts = statistics["histogram"]["edges"], statistics["histogram"]["counts"]
+    magHist_XY = np.column_stack([(edges[1:] + edges[:-1]) / 2, counts])
+
+    np.savetxt(os.path.join(DIR_dM_PDD, maghist_fileName(runLabel, nBins)),
+               magHist_XY, fmt=MAGHIST_FORMAT)
+
+    np.savetxt(os.path.join(DIR_dM_PDD, "MAGPCT_%s.txt" %runLabel),
+               [(percent, *interval) for percent, interval in statistics["intervals"].items()],
+               fmt=["%g", "%.3E", "%.3E"])
+
+    return statistics
+
+
+
+if __name__ == "__main__":
+
+    # Cmd inputs: DIR_dM_PPD and MYRIAM run label (the ENSdM_STGs_<RUN_LABEL>
+    # ensemble is read from DIR_dM_PPD), then optional bins=<int>, percents=68,95,
+    # chunkRows=<int> and nWorkers=<int>
+    options = dict(arg.split("=", 1) for arg in sys.argv[3:])
+
+    statistics = magnitude_histogram(find_ensemble(sys.argv[1], ensemble_stem(sys.argv[2])),
+                                     sys.argv[1], sys.argv[2],
+                                     nBins=int(options.get("bins", DM_MAGHIST_BINS)),
+                                     percents=[float(v) for v in options["percents"].split(",")]
+                                              if "percents" in options else DM_MAG_PERCENT,
+                                     chunkRows=int(options.get("chunkRows", CHUNK_ROWS)),
+                                     nWorkers=int(options.get("nWorkers", 1)))
+
+    for percent, (lower, upper) in statistics["intervals"].items():
+        print("%g%%: %.3E - %.3E N*m" %(percent, lower, upper))
@@ -7,13 +7,15 @@ Created on Tue Sep 20 11:49:16 2022
 
 import os
 import numpy as np
-import pandas as pd
 from pathlib import Path
 import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
 import cartopy.crs as ccrs
-from cartopy.io.shapereader import Reader
 from cartopy.feature import ShapelyFeature
 from cartopy.mpl.ticker import (LongitudeFormatter, LatitudeFormatter)
+from GeometryCache import load_geometries
+from SphericalGeometry import equal_area_histogram
+from AxisLabels import setCartographic_AxisLabels     # Formerly defined here
 
 
 # Main project workspace
@@ -21,86 +23,6 @@ projFolder = Path(__file__).parents[2]
 
 
 
-def setCartographic_AxisLabels(ax):
-    
-    # Ticks range
-    ymin0, ymax0 = ax.get_ylim()
-    xmin0, xmax0 = ax.get_xlim()
-        
-    
-    # Ensure min starts at factor of 5 (if extent is not too small)
-    if ymax0 - ymin0 > 5: 
-        ymin, ymax = np.round( (ymin0-5)/5 ) * 5, ymax0
-    else:
-        ymin, ymax = np.floor(ymin0), np.ceil(ymax0)
-        
-        
-    if xmax0 - xmin0 > 5: 
-        xmin, xmax = np.round( (xmin0-5)/5 ) * 5, xmax0
-    else:
-        xmin, xmax = np.floor(xmin0), np.ceil(xmax0)
-        
-    
-    # Set ticks
-    yTickList = []
-    xTickList = []
-    step_sizes = [10, 5, 2, 1, 0.5]
-
-    for step in step_sizes:
-        yTickList = np.arange(ymin, ymax, step)
-        if len(yTickList) >= 5:
-            break
-        
-    for step in step_sizes:
-        xTickList = np.arange(xmin, xmax, step)
-        if len(xTickList) >= 5:
-            break
-    
-    
-    # Set labels
-    xTickLabels = [""] * len(xTickList)
-    for i in range(len(xTickList)):
-        xtick = xTickList[i]
-        
-        if step >= 1:
-            xTickLabels[i] = "%d$^\circ$" %xtick
-        else:
-            xTickLabels[i] = "%.1f$^\circ$" %xtick
-        
-        if xtick < 0:
-            xTickLabels[i] += "W"
-        elif xtick > 0:
-            xTickLabels[i] += "E"
-            
-            
-    yTickLabels = [""] * len(yTickList)
-    for i in range(len(yTickList)):
-        ytick = yTickList[i]
-        
-        if step >= 1:
-            yTickLabels[i] = "%d$^\circ$" %ytick
-        else:
-            yTickLabels[i] = "%.1f$^\circ$" %ytick
-        
-        if ytick < 0:
-            yTickLabels[i] += "S"
-        elif ytick > 0:
-            yTickLabels[i] += "N" 
-    
-    
-    ax.set(
-        yticks = yTickList,
-        xticks = xTickList,
-        yticklabels = yTickLabels,
-        xticklabels = xTickLabels,
-        ylim = (ymin0, ymax0),
-        xlim = (xmin0, xmax0),
-    )
-
-
-
-
-
 # Workaround low threshold on geodetic lines across the globe
 class LwThOrthographic(ccrs.Orthographic):
 
@@ -110,18 +32,19 @@ class LwThOrthographic(ccrs.Orthographic):
     
     
     
-def globalFeatures(ax, contourPath='', plotGridLines=True):
+def globalFeatures(ax, contourPath='', plotGridLines=True, simplify=0.0):
     
     # Plot global rather than zoom into the extents of any plotted data
     ax.set_global() 
     
     
     # Coastlines
-    ax.add_feature(coastlines_feature(edgecolor='none', facecolor='#E6E6E6', lw=0))
+    ax.add_feature(coastlines_feature(edgecolor='none', facecolor='#E6E6E6', lw=0,
+                                      simplify=simplify))
     
     
     # Plate boundaries
-    ax.add_feature(plateBoundaries_feature())
+    ax.add_feature(plateBoundaries_feature(simplify=simplify))
     
     
     # Specific boundary for given plate
@@ -135,32 +58,43 @@ def globalFeatures(ax, contourPath='', plotGridLines=True):
         
         
 
-def plateBoundaries_feature(edgecolor = '0.25', facecolor='none', lw=0.6):
+def simplified_geometries(shapefilePath, simplify=0.0):
+    
+    # Shapefile geometries, simplified to the given tolerance (degrees) for drafts
+    geometries = load_geometries(shapefilePath)
+    
+    if simplify > 0:
+        geometries = [geometry.simplify(simplify) for geometry in geometries]
+        geometries = [geometry for geometry in geometries if not geometry.is_empty]
+    
+    return geometries
+
+
+
+def plateBoundaries_feature(edgecolor = '0.25', facecolor='none', lw=0.6, simplify=0.0):
     
     # Input shapefile
-    folderPath = 'assets\Shapefiles'
     inputShp_plates = 'PlateBoundaries_PolyLine.shp' 
-    inputShp_plates = os.path.join(projFolder, folderPath, inputShp_plates)
+    inputShp_plates = os.path.join(projFolder, 'assets', 'Shapefiles', inputShp_plates)
 
 
-    # Create Feature
-    shape_feature = ShapelyFeature(Reader(inputShp_plates).geometries(),
+    # Create Feature (geometries are read through the geometry cache)
+    shape_feature = ShapelyFeature(simplified_geometries(inputShp_plates, simplify),
                                    ccrs.PlateCarree(),
                                    edgecolor = edgecolor, facecolor=facecolor, lw=lw)
     return shape_feature
 
 
 
-def coastlines_feature(edgecolor = '#AAAAAA', facecolor='none', lw=0.4):
+def coastlines_feature(edgecolor = '#AAAAAA', facecolor='none', lw=0.4, simplify=0.0):
     
     # Input shapefile
-    folderPath = 'assets\Shapefiles'
     inputShp_coastlines = 'Coastlines_Polygon.shp' 
-    inputShp_coastlines = os.path.join(projFolder, folderPath, inputShp_coastlines)
+    inputShp_coastlines = os.path.join(projFolder, 'assets', 'Shapefiles', inputShp_coastlines)
     
     
-    # Create Feature
-    shape_feature = ShapelyFeature(Reader(inputShp_coastlines).geometries(),
+    # Create Feature (geometries are read through the geometry cache)
+    shape_feature = ShapelyFeature(simplified_geometries(inputShp_coastlines, simplify),
                                     ccrs.PlateCarree(),
                                     edgecolor = edgecolor, facecolor=facecolor, lw=lw)
     return shape_feature
@@ -171,12 +105,12 @@ def plateContour_feature(ax, contourPath,
                          edgecolor = '0.7', lw=0.7):
     
     # Load plate contour
-    contourXY = pd.read_csv(contourPath, delimiter=' ', names=["lon", "lat"])
-    ax.plot(contourXY["lon"], contourXY["lat"], '-', linewidth=lw, color=edgecolor )
+    contourXY = np.loadtxt(contourPath, dtype=np.float64, usecols=(0, 1), ndmin=2)
+    ax.plot(contourXY[:,0], contourXY[:,1], '-', linewidth=lw, color=edgecolor )
     
 
 
-def gridLabels_inside(ax, xLinspace, yLinspace):
+def gridLabels_inside(ax, xLinspace, yLinspace, plotGridLines=True):
     
     ax.set_xticks(xLinspace, crs=ccrs.PlateCarree())
     ax.set_yticks(yLinspace, crs=ccrs.PlateCarree())
@@ -205,6 +139,14 @@ def gridLabels_inside(ax, xLinspace, yLinspace):
     plt.setp(ax.get_xticklabels(), **labelParams)
     plt.setp(ax.get_yticklabels(), ha="right", **labelParams)
     
+    # Plot grid
+    if plotGridLines:
+        gridLines_inside(ax, xLinspace, yLinspace)
+        
+        
+        
+def gridLines_inside(ax, xLinspace, yLinspace):
+    
     # Plot grid
     gridParams = {
         "linewidth" : 0.2, 
@@ -225,5 +167,42 @@ def plot_poles(ax, lat, lon,
     ax.plot(lon, lat, 
             transform=ccrs.PlateCarree(),
             marker='+', color=color, mew = 0.4, 
-            markersize=markersize, linewidth=0) 
-    
\ No newline at end of file
+            markersize=markersize, linewidth=0)
+    
+    
+
+def plot_poleDensity(ax, lat, lon, 
+                     color='black', resolution=1.0, scale='log'):
+    
+    # Bin all poles on an equal-area grid, and crop to the occupied cells
+    counts, lonEdges, latEdges = equal_area_histogram(lat, lon, resolution)
+    rows = np.flatnonzero(counts.any(axis=1))
+    cols = np.flatnonzero(counts.any(axis=0))
+    
+    if len(rows) == 0:
+        return
+    
+    counts = counts[rows[0]:rows[-1]+1, cols[0]:cols[-1]+1]
+    lonEdges = lonEdges[cols[0]:cols[-1]+2]
+    latEdges = latEdges[rows[0]:rows[-1]+2]
+    
+    
+    # Fraction of the ensemble per cell, empty cells left transparent
+    density = np.ma.masked_equal(counts, 0) / len(lat)
+    
+    
+    # Single-colour ramp, so several ensembles can be overlaid
+    cmap = mcolors.LinearSegmentedColormap.from_list(
+        'density_cmap', [mcolors.to_rgba(color, 0.15), mcolors.to_rgba(color, 1.0)])
+    
+    if scale == 'log':
+        norm = mcolors.LogNorm(vmin=density.min(), vmax=density.max())
+    else:
+        norm = mcolors.Normalize(vmin=0, vmax=density.max())
+    
+    
+    # Plot density as one raster layer
+    ax.pcolormesh(lonEdges, latEdges, density, 
+                  transform=ccrs.PlateCarree(),
+                  cmap=cmap, norm=norm, shading='flat',
+                  rasterized=True, zorder=5) 
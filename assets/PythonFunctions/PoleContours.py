@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import sys
+import numpy as np
+
+from SphericalGeometry import cart2sph, sph2cart, rotation_matrix, rotate_points
+from EnsembleFormat import ensemble_chunks, find_ensemble
+from ContourIO import write_contours
+from RunLabels import check_runLabel, ensemble_stem, contour_fileName
+
+
+# Contains
+# 1. pole_histogram
+# 2. confidence_levels
+# 3. marching_squares
+# 4. split_dateline
+# 5. pole_contours
+# 6. ensemble_contours
+
+
+# Python counterpart of Torque_EnsembleStatistics.Pole_Contours (Histogram2D,
+# Extract_ConfidenceLevels2D and Contour.CreateContour in the C# sources).
+# Poles are counted on a regular lon/lat grid; the threshold of a confidence
+# percentage is the smallest bin count such that the bins holding at least
+# that count gather the percentage of the ensemble. Contours are traced
+# halfway between the threshold and the count below it, and written as
+# CNTR<percent>_<RUN_LABEL>_r<step>.txt files (NaN-separated closed rings),
+# named as MYRIAM does (see RunLabels).
+DM_CNTR_PERCENT = [20, 68]
+DM_CNTR_BINS = [4, -180, 180, -90, 90]    # grid step, lon range, lat range
+
+# Oriented marching-squares segments of every cell case (bit 0: lower-left,
+# 1: lower-right, 2: upper-right, 3: upper-left corner above the level), as
+# (from, to) cell edges ("B"ottom, "R"ight, "T"op, "L"eft) with the region
+# above the level on the left. Saddles (5, 10) depend on the cell centre.
+SEGMENTS = {1 : [("B", "L")], 2 : [("R", "B")], 3 : [("R", "L")], 4 : [("T", "R")],
+            6 : [("T", "B")], 7 : [("T", "L")], 8 : [("L", "T")], 9 : [("B", "T")],
+            11 : [("R", "T")], 12 : [("L", "R")], 13 : [("B", "R")], 14 : [("L", "B")]}
+SADDLES = {(5, False) : [("B", "L"), ("T", "R")], (5, True) : [("B", "R"), ("T", "L")],
+           (10, False) : [("R", "B"), ("L", "T")], (10, True) : [("L", "B"), ("R", "T")]}
+
+
+
+def _bin_edges(step, valueMin, valueMax):
+
+    # Equally spaced edges covering [valueMin, valueMax], as Pole_Statistics
+    edges = np.arange(valueMin, valueMax, step, dtype=np.float64)
+
+    if len(edges) == 0 or edges[-1] < valueMax:
+        edges = np.append(edges, edges[-1] + step if len(edges) else valueMin + step)
+
+    return edges
+
+
+
+def pole_histogram(lon, lat, gStep, lonRange=(-180, 180), latRange=(-90, 90), counts=None):
+    """
+    Counts poles on a regular lon/lat grid in a single pass. Poles outside
+    the ranges are ignored; poles on the upper edges fall in the last bins.
+
+    Parameters
+    ----------
+    lon, lat : array
+        Pole coordinates, in degrees.
+    gStep : float
+        Grid step, in degrees.
+    lonRange, latRange : tuple, optional
+        Grid extent. The defaults cover the whole globe.
+    counts : array, optional
+        Counts of previous ensemble blocks, updated in place. The default is
+        None (new counts).
+
+    Returns
+    -------
+    counts : array
+        Number of poles per bin, of shape (nLat, nLon), south to north.
+    lonEdges, latEdges : array
+        Bin edges, in degrees.
+
+    """
+
+    lonEdges = _bin_edges(gStep, *lonRange)
+    latEdges = _bin_edges(gStep, *latRange)
+    nLon, nLat = len(lonEdges) - 1, len(latEdges) - 1
+
+    if counts is None:
+        counts = np.zeros((nLat, nLon), dtype=np.int64)
+
+    lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+
+    iLon = np.floor((lon - lonEdges[0]) / gStep).astype(np.int64)
+    iLat = np.floor((lat - latEdges[0]) / gStep).astype(np.int64)
+    iLon[lon == lonEdges[-1]] = nLon - 1
+    iLat[lat == latEdges[-1]] = nLat - 1
+
+    inside = (iLon >= 0) & (iLon < nLon) & (iLat >= 0) & (iLat < nLat)
+    counts += np.bincount(iLat[inside] * nLon + iLon[inside],
+                          minlength=nLat * nLon).reshape(nLat, nLon)
+
+    return counts, lonEdges, latEdges
+
+
+
+def confidence_levels(counts, percents):
+    """
+    Bin-count thresholds of confidence percentages, from the cumulative sum
+    of the counts sorted in decreasing order.
+
+    Parameters
+    ----------
+    counts : array
+        Histogram counts.
+    percents : list
+        Confidence percentages, e.g. [20, 68].
+
+    Returns
+    -------
+    array
+        Smallest count of the bins enclosing each percentage of the poles.
+
+    """
+
+    sortedCounts = np.sort(np.ravel(counts))[::-1]
+    cumulative = np.cumsum(sortedCounts)
+
+    if cumulative[-1] == 0:
+        raise ValueError("Empty histogram.")
+
+    index = np.searchsorted(cumulative, np.asarray(percents, dtype=np.float64) / 100 * cumulative[-1])
+
+    return sortedCounts[np.minimum(index, len(sortedCounts) - 1)]
+
+
+
+def _walk_cycles(successor):
+
+    # Orders the nodes of a permutation by cycle (pointer jumping): every
+    # cycle starts at its smallest node
+    nNodes = len(successor)
+    nodes = np.arange(nNodes)
+    nSteps = int(np.ceil(np.log2(max(nNodes, 2)))) + 1
+
+    label, pointer = nodes.copy(), successor.copy()
+    for _ in range(nSteps):
+        label = np.minimum(label, label[pointer])
+        pointer = pointer[pointer]
+
+
+    # Break each cycle before its head and rank nodes by distance to the tail
+    pointer = np.where(successor == label, nodes, successor)
+    distance = (pointer != nodes).astype(np.int64)
+
+    for _ in range(nSteps):
+        distance = distance + distance[pointer]
+        pointer = pointer[pointer]
+
+    order = np.lexsort((-distance, label))
+    cycleSizes = np.unique(label, return_counts=True)[1]
+
+    return order, cycleSizes
+
+
+
+def marching_squares(values, x, y, level, wrapX=False):
+    """
+    Traces the closed contours of a grid at a given level. Cells are
+    classified and interpolated all at once; the grid is padded with values
+    below the level so that every contour closes.
+
+    Parameters
+    ----------
+    values : array
+        Grid values of shape (len(y), len(x)).
+    x, y : array
+        Ascending grid coordinates.
+    level : float
+        Contour level.
+    wrapX : bool, optional
+        Treat x as periodic (longitudes covering 360 degrees), so contours
+        continue across the seam. The default is False.
+
+    Returns
+    -------
+    vertices : array
+        Two-column array of x/y vertices, each ring closed (first vertex
+        repeated).
+    offsets : array
+        Ring start indices into vertices, followed by the number of vertices.
+
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    low = min(np.nanmin(values), level) - 1
+    values = np.where(np.isnan(values), low, values)
+
+
+    # Padding (or periodic column) around the grid
+    dx = x[1] - x[0] if len(x) > 1 else 1.0
+    dy = y[1] - y[0] if len(y) > 1 else 1.0
+    y = np.concatenate([[y[0] - dy], y, [y[-1] + dy]])
+
+    if wrapX:
+        values = np.pad(np.hstack([values, values[:, :1]]), ((1, 1), (0, 0)), constant_values=low)
+        x = np.append(x, x[-1] + dx)
+    else:
+        values = np.pad(values, 1, constant_values=low)
+        x = np.concatenate([[x[0] - dx], x, [x[-1] + dx]])
+
+    nY, nX = values.shape
+    above = values >= level
+
+
+    # Edge identifiers: horizontal edges (j, i)-(j, i+1), then vertical
+    # edges (j, i)-(j+1, i); the last column is the first one when wrapping
+    nH = nY * (nX - 1)
+    J, I = np.mgrid[0:nY-1, 0:nX-1]
+
+    vColumn = lambda i: i % (nX - 1) if wrapX else i
+    edges = {"B" : J * (nX - 1) + I, "T" : (J + 1) * (nX - 1) + I,
+             "L" : nH + J * nX + vColumn(I), "R" : nH + J * nX + vColumn(I + 1)}
+
+
+    # Cell cases and oriented segments
+    case = (above[:-1, :-1] * 1 | above[:-1, 1:] * 2 | above[1:, 1:] * 4 | above[1:, :-1] * 8)
+    centreAbove = (values[:-1, :-1] + values[:-1, 1:] + values[1:, 1:] + values[1:, :-1]) / 4 >= level
+
+    starts, ends = [], []
+    for key, segments in list(SEGMENTS.items()) + list(SADDLES.items()):
+        mask = case == key if isinstance(key, int) else (case == key[0]) & (centreAbove == key[1])
+        for start, end in segments:
+            starts.append(edges[start][mask])
+            ends.append(edges[end][mask])
+
+    starts, ends = np.concatenate(starts), np.concatenate(ends)
+
+    if len(starts) == 0:
+        return np.empty((0, 2)), np.zeros(1, dtype=np.int64)
+
+
+    # Crossing point of every edge in use
+    edgeIds = np.unique(starts)
+    isH = edgeIds < nH
+
+    jH, iH = np.divmod(edgeIds[isH], nX - 1)
+    jV, iV = np.divmod(edgeIds[~isH] - nH, nX)
+
+    points = np.empty((len(edgeIds), 2))
+
+    t = (level - values[jH, iH]) / (values[jH, iH + 1] - values[jH, iH])
+    points[isH] = np.column_stack([x[iH] + t * (x[iH + 1] - x[iH]), y[jH]])
+
+    t = (level - values[jV, iV]) / (values[jV + 1, iV] - values[jV, iV])
+    points[~isH] = np.column_stack([x[iV], y[jV] + t * (y[jV + 1] - y[jV])])
+
+
+    # Rings: follow segments from edge to edge
+    successor = np.empty(len(edgeIds), dtype=np.int64)
+    successor[np.searchsorted(edgeIds, starts)] = np.searchsorted(edgeIds, ends)
+
+    order, ringSizes = _walk_cycles(successor)
+
+
+    # Close each ring by repeating its first vertex
+    ringStarts = np.concatenate([[0], np.cumsum(ringSizes)[:-1]])
+    closing = np.insert(order, ringStarts + ringSizes, order[ringStarts])
+
+    offsets = np.zeros(len(ringSizes) + 1, dtype=np.int64)
+    np.cumsum(ringSizes + 1, out=offsets[1:])
+
+    return points[closing], offsets
+
+
+
+def split_dateline(vertices, offsets):
+    """
+    Splits the rings that cross the dateline (jumps of more than 180
+    degrees in longitude) into closed rings on either side of it.
+
+    Parameters
+    ----------
+    vertices : array
+        Two-column array of lon/lat vertices.
+    offsets : array
+        Ring start indices into vertices, followed by the number of vertices.
+
+    Returns
+    -------
+    vertices, offsets : array
+        Rings within [-180, 180] degrees of longitude.
+
+    """
+
+    from shapely.geometry import Polygon, box
+
+    vertices = np.asarray(vertices, dtype=np.float64)
+    rings = np.split(vertices, offsets[1:-1]) if len(offsets) > 1 else []
+
+    if not rings or not np.any(np.abs(np.diff(vertices[:, 0])) > 180):
+        return vertices, offsets
+
+    output = []
+    for ring in rings[:len(offsets) - 1]:
+
+        if len(ring) < 2 or not np.any(np.abs(np.diff(ring[:, 0])) > 180):
+            output.append(ring)
+            continue
+
+        # Continuous longitudes, then one piece per 360-degree window
+        steps = (np.diff(ring[:, 0]) + 180) % 360 - 180
+        unwrapped = np.column_stack([ring[0, 0] + np.concatenate([[0], np.cumsum(steps)]), ring[:, 1]])
+
+        polygon = Polygon(unwrapped)
+        if not polygon.is_valid:
+            polygon = polygon.buffer(0)
+
+        for shift in (-360, 0, 360):
+            piece = polygon.intersection(box(-180 + shift, -90, 180 + shift, 90))
+
+            for part in getattr(piece, "geoms", [piece]):
+                if isinstance(part, Polygon) and not part.is_empty:
+                    output.append(np.asarray(part.exterior.coords) - [shift, 0])
+
+    offsets = np.zeros(len(output) + 1, dtype=np.int64)
+    np.cumsum([len(ring) for ring in output], out=offsets[1:])
+
+    return (np.concatenate(output) if output else np.empty((0, 2))), offsets
+
+
+
+def _mean_rotation(xyz_mean):
+
+    # Rotation bringing the mean pole to (0, 0), as getOptimal_rotMatrix
+    meanLat, meanLon, _ = cart2sph(np.reshape(xyz_mean, (1, 3)))
+    meanLat, meanLon = np.round(meanLat[0], 1), np.round(meanLon[0], 1)
+
+    return rotation_matrix(0, 90, meanLat) @ rotation_matrix(90, 0, -meanLon)
+
+
+
+def pole_contours(lon, lat, percents=DM_CNTR_PERCENT, gStep=DM_CNTR_BINS[0],
+                  lonRange=DM_CNTR_BINS[1:3], latRange=DM_CNTR_BINS[3:5]):
+    """
+    Confidence contours of a pole ensemble.
+
+    Parameters
+    ----------
+    lon, lat : array
+        Pole coordinates, in degrees.
+    percents : list, optional
+        Confidence percentages. The default is DM_CNTR_PERCENT.
+    gStep : float, optional
+        Histogram grid step, in degrees. The default is DM_CNTR_BINS[0].
+    lonRange, latRange : tuple, optional
+        Histogram extent. The defaults cover the whole globe.
+
+    Returns
+    -------
+    dict
+        (vertices, offsets) lon/lat rings for every percentage.
+
+    """
+
+    counts, lonEdges, latEdges = pole_histogram(lon, lat, gStep, lonRange, latRange)
+
+    return _histogram_contours(counts, lonEdges, latEdges, percents)
+
+
+
+def _histogram_contours(counts, lonEdges, latEdges, percents):
+
+    lonCentres = 0.5 * (lonEdges[1:] + lonEdges[:-1])
+    latCentres = 0.5 * (latEdges[1:] + latEdges[:-1])
+    wrapX = lonEdges[-1] - lonEdges[0] >= 360
+
+    contours = {}
+    for percent, level in zip(percents, confidence_levels(counts, percents)):
+
+        vertices, offsets = marching_squares(counts, lonCentres, latCentres, level - 0.5, wrapX)
+        vertices[:, 1] = np.clip(vertices[:, 1], -90, 90)
+
+        if wrapX:
+            vertices[:, 0] = (vertices[:, 0] + 180) % 360 - 180
+
+        contours[percent] = split_dateline(vertices, offsets)
+
+    return contours
+
+
+
+def ensemble_contours(ensemble_path, DIR_dM_PDD, runLabel, percents=DM_CNTR_PERCENT,
+                      bins=DM_CNTR_BINS, rotate=True, chunkRows=1000000):
+    """
+    Confidence contours of the poles of a torque-variation ensemble, saved
+    as MYRIAM does (CNTR<percent>_<RUN_LABEL>_r<step>.txt in DIR_dM_PDD).
+    The ensemble is read block by block.
+
+    Parameters
+    ----------
+    ensemble_path : string
+        Path to the dM ensemble (text or binary, Cartesian).
+    DIR_dM_PDD : string
+        Output folder.
+    runLabel : string
+        MYRIAM run label STGs_<stage1>_<stage2>_<plate>_<model> (RUN_LABEL),
+        used in the file names.
+    percents : list, optional
+        Confidence percentages (DM_CNTR_PERCENT). The default is [20, 68].
+    bins : list, optional
+        Grid step and lon/lat ranges (DM_CNTR_BINS). The default is
+        [4, -180, 180, -90, 90].
+    rotate : bool, optional
+        Contour the ensemble rotated so that its mean pole lies at (0, 0),
+        as MYRIAM does, and rotate the contours back. The default is True.
+    chunkRows : int, optional
+        Ensemble members per block. The default is 1000000.
+
+    Returns
+    -------
+    list
+        Paths to the contour files.
+
+    """
+
+    check_runLabel(runLabel)
+    gStep, lonRange, latRange = bins[0], bins[1:3], bins[3:5]
+
+
+    # Rotation to the mean pole (first pass), histogram (second pass)
+    matrix = np.eye(3)
+
+    if rotate:
+        total, nMembers = np.zeros(3), 0
+        for chunk in ensemble_chunks(ensemble_path, chunkRows):
+            total += chunk[:, :3].sum(axis=0)
+            nMembers += len(chunk)
+        matrix = _mean_rotation(total / max(nMembers, 1))
+
+    counts = None
+    for chunk in ensemble_chunks(ensemble_path, chunkRows):
+        lat, lon, _ = cart2sph(rotate_points(chunk[:, :3], matrix))
+        counts, lonEdges, latEdges = pole_histogram(lon, lat, gStep, lonRange, latRange, counts)
+
+    if counts is None:
+        raise ValueError("Empty ensemble.")
+
+
+    # Contours, rotated back
+    paths = []
+    for percent, (vertices, offsets) in _histogram_contours(counts, lonEdges, latEdges, percents).items():
+
+        if rotate and len(vertices):
+            lat, lon, _ = cart2sph(rotate_points(sph2cart(vertices[:, 1], vertices[:, 0]), matrix.T))
+            vertices, offsets = split_dateline(np.column_stack([lon, lat]), offsets)
+
+        path = os.path.join(DIR_dM_PDD, contour_fileName(percent, runLabel, gStep))
+        write_contours(path, vertices, offsets)
+        paths.append(path)
+
+    return paths
+
+
+
+if __name__ == "__main__":
+
+    # Cmd inputs: DIR_dM_PPD and MYRIAM run label (the ENSdM_STGs_<RUN_LABEL>
+    # ensemble is read from DIR_dM_PPD), then optional percents=20,68,95,
+    # bins=4,-180,180,-90,90 and rotate=0
+    options = dict(arg.split("=", 1) for arg in sys.argv[3:])
+    toList = lambda key, default: [float(v) for v in options[key].split(",")] if key in options else default
+
+    for path in ensemble_contours(find_ensemble(sys.argv[1], ensemble_stem(sys.argv[2])),
+                                  sys.argv[1], sys.argv[2],
+                                  percents=toList("percents", DM_CNTR_PERCENT),
+                                  bins=toList("bins", DM_CNTR_BINS),
+                                  rotate=options.get("rotate", "1") not in ("0", "false", "False")):
+        print(path)
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import sys
+import json
+import time
+import uuid
+import tracemalloc
+from contextlib import contextmanager
+
+
+# Contains
+# 1. profiling_mode
+# 2. start_profile
+# 3. profile_stage
+# 4. finish_profile
+# 5. load_profiles
+# 6. aggregate_profiles
+
+
+# Per-stage instrumentation of the figure scripts, off by default. When on,
+# every stage records its wall time, CPU time and the process memory
+# high-water mark; the records of a run are saved as a JSON sidecar next to
+# each figure (<figure>.profile.json), so production runs can be collected
+# with load_profiles and summarised with aggregate_profiles.
+#
+# Modes (profile input of the scripts, or MYRIAM_PROFILE):
+#   "off"     no instrumentation (also "0", "false" or unset)
+#   "time"    wall time, CPU time and process peak memory (also "1", "true")
+#   "memory"  as "time", plus the peak Python/numpy allocations of each
+#             stage (tracemalloc, which slows allocation-heavy stages down)
+PROFILE_ENV = "MYRIAM_PROFILE"
+PROFILE_MODES = ["off", "time", "memory"]
+SIDECAR_EXTENSION = ".profile.json"
+FORMAT_VERSION = 1
+
+# Profile of the running script, and its open stages
+_activeProfile = None
+_openStages = []
+
+
+
+def profiling_mode(profile=None):
+    """
+    Instrumentation mode ("off", "time" or "memory").
+
+    Parameters
+    ----------
+    profile : string or bool, optional
+        Mode, or True/False. The default is None (the MYRIAM_PROFILE
+        environment variable, or "off" when it is not set).
+
+    Returns
+    -------
+    string
+
+    """
+
+    if profile is None:
+        profile = os.environ.get(PROFILE_ENV, "off")
+
+    if isinstance(profile, bool):
+        return "time" if profile else "off"
+
+    mode = str(profile).strip().lower()
+    mode = {"" : "off", "0" : "off", "false" : "off", "1" : "time", "true" : "time"}.get(mode, mode)
+
+    if mode not in PROFILE_MODES:
+        raise ValueError("Unknown profile mode '%s'. Must be one of: %s."
+                         %(profile, ", ".join(PROFILE_MODES)))
+
+    return mode
+
+
+
+def _max_rss_MB():
+
+    # Process memory high-water mark (not available on Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return maxRss / 2**20 if sys.platform == "darwin" else maxRss / 2**10
+
+
+
+def start_profile(script, args=(), profile=None):
+    """
+    Starts recording the stages of a script run.
+
+    Parameters
+    ----------
+    script : string
+        Script name.
+    args : list, optional
+        Cmd inputs of the run, saved with the records.
+    profile : string or bool, optional
+        Instrumentation mode (see profiling_mode).
+
+    Returns
+    -------
+    dict or None
+        Profile of the run, or None when instrumentation is off.
+
+    """
+
+    global _activeProfile
+
+    mode = profiling_mode(profile)
+    _openStages.clear()
+
+    if mode == "off":
+        _activeProfile = None
+        return None
+
+    ownTracing = mode == "memory" and not tracemalloc.is_tracing()
+    if ownTracing:
+        tracemalloc.start()
+
+    _activeProfile = {"version" : FORMAT_VERSION, "runId" : uuid.uuid4().hex, "script" : script,
+                      "args" : [str(arg) for arg in args], "mode" : mode,
+                      "started" : time.strftime("%Y-%m-%dT%H:%M:%S"), "pid" : os.getpid(),
+                      "stages" : [], "_ownTracing" : ownTracing,
+                      "_t0" : (time.perf_counter(), time.process_time())}
+
+    return _activeProfile
+
+
+
+def _reset_peak(profile):
+
+    # tracemalloc.reset_peak is new in Python 3.9: before, tracing started by
+    # the profile is restarted, so peaks only count allocations made since
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+        return True
+
+    if profile["_ownTracing"]:
+        tracemalloc.stop()
+        tracemalloc.start()
+        return True
+
+    return False
+
+
+
+@contextmanager
+def profile_stage(name, figure=None):
+    """
+    Records a stage of the running script (nothing when instrumentation is
+    off). Stages may be nested; each record names its parent stage.
+
+    Parameters
+    ----------
+    name : string
+        Stage name.
+    figure : string, optional
+        Figure the stage belongs to, when a script saves several. The
+        default is None (shared by all figures of the run).
+
+    """
+
+    profile = _activeProfile
+
+    if profile is None:
+        yield
+        return
+
+    tracing = profile["mode"] == "memory" and tracemalloc.is_tracing()
+    if tracing:
+        if _openStages:
+            _openStages[-1]["peak"] = max(_openStages[-1]["peak"], tracemalloc.get_traced_memory()[1])
+        tracing = _reset_peak(profile)
+
+    stage = {"name" : name, "peak" : 0}
+    parent = _openStages[-1]["name"] if _openStages else None
+    _openStages.append(stage)
+
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+
+    try:
+        yield
+
+    finally:
+        record = {"name" : name, "parent" : parent, "figure" : figure,
+                  "wall_s" : time.perf_counter() - wall0, "cpu_s" : time.process_time() - cpu0,
+                  "maxRss_MB" : _max_rss_MB()}
+
+        _openStages.pop()
+
+        if tracing:
+            peak = max(stage["peak"], tracemalloc.get_traced_memory()[1])
+            record["peakTraced_MB"] = peak / 2**20
+            if _openStages:
+                _openStages[-1]["peak"] = max(_openStages[-1]["peak"], peak)
+
+        profile["stages"].append(record)
+
+
+
+def finish_profile(profile, figpaths):
+    """
+    Stops recording and saves the records next to each figure. Every sidecar
+    holds the shared stages and those of its own figure.
+
+    Parameters
+    ----------
+    profile : dict or None
+        Profile returned by start_profile (None does nothing).
+    figpaths : list
+        Paths to the figures saved by the run.
+
+    Returns
+    -------
+    list
+        Paths to the sidecar files.
+
+    """
+
+    global _activeProfile
+
+    if profile is None:
+        return []
+
+    if profile is _activeProfile:
+        _activeProfile = None
+        _openStages.clear()
+
+    wall0, cpu0 = profile.pop("_t0")
+    profile["wall_s"] = time.perf_counter() - wall0
+    profile["cpu_s"] = time.process_time() - cpu0
+    profile["maxRss_MB"] = _max_rss_MB()
+
+    if profile.pop("_ownTracing"):
+        tracemalloc.stop()
+
+    sidecars = []
+    for figpath in figpaths:
+        figName = os.path.basename(figpath)
+        record = dict(profile, figure=figName,
+                      stages=[stage for stage in profile["stages"] if stage["figure"] in (None, figName)])
+
+        sidecarPath = os.path.splitext(figpath)[0] + SIDECAR_EXTENSION
+        with open(sidecarPath, "w") as datafile_id:
+            json.dump(record, datafile_id, indent=1)
+        sidecars.append(sidecarPath)
+
+    return sidecars
+
+
+
+def load_profiles(paths):
+    """
+    Reads profile sidecars.
+
+    Parameters
+    ----------
+    paths : string or list
+        Folders (searched recursively for *.profile.json files) or sidecar
+        paths.
+
+    Returns
+    -------
+    list
+        One record per sidecar.
+
+    """
+
+    if isinstance(paths, str):
+        paths = [paths]
+
+    sidecarPaths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, fileNames in os.walk(path):
+                sidecarPaths += [os.path.join(folder, fileName) for fileName in sorted(fileNames)
+                                 if fileName.endswith(SIDECAR_EXTENSION)]
+        else:
+            sidecarPaths.append(path)
+
+    records = []
+    for sidecarPath in sidecarPaths:
+        with open(sidecarPath, "r") as datafile_id:
+            records.append(json.load(datafile_id))
+
+    return records
+
+
+
+def aggregate_profiles(records):
+    """
+    Summarises stage records per script and stage. Stages shared by several
+    figures of one run are counted once.
+
+    Parameters
+    ----------
+    records : list
+        Sidecar records, as returned by load_profiles.
+
+    Returns
+    -------
+    list
+        One dict per script and stage with "script", "stage", "count" and
+        the total, mean and largest "wall_s", and the mean "cpu_s" and
+        largest "maxRss_MB".
+
+    """
+
+    seen, groups = set(), {}
+
+    for record in records:
+        for stage in record["stages"]:
+
+            # Shared stages appear in every sidecar of a run
+            key = (record["runId"], stage["name"], stage["figure"], stage["parent"], stage["wall_s"])
+            if key in seen:
+                continue
+            seen.add(key)
+
+            groups.setdefault((record["script"], stage["name"]), []).append(stage)
+
+    summary = []
+    for (script, name), stages in sorted(groups.items()):
+        wall = [stage["wall_s"] for stage in stages]
+        rss = [stage["maxRss_MB"] for stage in stages if stage.get("maxRss_MB") is not None]
+
+        summary.append({"script" : script, "stage" : name, "count" : len(stages),
+                        "wall_s_total" : sum(wall), "wall_s_mean" : sum(wall) / len(wall),
+                        "wall_s_max" : max(wall),
+                        "cpu_s_mean" : sum(stage["cpu_s"] for stage in stages) / len(stages),
+                        "maxRss_MB" : max(rss) if rss else None})
+
+    return summary
+
+
+
+if __name__ == "__main__":
+
+    # Cmd inputs: folders or sidecar files; prints the aggregated stages
+    for entry in aggregate_profiles(load_profiles(sys.argv[1:])):
+        print("%-22s %-24s %5d %10.4f s %10.4f s %10.4f s"
+              %(entry["script"], entry["stage"], entry["count"], entry["wall_s_mean"],
+                entry["wall_s_max"], entry["cpu_s_mean"]))
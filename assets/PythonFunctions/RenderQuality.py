@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import numpy as np
+
+
+# Contains
+# 1. render_tier
+# 2. tier_figpath
+# 3. subsample
+
+
+# Render-quality tiers shared by the figure scripts, with keys:
+#   dpi        resolution of the saved figure
+#   maxPoints  largest number of scatter points/markers drawn (None for all)
+#   simplify   tolerance (degrees) used to simplify the shapefile geometries
+#   suffix     appended to the figure name, so drafts never replace finals
+#   compression  PNG compression level (see FigureEncoding)
+# The final tier reproduces the publication figures; the draft tier is meant
+# for a quick look at a run.
+QUALITY_TIERS = {
+    "final" : {"dpi" : 360, "maxPoints" : None, "simplify" : 0.0, "suffix" : "", "compression" : 6},
+    "draft" : {"dpi" : 72, "maxPoints" : 2000, "simplify" : 0.5, "suffix" : "_draft", "compression" : 1},
+    }
+
+
+# Tier used when a script is not given one explicitly
+QUALITY_ENV = "MYRIAM_QUALITY"
+
+
+
+def render_tier(quality=None):
+    """
+    Settings of a render-quality tier.
+
+    Parameters
+    ----------
+    quality : string, optional
+        "final" or "draft". The default is None (the MYRIAM_QUALITY
+        environment variable, or "final" when it is not set).
+
+    Returns
+    -------
+    dict
+        Tier settings (dpi, maxPoints, simplify, suffix, compression) and
+        its "name".
+
+    """
+
+    if quality is None:
+        quality = os.environ.get(QUALITY_ENV, "final")
+
+    if quality not in QUALITY_TIERS:
+        raise ValueError("Unknown render quality '%s'. Must be one of: %s."
+                         %(quality, ", ".join(QUALITY_TIERS)))
+
+    return dict(QUALITY_TIERS[quality], name=quality)
+
+
+
+def tier_figpath(figpath, tier):
+
+    # Figure path with the tier suffix before the extension
+    root, extension = os.path.splitext(figpath)
+
+    return root + tier["suffix"] + extension
+
+
+
+def subsample(nPoints, tier):
+    """
+    Indices of the points drawn in a tier: all of them, or an unbiased
+    random subset (in the original order) of at most tier["maxPoints"].
+
+    Parameters
+    ----------
+    nPoints : int
+        Number of available points.
+    tier : dict
+        Tier settings, as returned by render_tier.
+
+    Returns
+    -------
+    slice or array
+        Indices to apply to the point arrays.
+
+    """
+
+    maxPoints = tier["maxPoints"]
+
+    if maxPoints is None or nPoints <= maxPoints:
+        return slice(None)
+
+    return np.sort(np.random.default_rng(0).choice(nPoints, maxPoints, replace=False))
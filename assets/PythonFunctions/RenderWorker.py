@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import sys
+import json
+import time
+import socket
+import importlib
+import traceback
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
+from FigureEncoding import start_encoder, take_pending, wait_figures
+from ArrayHandoff import STDIN_SOURCE
+
+
+# Contains
+# 1. load_scripts
+# 2. start_job
+# 3. finish_job
+# 4. run_job
+# 5. serve_stream
+# 6. serve_socket
+
+
+# Figure scripts the worker can run, with the number of cmd inputs each reads
+SCRIPTS = {
+    "ContourMap.py" : 5,
+    "GridMaps.py" : 4,
+    "MagnitudeHistogram.py" : 2,
+    "RotatedEnsembleMap.py" : 6,
+    }
+
+
+
+def load_scripts():
+    """
+    Imports every figure script once, so pandas, matplotlib, cartopy and
+    MapFeatures are loaded a single time for the whole worker session.
+
+    Returns
+    -------
+    dict
+        Imported modules keyed by script name.
+
+    """
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    return {scriptName : importlib.import_module(os.path.splitext(scriptName)[0])
+            for scriptName in SCRIPTS}
+
+
+
+def start_job(modules, job):
+    """
+    Draws the figures of a job, leaving their encoding to the encoder pool
+    when it is running (see FigureEncoding). Errors raised by the script are
+    caught and reported, so one faulty run does not stop the worker.
+
+    Parameters
+    ----------
+    modules : dict
+        Imported modules keyed by script name, as returned by load_scripts.
+    job : dict
+        Job description with keys "script" (e.g. "ContourMap.py") and "args"
+        (list of strings, the same cmd inputs the script reads from sys.argv).
+        Optional keys are "options" (dict of keyword inputs accepted by the
+        script's main, e.g. {"poleMode": "markers"}) and "id", which is echoed
+        back in the reply.
+
+    Returns
+    -------
+    reply : dict
+        Reply, completed by finish_job.
+    pending : list
+        Futures of the figures still being encoded.
+
+    """
+
+    scriptName = job.get("script", "")
+    args = [str(arg) for arg in job.get("args", [])]
+    options = job.get("options", {})
+
+    reply = {"id" : job.get("id"), "script" : scriptName, "outputs" : []}
+
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+
+    try:
+        if scriptName not in modules:
+            raise ValueError("Unknown script '%s'. Must be one of: %s."
+                             %(scriptName, ", ".join(SCRIPTS)))
+
+        if len(args) != SCRIPTS[scriptName]:
+            raise ValueError("Script '%s' expects %d arguments, %d given."
+                             %(scriptName, SCRIPTS[scriptName], len(args)))
+
+        # The worker's stdin carries the job stream (or nothing, in socket mode)
+        if options.get("handoff") == STDIN_SOURCE:
+            raise ValueError("Worker jobs cannot read a '%s' handoff, use 'shm:<name>'."
+                             %STDIN_SOURCE)
+
+        reply["outputs"] = modules[scriptName].main(args, **options)
+        reply["status"] = "ok"
+
+    except Exception as e:
+        reply["status"] = "error"
+        reply["error"] = "%s: %s" %(type(e).__name__, e)
+        traceback.print_exc(file=sys.stderr)
+
+    finally:
+        pending = take_pending()
+        plt.close("all")
+
+    reply["wall_s"] = time.perf_counter() - wall0
+    reply["cpu_s"] = time.process_time() - cpu0
+
+    return reply, pending
+
+
+
+def finish_job(reply, pending):
+    """
+    Waits until the figures of a job started by start_job are saved, and
+    completes its reply. Safe to call from another thread than the drawing
+    one, as it does not use pyplot.
+
+    Parameters
+    ----------
+    reply : dict
+        Reply returned by start_job.
+    pending : list
+        Futures returned by start_job.
+
+    Returns
+    -------
+    dict
+        Reply with keys "id", "script", "status" ("ok" or "error"), "outputs"
+        (list of figure paths), "wall_s" (seconds spent drawing and waiting
+        for the figures), "cpu_s" (seconds spent drawing) and "error" when
+        the job failed.
+
+    """
+
+    wall0 = time.perf_counter()
+
+    try:
+        wait_figures(pending)
+
+    except Exception as e:
+        # Figures of a failed job are not reported
+        if reply["status"] == "ok":
+            reply["status"] = "error"
+            reply["error"] = "%s: %s" %(type(e).__name__, e)
+            traceback.print_exc(file=sys.stderr)
+
+    if reply["status"] != "ok":
+        reply["outputs"] = []
+
+    reply["wall_s"] += time.perf_counter() - wall0
+
+    return reply
+
+
+
+def run_job(modules, job):
+    """
+    Runs a single figure job and reports its outcome once its figures are
+    saved (see start_job and finish_job).
+
+    Returns
+    -------
+    dict
+        Reply, as returned by finish_job.
+
+    """
+
+    return finish_job(*start_job(modules, job))
+
+
+
+def _write_reply(stream_out, reply):
+
+    stream_out.write(json.dumps(reply) + "\n")
+    stream_out.flush()
+
+
+
+def _finish_reply(stream_out, reply, pending):
+
+    _write_reply(stream_out, finish_job(reply, pending))
+
+
+
+def serve_stream(modules, stream_in, stream_out):
+    """
+    Reads one JSON job per line from stream_in and writes one JSON reply per
+    line to stream_out, in the order of the jobs. Blank lines are ignored, and
+    the session ends at the end of the stream or on a {"command": "exit"}
+    line. Each reply is written by a reply thread once the figures of its job
+    are saved, while the next job is read and drawn, so encoding overlaps
+    with drawing whenever the host queues several jobs.
+
+    Parameters
+    ----------
+    modules : dict
+        Imported modules keyed by script name, as returned by load_scripts.
+    stream_in : file object
+        Text stream with the job descriptions.
+    stream_out : file object
+        Text stream for the replies.
+
+    Returns
+    -------
+    None.
+
+    """
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="replies") as replies:
+
+        for line in stream_in:
+
+            if not line.strip():
+                continue
+
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                reply = {"status" : "error", "error" : "Invalid job line: %s" %e}
+                replies.submit(_write_reply, stream_out, reply)
+                continue
+
+            if job.get("command") == "exit":
+                break
+
+            reply, pending = start_job(modules, job)
+            replies.submit(_finish_reply, stream_out, reply, pending)
+
+
+
+def serve_socket(modules, port, host="127.0.0.1"):
+    """
+    Listens on a local TCP socket and serves each connection with the same
+    line protocol as serve_stream. Connections are handled one at a time, as
+    pyplot is not thread-safe.
+
+    Parameters
+    ----------
+    modules : dict
+        Imported modules keyed by script name, as returned by load_scripts.
+    port : int
+        Port to listen on.
+    host : string, optional
+        Interface to bind. The default is the loopback interface.
+
+    Returns
+    -------
+    None.
+
+    """
+
+    with socket.create_server((host, port)) as server:
+        while True:
+            connection, _ = server.accept()
+            with connection, connection.makefile("r") as stream_in, \
+                    connection.makefile("w") as stream_out:
+                serve_stream(modules, stream_in, stream_out)
+
+
+
+if __name__ == "__main__":
+
+    # Cmd inputs: none for stdin mode, or "--port <number>" for socket mode
+    modules = load_scripts()
+    start_encoder()
+
+    if len(sys.argv) == 3 and sys.argv[1] == "--port":
+        serve_socket(modules, int(sys.argv[2]))
+
+    else:
+        serve_stream(modules, sys.stdin, sys.stdout)
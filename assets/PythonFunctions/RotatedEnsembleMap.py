@@ -9,132 +9,186 @@ Created on Mon Oct 17 17:33:47 2022
 import os
 import sys
 import numpy as np
-import pandas as pd
 import cartopy.crs as ccrs
+import matplotlib
 import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-from math import atan2, sqrt
 
 
-from MapFeatures import globalFeatures, gridLabels_inside, plot_poles
-    
+from MapFeatures import plateContour_feature, plot_poles, plot_poleDensity
+from BaseMapCache import basemap_figure, save_basemap_figure
+from SphericalGeometry import cart2sph
+from EnsembleFormat import find_ensemble, load_ensemble
+from RenderQuality import render_tier, tier_figpath
+from ContourIO import split_rings, load_contours, contour_collection
+from ArrayHandoff import handoff_arrays
+from RenderProfile import start_profile, profile_stage, finish_profile
+from FigureEncoding import compression_level
 
-def cart2sph(xyz = []):
-    """ 
-    Transforms cartesian to spherical coordinates
-    """
 
-    x = xyz.iloc[:,0]
-    y = xyz.iloc[:,1]
-    z = xyz.iloc[:,2]
 
+def main(args, poleMode="markers", nSamples=0, densityRes=1.0, densityScale="log",
+         quality=None, profile=None, bbox=None, handoff=None):
+    """
+    Plots the torque-variation pole ensembles and their 68% contours. The
+    optional inputs can also be given as trailing key=value cmd inputs.
+
+    Parameters
+    ----------
+    args : list
+        Cmd inputs: plate label, model stages, DIR_TMP, DIR_MTX_w2M,
+        DIR_dM_PPD and run label.
+    poleMode : string, optional
+        "markers" plots individual poles, "density" shades the pole density
+        of the whole ensemble on an equal-area grid. The default is
+        "markers".
+    nSamples : int, optional
+        Number of poles drawn at random from each ensemble. 0 uses all
+        poles for "density" and 10000 for "markers".
+    densityRes : float, optional
+        Longitude step of the density grid, in degrees.
+    densityScale : string, optional
+        Colour scale of the density layer, "log" or "linear".
+    quality : string, optional
+        Render tier, "final" or "draft" (see RenderQuality). The default is
+        None (MYRIAM_QUALITY environment variable, else "final").
+    profile : string, optional
+        Per-stage instrumentation, "off", "time" or "memory" (see
+        RenderProfile). The default is None (MYRIAM_PROFILE environment
+        variable, else "off").
+    bbox : string, optional
+        Fixed crop "x0,y0,x1,y1" in inches, used instead of the tight
+        bounding box when the layout is known. The default is None.
+    handoff : string, optional
+        Source of the ensembles and contours handed over by the host instead
+        of the DIR_TMP files, "stdin" (direct runs only) or "shm:<name>"
+        (see ArrayHandoff). Arrays missing from the handoff (ENSdM, ENSdM_ROT, CNTR_68 and
+        CNTR_ROT_68) are read from DIR_TMP. The default is None.
+
+    Returns
+    -------
+    list
+        Path to the saved figure.
 
-    # Set lat, lon empty lists
-    lat = []
-    lon = []    
-           
-        
-    # Iterate and extend lists
-    lat.extend( [atan2(Az, sqrt(Ax**2 + Ay**2)) for Ax, Ay, Az in zip(x,y,z)] )
-    lon.extend( [atan2(Ay, Ax) for Ax, Ay in zip(x,y)] )
+    """
 
-    
-    # Turns lat, lon output from radians to degrees        
-    lat = list(np.degrees(lat))
-    lon = list(np.degrees(lon))
-        
-    return lat, lon
+    # Cmd inputs
+    plateAccronym = args[0]
+    modelStages = args[1]
+    TMP_Dir = args[2]
+    MTX_w2M_Dir = args[3]
+    dM_PDD_Dir = args[4]
+    runLabel = args[5]
 
+    nSamples = int(nSamples)
+    densityRes = float(densityRes)
 
-# Cmd inputs
-plateAccronym = sys.argv[1]
-modelStages = sys.argv[2]
-TMP_Dir = sys.argv[3]
-MTX_w2M_Dir = sys.argv[4]
-dM_PDD_Dir = sys.argv[5]
-runLabel = sys.argv[6]
+    if poleMode not in ("density", "markers"):
+        raise ValueError("Input poleMode must be 'density' or 'markers'.")
 
+    if poleMode == "markers" and nSamples == 0:
+        nSamples = 10000
 
-# Plate contour path
-contourName = "BDR_%s_%s.txt" %(plateAccronym, modelStages)
-contourPath = os.path.join(MTX_w2M_Dir, contourName)
+    tier = render_tier(quality)
+    profiler = start_profile("RotatedEnsembleMap", args, profile)
+    if poleMode == "markers" and tier["maxPoints"] is not None:
+        nSamples = min(nSamples, tier["maxPoints"])
 
 
-# Set Figure
-fig = plt.figure(constrained_layout=True, figsize=(9,9), dpi=360 )    
-ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    # Plate contour path
+    contourName = "BDR_%s_%s.txt" %(plateAccronym, modelStages)
+    contourPath = os.path.join(MTX_w2M_Dir, contourName)
 
 
-# Plot plate and continent contours
-globalFeatures(ax, contourPath, plotGridLines=False)
+    # Set Figure over the cached base map (continent contours, plate boundaries and grid lines)
+    xLinspace = np.arange(-180, 181, 20)[1:-1]
+    yLinspace = np.arange(-90, 91, 15)[1:-1]
+    with profile_stage("basemap_figure"):
+        fig, ax = basemap_figure(xLinspace, yLinspace, figsize=(9,9), dpi=tier["dpi"],
+                                 simplify=tier["simplify"])
 
 
-# Plot grid lines
-xLinspace = np.arange(-180, 181, 20)[1:-1]
-yLinspace = np.arange(-90, 91, 15)[1:-1]
-gridLabels_inside(ax, xLinspace, yLinspace)
+    # Plot plate contour
+    with profile_stage("plateContour_feature"):
+        plateContour_feature(ax, contourPath, edgecolor = '0.7', lw=1.7)
 
 
-# Load contours and ensembles
-cntrNML_fileName = "CNTR_68.txt" 
-cntrROT_fileName = "CNTR_ROT_68.txt" 
-ensNML_fileName = "ENSdM.txt" 
-ensROT_fileName = "ENSdM_ROT.txt" 
+    # Load contours and ensembles
+    cntrNML_fileName = "CNTR_68.txt"
+    cntrROT_fileName = "CNTR_ROT_68.txt"
 
-cntrNML_path = os.path.join(TMP_Dir, cntrNML_fileName)
-cntrROT_path = os.path.join(TMP_Dir, cntrROT_fileName)
-ensNML_path = os.path.join(TMP_Dir, ensNML_fileName)
-ensROT_path = os.path.join(TMP_Dir, ensROT_fileName)
+    cntrNML_path = os.path.join(TMP_Dir, cntrNML_fileName)
+    cntrROT_path = os.path.join(TMP_Dir, cntrROT_fileName)
+    ensNML_path = find_ensemble(TMP_Dir, "ENSdM")   # Binary (.ens) or text (.txt)
+    ensROT_path = find_ensemble(TMP_Dir, "ENSdM_ROT")
 
-cntrNML = pd.read_csv(cntrNML_path, delimiter=' ', header=None, names=["lon", "lat"])
-cntrROT = pd.read_csv(cntrROT_path, delimiter=' ', header=None, names=["lon", "lat"])
-ensNML = pd.read_csv(ensNML_path, delimiter=' ', header=None, names=["x", "y", "z"])
-ensROT = pd.read_csv(ensROT_path, delimiter=' ', header=None, names=["x", "y", "z"])
+    with profile_stage("handoff"):
+        handedOver = handoff_arrays(handoff)
 
+    with profile_stage("load_contours"):
+        cntrNML = split_rings(handedOver["CNTR_68"]) if "CNTR_68" in handedOver else load_contours(cntrNML_path)
+        cntrROT = split_rings(handedOver["CNTR_ROT_68"]) if "CNTR_ROT_68" in handedOver else load_contours(cntrROT_path)
 
+    with profile_stage("load_ensemble"):
+        ensNML = handedOver["ENSdM"] if "ENSdM" in handedOver else load_ensemble(ensNML_path)[0]
+        ensROT = handedOver["ENSdM_ROT"] if "ENSdM_ROT" in handedOver else load_ensemble(ensROT_path)[0]
 
-if ensNML["x"][0] == ensROT["x"][0]:
-    plt.title('Torque-variation pole', fontsize=13, pad=10)
-    ensList = [ensNML]
-    cntrList = [cntrNML]
 
-else:
-    plt.title('Torque-variation pole: Original (red) vs Rotated (blue)', fontsize=13, pad=10)
-    ensList = [ensROT, ensNML]
-    cntrList = [cntrROT, cntrNML]
 
+    if ensNML[0,0] == ensROT[0,0]:
+        plt.title('Torque-variation pole', fontsize=13, pad=10)
+        ensList = [ensNML]
+        cntrList = [cntrNML]
 
-# Plot ensemble
-for ensemble, colour in zip(ensList, ['cornflowerblue', 'indianred']):
-    
-    # Plot poles
-    if len(ensemble) > 10000:
-        ensLat, ensLon = cart2sph(xyz = ensemble[['x','y','z']][:10000])
-    
     else:
-        ensLat, ensLon = cart2sph(xyz = ensemble[['x','y','z']])
-        
-        
-    plot_poles(ax, ensLat, ensLon, color=colour)
-    
-    
-# Plot contour
-for contour, colour in zip(cntrList, ['blue', 'firebrick']):
-    
-    # Split Dataframes where nan rows appear (when multiple contours are stacked)
-    contour["cntrNr"] = contour.isnull().all(axis=1).cumsum()
-    
-    for n, rows in contour.groupby("cntrNr").groups.items():
-        
-        indCntr = contour.iloc[rows].drop(columns="cntrNr", axis=1).dropna()
-    
-        poly = mpatches.Polygon(indCntr, closed=True, ec=colour, fill=False, 
-                                lw=0.8, fc=None, transform=ccrs.PlateCarree(), zorder=9)
-        ax.add_patch(poly)
-        
-        
-        
-# Save figure as png
-figName = "MAP_ROTATED_CNTR68_%s.png" %runLabel
-figpath = os.path.join(dM_PDD_Dir, figName)       
-plt.savefig(figpath, bbox_inches='tight', dpi=360)
+        plt.title('Torque-variation pole: Original (red) vs Rotated (blue)', fontsize=13, pad=10)
+        ensList = [ensROT, ensNML]
+        cntrList = [cntrROT, cntrNML]
+
+
+    # Plot ensemble
+    for ensemble, colour in zip(ensList, ['cornflowerblue', 'indianred']):
+
+        # Draw an unbiased random subset (rather than the head of the file)
+        xyz = ensemble[:, :3]
+
+        if 0 < nSamples < len(xyz):
+            xyz = xyz[np.sort(np.random.default_rng(0).choice(len(xyz), nSamples, replace=False))]
+
+        with profile_stage("cart2sph"):
+            ensLat, ensLon, _ = cart2sph(xyz)
+
+
+        # Plot poles
+        with profile_stage("plot_poles"):
+            if poleMode == "density":
+                plot_poleDensity(ax, ensLat, ensLon, color=colour,
+                                 resolution=densityRes, scale=densityScale)
+            else:
+                plot_poles(ax, ensLat, ensLon, color=colour)
+
+
+    # Plot contours (all rings as one collection)
+    contours = [{"vertices" : vertices, "offsets" : offsets, "edgecolor" : colour, "linewidth" : 0.8}
+                for (vertices, offsets), colour in zip(cntrList, ['blue', 'firebrick'])]
+
+    with profile_stage("contour_collection"):
+        ax.add_collection(contour_collection(contours, transform=ccrs.PlateCarree(), zorder=9))
+
+
+
+    # Save figure as png
+    figName = "MAP_ROTATED_CNTR68_%s.png" %runLabel
+    figpath = tier_figpath(os.path.join(dM_PDD_Dir, figName), tier)
+    with profile_stage("save_basemap_figure"):
+        save_basemap_figure(fig, figpath, bbox=bbox, compression=compression_level(tier))
+    plt.close(fig)
+
+    finish_profile(profiler, [figpath])
+
+    return [figpath]
+
+
+
+if __name__ == "__main__":
+    matplotlib.use("Agg")
+    main(sys.argv[1:7], **dict(arg.split("=", 1) for arg in sys.argv[7:]))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import re
+
+
+# Contains
+# 1. parse_runLabel
+# 2. check_runLabel
+# 3. number_label
+# 4. ensemble_stem
+# 5. vector_fileName
+# 6. contour_fileName
+# 7. maghist_fileName
+
+
+# Output names of a run, as MYRIAM builds them (src/MYRIAM.Management/
+# Manage_OutputLabels.cs and src/TorqueVariation.cs), so the files written by
+# the Python engines and by MYRIAM describe the same run:
+#   ENSdM_STGs_<RUN_LABEL>, VECdM_STGs_<RUN_LABEL>.txt
+#   CNTR<percent>_<RUN_LABEL>_r<step>.txt
+#   MAGHIST_<RUN_LABEL>_<nBins>.txt
+# RUN_LABEL is the label of Set_Run_Label, which already starts with STGs_.
+
+
+# Run labels are built by MYRIAM as STGs_<stage1>_<stage2>_<plate>_<model>,
+# and model labels always start with A<muA>_M<muM>
+RUN_LABEL_PATTERN = re.compile(r"^STGs_(\d+)_(\d+)_(.+?)_(A[^_]+_M.+)$")
+
+
+
+def parse_runLabel(runLabel):
+    """
+    Splits a run label into its model stages, plate label and model label.
+
+    Parameters
+    ----------
+    runLabel : string
+        Run label, e.g. "STGs_0_1_AT_A5_M15_HL180_GLBL_fHA1p0_D0".
+
+    Returns
+    -------
+    tuple
+        Model stages (e.g. "0_1"), plate label and model label, or None if
+        runLabel does not follow the MYRIAM naming.
+
+    """
+
+    match = RUN_LABEL_PATTERN.match(runLabel)
+
+    if match is None:
+        return None
+
+    stage1, stage2, plateLabel, modelLabel = match.groups()
+
+    return "%s_%s" %(stage1, stage2), plateLabel, modelLabel
+
+
+
+def check_runLabel(runLabel):
+    """
+    Raises a ValueError when runLabel is not a MYRIAM run label (see
+    parse_runLabel), e.g. when its STGs_ prefix is missing.
+
+    Returns
+    -------
+    string
+        runLabel.
+
+    """
+
+    if parse_runLabel(runLabel) is None:
+        raise ValueError("Run label '%s' does not follow the MYRIAM naming "
+                         "STGs_<stage1>_<stage2>_<plate>_A<muA>_M<muM>..." %runLabel)
+
+    return runLabel
+
+
+
+def number_label(value):
+    """
+    Number as written in MYRIAM file names, with "p" as decimal point
+    (e.g. 2.5 -> "2p5", 68.0 -> "68").
+    """
+
+    return ("%g" %value).replace(".", "p")
+
+
+
+def ensemble_stem(runLabel):
+    """
+    Name of the dM ensemble of a run, without extension (TorqueVariation.cs).
+    """
+
+    return "ENSdM_STGs_%s" %check_runLabel(runLabel)
+
+
+
+def vector_fileName(runLabel):
+    """
+    Name of the dM mean-vector file of a run (TorqueVariation.cs).
+    """
+
+    return "VECdM_STGs_%s.txt" %check_runLabel(runLabel)
+
+
+
+def contour_fileName(percent, runLabel, gStep):
+    """
+    Name of the confidence-contour file of a run
+    (Set_ContourCoordinates_FileName).
+    """
+
+    return "CNTR%s_%s_r%s.txt" %(number_label(percent), check_runLabel(runLabel), number_label(gStep))
+
+
+
+def maghist_fileName(runLabel, nBins):
+    """
+    Name of the magnitude-histogram file of a run
+    (Set_MagnitudeHistogram_FileName).
+    """
+
+    return "MAGHIST_%s_%d.txt" %(check_runLabel(runLabel), nBins)
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import numpy as np
+
+
+# Contains
+# 1. cart2sph
+# 2. sph2cart
+# 3. great_circle_distance
+# 4. azimuth
+# 5. rotation_matrix
+# 6. rotate_points
+# 7. equal_area_histogram
+
+
+# All functions work on whole arrays at once (no per-element Python loops)
+# and return C-contiguous float64 arrays. Angles are in degrees.
+
+
+
+def _as_xyz(xyz):
+
+    xyz = np.asarray(xyz, dtype=np.float64)
+
+    if xyz.ndim != 2 or xyz.shape[1] != 3:
+        raise ValueError("Input xyz must be a three-column array.")
+
+    return xyz
+
+
+
+def cart2sph(xyz):
+    """
+    Transforms cartesian to spherical coordinates.
+
+    Parameters
+    ----------
+    xyz : array
+        Three-column array of cartesian coordinates (x, y, z).
+
+    Returns
+    -------
+    lat : array
+        Latitudes in degrees.
+    lon : array
+        Longitudes in degrees, within [-180, 180].
+    mag : array
+        Vector magnitudes, in the units of xyz.
+
+    """
+
+    xyz = _as_xyz(xyz)
+    x, y, z = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+
+    hyp = np.hypot(x, y)
+
+    lat = np.degrees(np.arctan2(z, hyp))
+    lon = np.degrees(np.arctan2(y, x))
+    mag = np.hypot(hyp, z)
+
+    return lat, lon, mag
+
+
+
+def sph2cart(lat, lon, mag=1.0):
+    """
+    Transforms spherical to cartesian coordinates.
+
+    Parameters
+    ----------
+    lat : array
+        Latitudes in degrees.
+    lon : array
+        Longitudes in degrees.
+    mag : array or float, optional
+        Vector magnitudes. The default is 1.0 (unit vectors).
+
+    Returns
+    -------
+    array
+        Three-column array of cartesian coordinates (x, y, z).
+
+    """
+
+    lat, lon, mag = np.broadcast_arrays(np.radians(lat), np.radians(lon),
+                                        np.asarray(mag, dtype=np.float64))
+
+    xyz = np.empty(lat.shape + (3,))
+    cosLat = np.cos(lat)
+
+    xyz[..., 0] = mag * cosLat * np.cos(lon)
+    xyz[..., 1] = mag * cosLat * np.sin(lon)
+    xyz[..., 2] = mag * np.sin(lat)
+
+    return xyz
+
+
+
+def great_circle_distance(lat1, lon1, lat2, lon2):
+    """
+    Angular distance between points along the great circle, using the Vincenty
+    formula (accurate for both small and antipodal separations). Inputs are
+    broadcast against each other.
+
+    Parameters
+    ----------
+    lat1, lon1 : array
+        Coordinates of the first points, in degrees.
+    lat2, lon2 : array
+        Coordinates of the second points, in degrees.
+
+    Returns
+    -------
+    array
+        Angular distances in degrees.
+
+    """
+
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    dLon = lon2 - lon1
+
+    cosLat2 = np.cos(lat2)
+    num = np.hypot(cosLat2 * np.sin(dLon),
+                   np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * cosLat2 * np.cos(dLon))
+    den = np.sin(lat1) * np.sin(lat2) + np.cos(lat1) * cosLat2 * np.cos(dLon)
+
+    return np.ascontiguousarray(np.degrees(np.arctan2(num, den)))
+
+
+
+def azimuth(lat1, lon1, lat2, lon2):
+    """
+    Initial bearing of the great circle from the first to the second points.
+    Inputs are broadcast against each other.
+
+    Parameters
+    ----------
+    lat1, lon1 : array
+        Coordinates of the first points, in degrees.
+    lat2, lon2 : array
+        Coordinates of the second points, in degrees.
+
+    Returns
+    -------
+    array
+        Azimuths in degrees, clockwise from north within [0, 360).
+
+    """
+
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    dLon = lon2 - lon1
+
+    y = np.sin(dLon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dLon)
+
+    return np.ascontiguousarray(np.mod(np.degrees(np.arctan2(y, x)), 360.0))
+
+
+
+def rotation_matrix(poleLat, poleLon, angle):
+    """
+    Rotation matrix for a finite rotation about an Euler pole (right-hand
+    rule, positive angles are counter-clockwise seen from above the pole).
+
+    Parameters
+    ----------
+    poleLat, poleLon : float
+        Coordinates of the rotation pole, in degrees.
+    angle : float
+        Rotation angle, in degrees.
+
+    Returns
+    -------
+    array
+        3x3 rotation matrix.
+
+    """
+
+    ux, uy, uz = sph2cart(poleLat, poleLon)
+    theta = np.radians(angle)
+
+    cross = np.array([[0, -uz, uy],
+                      [uz, 0, -ux],
+                      [-uy, ux, 0]])
+
+    return np.eye(3) + np.sin(theta) * cross + (1 - np.cos(theta)) * (cross @ cross)
+
+
+
+def rotate_points(xyz, matrix):
+    """
+    Applies a rotation matrix to a set of cartesian vectors.
+
+    Parameters
+    ----------
+    xyz : array
+        Three-column array of cartesian coordinates (x, y, z).
+    matrix : array
+        3x3 rotation matrix, e.g. from rotation_matrix.
+
+    Returns
+    -------
+    array
+        Three-column array of rotated coordinates.
+
+    """
+
+    return np.ascontiguousarray(_as_xyz(xyz) @ np.asarray(matrix).T)
+
+
+
+def equal_area_histogram(lat, lon, resolution=1.0):
+    """
+    Counts points on an equal-area spherical grid in a single pass. Cells are
+    uniform in longitude and in the sine of latitude, so every cell covers the
+    same surface (latitude bands get taller towards the poles).
+
+    Parameters
+    ----------
+    lat, lon : array
+        Coordinates of the points, in degrees.
+    resolution : float, optional
+        Longitude step in degrees. The number of latitude bands is set so
+        that cells are square at the equator. The default is 1.0.
+
+    Returns
+    -------
+    counts : array
+        Number of points per cell, of shape (nLat, nLon), south to north.
+    lonEdges : array
+        Longitude cell edges in degrees.
+    latEdges : array
+        Latitude cell edges in degrees.
+
+    """
+
+    nLon = int(round(360.0 / resolution))
+    nLat = int(round(360.0 / (np.pi * resolution)))
+
+    sinLat = np.sin(np.radians(np.asarray(lat, dtype=np.float64)))
+    lon = np.mod(np.asarray(lon, dtype=np.float64) + 180.0, 360.0)
+
+    iLat = np.minimum(((sinLat + 1.0) * 0.5 * nLat).astype(np.int64), nLat - 1)
+    iLon = np.minimum((lon / 360.0 * nLon).astype(np.int64), nLon - 1)
+
+    counts = np.bincount(iLat * nLon + iLon, minlength=nLat * nLon).reshape(nLat, nLon)
+
+    lonEdges = np.linspace(-180.0, 180.0, nLon + 1)
+    latEdges = np.degrees(np.arcsin(np.linspace(-1.0, 1.0, nLat + 1)))
+
+    return counts, lonEdges, latEdges
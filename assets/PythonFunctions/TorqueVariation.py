@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+
+# Public dependencies
+import os
+import sys
+import numpy as np
+
+from EnsembleFormat import ensemble_chunks, write_ensemble_chunks, BINARY_EXTENSION
+from EulerVectorEnsemble import load_stage, ensemble_blocks
+from SphericalGeometry import cart2sph
+from RunLabels import ensemble_stem, vector_fileName
+
+
+# Contains
+# 1. load_matrix
+# 2. torque_variation
+# 3. ensemble_mean
+# 4. calculate_dM
+
+
+# Python counterpart of TorqueVariation.Calculate_dM (src/TorqueVariation.cs):
+#   dM = MTX_w2M * (EVy - EVo) * unitsTransformer
+# applied to a whole block of ensemble members at once, with EVy/EVo in
+# deg/Myr (Cartesian) and dM in N*m. Outputs follow the MYRIAM layout, named
+# after the run label of MYRIAM (RUN_LABEL, STGs_<stage1>_<stage2>_...):
+#   ENSdM_STGs_<RUN_LABEL>.txt   one "x y z" row per ensemble member
+#   VECdM_STGs_<RUN_LABEL>.txt   x y z lon lat magnitude C11 C12 C13 C22 C23 C33
+# Single-line stage inputs are sampled on the fly (see EulerVectorEnsemble).
+UNITS_TRANSFORMER = np.pi / 180 / (1e6 * 365 * 24 * 60 * 60)   # deg/Myr to rad/s
+
+# Number format of the text outputs (same precision as MYRIAM's "#.###E+0")
+TEXT_FORMAT = "%.3E"
+
+# Ensemble members processed per block
+CHUNK_ROWS = 1000000
+
+
+
+def load_matrix(path):
+    """
+    Reads a 3x3 transformation matrix (MTX_w2M_<model>.txt).
+    """
+
+    matrix = np.loadtxt(path, dtype=np.float64, comments="!", ndmin=2)
+
+    if matrix.shape != (3, 3):
+        raise ValueError("%s is not a 3x3 matrix (shape %s)." %(path, matrix.shape))
+
+    return matrix
+
+
+
+def torque_variation(MTX_w2M, EVy, EVo=None):
+    """
+    Torque variation of an ensemble of Euler-vector changes.
+
+    Parameters
+    ----------
+    MTX_w2M : array
+        Transformation matrix of shape (3, 3).
+    EVy : array
+        Young Euler vectors of shape (n, 3), Cartesian, in deg/Myr.
+    EVo : array, optional
+        Old Euler vectors, same shape as EVy. The default is None (EVy already
+        holds the Euler-vector change).
+
+    Returns
+    -------
+    array
+        Torque-variation vectors of shape (n, 3), Cartesian, in N*m.
+
+    """
+
+    dEV = np.asarray(EVy, dtype=np.float64)
+
+    if EVo is not None:
+        dEV = dEV - np.asarray(EVo, dtype=np.float64)
+
+    return (dEV * UNITS_TRANSFORMER) @ np.asarray(MTX_w2M, dtype=np.float64).T
+
+
+
+def _merge_moments(moments, chunk):
+
+    # Running count, mean and sum of squared deviations (pairwise update)
+    n, mean, M2 = moments
+    nChunk = len(chunk)
+
+    if nChunk == 0:
+        return moments
+
+    meanChunk = chunk.mean(axis=0)
+    deviation = chunk - meanChunk
+    M2Chunk = deviation.T @ deviation
+
+    delta = meanChunk - mean
+    nTotal = n + nChunk
+
+    return (nTotal, mean + delta * nChunk / nTotal,
+            M2 + M2Chunk + np.outer(delta, delta) * n * nChunk / nTotal)
+
+
+
+def ensemble_mean(chunks):
+    """
+    Mean vector and covariance of an ensemble, as in
+    Ensemble_Statistics.EnsembleMean (population covariance).
+
+    Parameters
+    ----------
+    chunks : array or iterable
+        Ensemble of shape (n, 3), or a sequence of such blocks.
+
+    Returns
+    -------
+    array
+        x, y, z, lon (deg), lat (deg), magnitude and the covariance elements
+        C11, C12, C13, C22, C23, C33.
+
+    """
+
+    if isinstance(chunks, np.ndarray):
+        chunks = [chunks]
+
+    moments = (0, np.zeros(3), np.zeros((3, 3)))
+    for chunk in chunks:
+        moments = _merge_moments(moments, np.asarray(chunk, dtype=np.float64))
+
+    return _mean_vector(moments)
+
+
+
+def _mean_vector(moments):
+
+    n, (x, y, z), M2 = moments
+
+    if n == 0:
+        raise ValueError("Empty ensemble.")
+
+    cov = M2 / n
+    lat, lon, mag = np.ravel(cart2sph([[x, y, z]]))
+
+    return np.array([x, y, z, lon, lat, mag,
+                     cov[0,0], cov[0,1], cov[0,2], cov[1,1], cov[1,2], cov[2,2]])
+
+
+
+def _is_stage(path):
+
+    # Single-line inputs hold an Euler-vector stage, not an ensemble
+    firstRows = next(ensemble_chunks(path, 2), np.empty((0, 3)))
+
+    return len(firstRows) == 1
+
+
+
+def _rechunk(blocks, chunkRows):
+
+    # Blocks of exactly chunkRows rows (but the last one)
+    pending, nPending = [], 0
+
+    for block in blocks:
+        pending.append(block)
+        nPending += len(block)
+
+        while nPending >= chunkRows:
+            joined = np.concatenate(pending)
+            yield joined[:chunkRows]
+            pending, nPending = [joined[chunkRows:]], nPending - chunkRows
+
+    if nPending:
+        yield np.concatenate(pending)
+
+
+
+def _EV_chunks(path, chunkRows, seed):
+
+    # Ensemble read from disk, or sampled from a stage line
+    if _is_stage(path):
+        return _rechunk(ensemble_blocks(load_stage(path), seed), chunkRows)
+
+    return ensemble_chunks(path, chunkRows)
+
+
+
+def _dM_chunks(MTX_w2M, EVy_path, EVo_path, chunkRows, moments, seed):
+
+    # Torque-variation blocks, updating the ensemble moments on the way
+    EVy_chunks = _EV_chunks(EVy_path, chunkRows, [seed, 0])
+    EVo_chunks = _EV_chunks(EVo_path, chunkRows, [seed, 1]) if EVo_path else None
+
+    for EVy in EVy_chunks:
+        EVo = next(EVo_chunks, None) if EVo_chunks is not None else None
+
+        if EVo_chunks is not None and (EVo is None or len(EVo) != len(EVy)):
+            raise ValueError("Old and young ensemble are not the same length.")
+
+        dM = torque_variation(MTX_w2M, EVy[:, :3], None if EVo is None else EVo[:, :3])
+        moments[0] = _merge_moments(moments[0], dM)
+
+        yield dM
+
+    if EVo_chunks is not None and next(EVo_chunks, None) is not None:
+        raise ValueError("Old and young ensemble are not the same length.")
+
+
+
+def calculate_dM(MTX_path, EVy_path, EVo_path=None, DIR_dM_PDD=None, runLabel=None,
+                 saveEnsemble=True, binary=False, chunkRows=CHUNK_ROWS, seed=None):
+    """
+    Computes the torque-variation ensemble of a run and saves it as MYRIAM
+    does (ENSdM/VECdM files). Ensembles are processed in blocks of chunkRows
+    members, so they may be larger than the available memory.
+
+    Parameters
+    ----------
+    MTX_path : string
+        Path to the transformation matrix (MTX_w2M_<model>.txt).
+    EVy_path : string
+        Path to the young Euler-vector ensemble (text or binary), Cartesian,
+        in deg/Myr, or to a single-line stage file to sample it from.
+    EVo_path : string, optional
+        Path to the old Euler-vector ensemble (or stage file). The default is
+        None (EVy holds the Euler-vector change).
+    DIR_dM_PDD : string, optional
+        Output folder. The default is None (return the mean vector only).
+    runLabel : string, optional
+        MYRIAM run label STGs_<stage1>_<stage2>_<plate>_<model> (RUN_LABEL),
+        used in the file names as MYRIAM does (see RunLabels). Required when
+        DIR_dM_PDD is given.
+    saveEnsemble : bool, optional
+        Save the dM ensemble. The default is True.
+    binary : bool, optional
+        Save the dM ensemble in the binary format (.ens) instead of text. The
+        default is False.
+    chunkRows : int, optional
+        Ensemble members per block. The default is CHUNK_ROWS.
+    seed : int, optional
+        Seed of the ensembles sampled from stage files. The default is None
+        (fresh entropy).
+
+    Returns
+    -------
+    array
+        dM mean vector, as saved in VECdM (see ensemble_mean).
+
+    """
+
+    if DIR_dM_PDD is not None and runLabel is None:
+        raise ValueError("A runLabel is required to name the outputs in DIR_dM_PDD.")
+
+    if DIR_dM_PDD is not None:
+        ensemblePath = os.path.join(DIR_dM_PDD, ensemble_stem(runLabel) + (BINARY_EXTENSION if binary else ".txt"))
+        vectorPath = os.path.join(DIR_dM_PDD, vector_fileName(runLabel))
+
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    MTX_w2M = load_matrix(MTX_path)
+    moments = [(0, np.zeros(3), np.zeros((3, 3)))]
+    dM_chunks = _dM_chunks(MTX_w2M, EVy_path, EVo_path, int(chunkRows), moments, seed)
+
+
+    # Ensemble (streamed to disk), or only its moments
+    if DIR_dM_PDD is not None and saveEnsemble:
+        write_ensemble_chunks(ensemblePath, dM_chunks, units="N*m", fmt=TEXT_FORMAT, textHeader=False)
+    else:
+        for _ in dM_chunks:
+            pass
+
+
+    # Mean vector, pole, magnitude and covariance
+    dMmeans = _mean_vector(moments[0])
+
+    if DIR_dM_PDD is not None:
+        with open(vectorPath, "w") as datafile_id:
+            np.savetxt(datafile_id, dMmeans[np.newaxis, :], fmt=TEXT_FORMAT)
+
+    return dMmeans
+
+
+
+if __name__ == "__main__":
+
+    # Cmd inputs: MTX_w2M path, EVy path, DIR_dM_PPD and MYRIAM run label
+    # (STGs_<stage1>_<stage2>_<plate>_<model>), then
+    # optional EVo=<path>, saveEnsemble=0, binary=1, chunkRows=<int> and
+    # seed=<int>
+    options = dict(arg.split("=", 1) for arg in sys.argv[5:])
+    flag = lambda key, default: options.get(key, default) not in ("0", "false", "False")
+
+    calculate_dM(sys.argv[1], sys.argv[2], EVo_path=options.get("EVo"),
+                 DIR_dM_PDD=sys.argv[3], runLabel=sys.argv[4],
+                 saveEnsemble=flag("saveEnsemble", "1"), binary=flag("binary", "0"),
+                 chunkRows=int(options.get("chunkRows", CHUNK_ROWS)),
+                 seed=int(options["seed"]) if "seed" in options else None)
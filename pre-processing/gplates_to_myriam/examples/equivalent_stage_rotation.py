@@ -5,33 +5,37 @@ Created on Sat Dec 23 23:03:10 2023
 @author: Valentina Espinoza
 """
 
-from to_myriam_eulervector import ROT_to_EulerVector, CSVsph_to_EulerVector, eulerVector_to_MYRIAM
+import numpy as np
+from to_myriam_eulervector import (ROT_to_EulerVector, ROT_to_EulerVectorTable, CSVsph_to_EulerVector,
+                                   eulerVector_to_MYRIAM, eulerVectorTable_to_MYRIAM)
+
+
+# Rotation files of Matthews et al. (2016), by time range (Ma)
+data_dir = "assets/matthews_etal_2016" 
+MATTHEWS16_ROTATIONS = [(0, 250, "%s/Global_EB_250-0Ma_GK07_Matthews_etal.rot" %data_dir),
+                        (250, 410, "%s/Global_EB_410-250Ma_GK07_Matthews_etal.rot" %data_dir),
+                        ]
 
 
 
 def Matthews16_to_euvecTXT(plateID, output_path, reconstruction_times):
     
-    data_dir = "assets/matthews_etal_2016" 
+    euler_vec_sph = ROT_to_EulerVector(MATTHEWS16_ROTATIONS, plateID, reconstruction_times)
     
-    if all(reconstruction_times) <= 250:
-        rotation_path = "%s/Global_EB_250-0Ma_GK07_Matthews_etal.rot" %data_dir
-        
-    elif all(reconstruction_times) > 250 and all(reconstruction_times) <= 400:
-        rotation_path = "%s/Global_EB_410-250Ma_GK07_Matthews_etal.rot" %data_dir
-        
-    else:
-        raise ValueError("Input reconstruction_times beyond or accross the available time ranges (0 - 250 Ma and 250 - 400 Ma).")
-
+    eulerVector_to_MYRIAM(euler_vec_sph, output_path)
     
-    euler_vec_sph = ROT_to_EulerVector(rotation_path, plateID, reconstruction_times)
     
-    eulerVector_to_MYRIAM(euler_vec_sph, output_path)
+    
+def Matthews16_to_euvecTable(plateIDs, output_path, time_grid):
+    
+    table = ROT_to_EulerVectorTable(MATTHEWS16_ROTATIONS, plateIDs, time_grid)
+    
+    eulerVectorTable_to_MYRIAM(table, output_path)
     
     
     
 def GPlatesCSV_to_euvecTXT(plateID, output_path, delta_t):
     
-    data_dir = "assets/matthews_etal_2016" 
     csv_path = "%s/equivalent_stage_rotation_comma_10.00Ma.csv" %data_dir
     
     
@@ -52,6 +56,13 @@ if __name__ == "__main__":
     Matthews16_to_euvecTXT(plateID, outputPath, reconstruction_times)
     
     
+    # FROM PYGPLATES, 1 Myr STAGES FROM 0 TO 400 Ma
+    plateIDs = [201, 701, 801] # South-America, Africa, Australia
+    outputPath = r"eulerVectorTable_1Myr_matthews_etal_2016.txt"
+    
+    Matthews16_to_euvecTable(plateIDs, outputPath, np.arange(0, 401, 1))
+    
+    
     # FROM GPLATES CSV EXPORT
     plateID = 201 # South-America
     delta_t = 1
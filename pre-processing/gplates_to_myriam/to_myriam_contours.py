@@ -6,15 +6,106 @@ Created on Tue Sep 19 12:01:55 2023
 """
 
 # Public dependencies
+import os
+import sys
+import json
+import tempfile
 import numpy as np
 import pygplates
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+
+# MYRIAM Python functions (binary ensemble format)
+sys.path.append(str(Path(__file__).parents[2] / "assets" / "PythonFunctions"))
 
 
 # Contains
 # 1. GPML_topologies_to_coordinates
 # 2. GPML_geometries_to_coordinates
-# 3. SPH_to_coordinates
-# 4. coordinates_to_MYRIAM
+# 3. GPML_batch_to_coordinates
+# 4. GPML_batch_to_MYRIAM
+# 5. SPH_plate_index
+# 6. SPH_to_coordinates
+# 7. coordinates_to_MYRIAM
+
+
+# GPML datatypes handled by the batch functions
+GPML_TYPES = ["topologies", "geometries"]
+
+# Module-level state of each pool process (features and rotation model are
+# loaded once per process, as pygplates objects cannot be sent between them)
+_batch_inputs = None
+
+# Sidecar plateID index of a shapefile (<name>.pidx.json, next to the .shp):
+# record numbers and bounding boxes of every plateID, stamped with the size
+# and modification time of the .shp/.dbf files it was built from
+SHAPEFILE_INDEX_EXTENSION = ".pidx.json"
+SHAPEFILE_INDEX_VERSION = 1
+
+# Indexes already loaded in this process, keyed by shapefile path
+_shapefile_indexes = {}
+
+
+
+def _plate_polygons(features, rotation_model, gpml_type, plateIDs, reconstruction_time):
+    """
+    Resolves (topologies) or reconstructs (geometries) a GPML feature set once
+    at the given time, and returns the polygon of every requested plateID.
+
+    Returns
+    -------
+    dict
+        Two-column lon/lat arrays keyed by plateID, or the error message for
+        plateIDs with no (or more than one) polygon.
+
+    """
+
+    plateIDs = set(plateIDs)
+    filtered_geometries = {plateID : [] for plateID in plateIDs}
+
+    if gpml_type == "topologies":
+        resolved_geometries = []
+        pygplates.resolve_topologies(features, rotation_model,
+                                     resolved_geometries, reconstruction_time)
+
+        for topo in resolved_geometries:
+            plateID = topo.get_feature().get_reconstruction_plate_id()
+            if plateID in plateIDs:
+                filtered_geometries[plateID].append(topo.get_resolved_geometry())
+
+    elif gpml_type == "geometries":
+        reconstructed_geometries = []
+        output_parameters = dict(reconstruct_type = pygplates.ReconstructType.feature_geometry)
+        pygplates.reconstruct(features, rotation_model,
+                              reconstructed_geometries, reconstruction_time,
+                              **output_parameters)
+
+        for geom in reconstructed_geometries:
+            plateID = geom.get_feature().get_reconstruction_plate_id()
+            if plateID in plateIDs and \
+                    isinstance(geom.get_reconstructed_geometry(), pygplates.PolygonOnSphere):
+                filtered_geometries[plateID].append(geom.get_reconstructed_geometry())
+
+    else:
+        raise ValueError("Input gpml_type must be one of: %s." %", ".join(GPML_TYPES))
+
+
+    polygons = {}
+    for plateID, geometries in filtered_geometries.items():
+
+        if len(geometries) == 0:
+            polygons[plateID] = "No feature found with the given plateID."
+
+        elif len(geometries) > 1:
+            polygons[plateID] = "More than one feature found with the given plateID."
+
+        else:
+            polygons[plateID] = np.flip(geometries[0].to_lat_lon_array(), axis=1)
+
+    return polygons
+
+
 
 
 def GPML_topologies_to_coordinates(topologies_path, rotation_path, 
@@ -44,27 +135,13 @@ def GPML_topologies_to_coordinates(topologies_path, rotation_path,
 
     """
 
-    resolved_geometries = []
-    pygplates.resolve_topologies(topologies_path, rotation_path, 
-                                 resolved_geometries, reconstruction_time)
-    
-    filtered_geometries = []
-    for topo in resolved_geometries:
-        if topo.get_feature().get_reconstruction_plate_id() == plateID:
-            filtered_geometries.append(topo.get_resolved_geometry())
+    polygon = _plate_polygons(topologies_path, rotation_path, "topologies",
+                              [plateID], reconstruction_time)[plateID]
 
+    if isinstance(polygon, str):
+        raise IndexError(polygon)
 
-    if len(filtered_geometries) == 0:
-        raise IndexError("No feature found with the given plateID.")
-    
-    elif len(filtered_geometries) > 1:
-        raise IndexError("More than one feature found with the given plateID.")
-     
-    polygon_ft = filtered_geometries[0]
-    geom_coords = polygon_ft.to_lat_lon_array()
-    coords_lonlat = np.flip(geom_coords, axis=1)
-    
-    return coords_lonlat
+    return polygon
 
 
 
@@ -95,38 +172,243 @@ def GPML_geometries_to_coordinates(geometries_path, rotation_path,
 
     """
 
-    reconstructed_geometries = []
-    filtered_geometries = []
-    
-    output_parameters = dict(reconstruct_type = pygplates.ReconstructType.feature_geometry)
-    
-    pygplates.reconstruct(geometries_path, rotation_path,
-                          reconstructed_geometries, reconstruction_time,
-                          **output_parameters,
-                          )
-    
-    
-    for geom in reconstructed_geometries:
-        ft = geom.get_feature()
-        
-        if ft.get_reconstruction_plate_id() == plateID: # Check ID
-            
-            if isinstance(geom.get_reconstructed_geometry(), pygplates.PolygonOnSphere): # Check if polygon
-                
-                filtered_geometries.append(geom.get_reconstructed_geometry())
-            
-
-    if len(filtered_geometries) == 0:
-        raise IndexError("No feature found with the given plateID.")
-    
-    elif len(filtered_geometries) > 1:
-        raise IndexError("More than one feature found with the given plateID.")
-     
-    polygon_ft = filtered_geometries[0]
-    geom_coords = polygon_ft.to_lat_lon_array()
-    coords_lonlat = np.flip(geom_coords, axis=1)
-    
-    return coords_lonlat
+    polygon = _plate_polygons(geometries_path, rotation_path, "geometries",
+                              [plateID], reconstruction_time)[plateID]
+
+    if isinstance(polygon, str):
+        raise IndexError(polygon)
+
+    return polygon
+
+
+
+def _init_batch_worker(gpml_path, rotation_path, gpml_type):
+
+    global _batch_inputs
+    _batch_inputs = (pygplates.FeatureCollection(gpml_path),
+                     pygplates.RotationModel(rotation_path), gpml_type)
+
+
+
+def _batch_time(task):
+
+    plateIDs, reconstruction_time = task
+    features, rotation_model, gpml_type = _batch_inputs
+
+    return reconstruction_time, _plate_polygons(features, rotation_model, gpml_type,
+                                                plateIDs, reconstruction_time)
+
+
+
+def GPML_batch_to_coordinates(gpml_path, rotation_path, plateIDs, reconstruction_times,
+                              gpml_type = "topologies", nWorkers = None):
+    """
+    Extracts the contours of several plates at several reconstruction times.
+    The GPML file is resolved (or reconstructed) once per time for all
+    plateIDs together, and times are spread across a pool of processes.
+
+    Parameters
+    ----------
+    gpml_path : string
+        Path to a GPML file, of the GPlates "Resolved Topological Geometries"
+        (gpml_type = "topologies") or "Reconstructed Geometries"
+        (gpml_type = "geometries") datatype.
+    rotation_path : string
+        Path to a .ROT file. The file is expected to have the format of a 
+        GPlates "Reconstruction Tree" datatype.
+    plateIDs : list
+        IDs of the plates, for the given .ROT file.
+    reconstruction_times : list
+        Times of reconstruction.
+    gpml_type : string, optional
+        "topologies" or "geometries". The default is "topologies".
+    nWorkers : int, optional
+        Number of processes. The default is None (one per CPU); 1 runs in
+        the calling process.
+
+    Returns
+    -------
+    contours : dict
+        Two-column arrays of longitudes and latitudes (degrees), keyed by
+        (reconstruction_time, plateID).
+    missing : dict
+        Reason for every (reconstruction_time, plateID) with no contour.
+
+    """
+
+    if gpml_type not in GPML_TYPES:
+        raise ValueError("Input gpml_type must be one of: %s." %", ".join(GPML_TYPES))
+
+    plateIDs = list(plateIDs)
+    tasks = [(plateIDs, reconstruction_time) for reconstruction_time in reconstruction_times]
+
+    if nWorkers == 1:
+        _init_batch_worker(gpml_path, rotation_path, gpml_type)
+        results = map(_batch_time, tasks)
+
+    else:
+        nWorkers = min(nWorkers or os.cpu_count() or 1, max(len(tasks), 1))
+        executor = ProcessPoolExecutor(max_workers=nWorkers, initializer=_init_batch_worker,
+                                       initargs=(gpml_path, rotation_path, gpml_type))
+        with executor:
+            results = list(executor.map(_batch_time, tasks))
+
+
+    contours, missing = {}, {}
+    for reconstruction_time, polygons in results:
+        for plateID, polygon in polygons.items():
+            if isinstance(polygon, str):
+                missing[(reconstruction_time, plateID)] = polygon
+            else:
+                contours[(reconstruction_time, plateID)] = polygon
+
+    return contours, missing
+
+
+
+def GPML_batch_to_MYRIAM(gpml_path, rotation_path, plateIDs, reconstruction_times,
+                         output_path, gpml_type = "topologies", nWorkers = None,
+                         name_format = "BDR_ID%d_%gMa.txt"):
+    """
+    Extracts the contours of several plates at several reconstruction times
+    (see GPML_batch_to_coordinates) and saves them in MYRIAM input format,
+    either as one file per plate and time or as a single archive.
+
+    Parameters
+    ----------
+    gpml_path, rotation_path, plateIDs, reconstruction_times, gpml_type, nWorkers
+        See GPML_batch_to_coordinates.
+    output_path : string
+        Output folder for one file per plate and time, or path to a .NPZ
+        archive holding all contours (keys "ID<plateID>_<time>Ma").
+    name_format : string, optional
+        File name of each contour, formatted with (plateID, time). The
+        default is "BDR_ID%d_%gMa.txt". Use the .ENS extension for the
+        binary MYRIAM format.
+
+    Returns
+    -------
+    paths : list
+        Saved files.
+    missing : dict
+        Reason for every (reconstruction_time, plateID) with no contour.
+
+    """
+
+    contours, missing = GPML_batch_to_coordinates(gpml_path, rotation_path, plateIDs,
+                                                  reconstruction_times, gpml_type, nWorkers)
+
+    if output_path.lower().endswith(".npz"):
+        np.savez(output_path, **{"ID%d_%gMa" %(plateID, reconstruction_time) : coords_lonlat
+                                 for (reconstruction_time, plateID), coords_lonlat in contours.items()})
+        return [output_path], missing
+
+    os.makedirs(output_path, exist_ok=True)
+
+    paths = []
+    for (reconstruction_time, plateID), coords_lonlat in contours.items():
+        path = os.path.join(output_path, name_format %(plateID, reconstruction_time))
+        coordinates_to_MYRIAM(coords_lonlat, path)
+        paths.append(path)
+
+    return paths, missing
+
+
+
+def _shapefile_stamp(shapefile_path):
+
+    # Size and modification time of the files the index depends on
+    stamp = []
+    for extension in (".shp", ".dbf"):
+        fileStat = os.stat(os.path.splitext(shapefile_path)[0] + extension)
+        stamp += [fileStat.st_size, fileStat.st_mtime_ns]
+
+    return stamp
+
+
+
+def SPH_plate_index(shapefile_path, field="PLATEID1"):
+    """
+    Index of the records of a shapefile by plateID. The index is built once,
+    with a single pass over the shapefile, and saved as a sidecar file
+    (<name>.pidx.json) that is reused until the shapefile changes.
+
+    Parameters
+    ----------
+    shapefile_path : string
+        Path to a .SHP polygon file.
+    field : string, optional
+        Attribute holding the plateID. The default is "PLATEID1".
+
+    Returns
+    -------
+    dict
+        For every plateID, a list of (record number, bounding box) pairs in
+        file order. Bounding boxes are (lonMin, latMin, lonMax, latMax), or
+        None for empty records.
+
+    """
+
+    import shapefile
+
+    shapefile_path = os.path.abspath(shapefile_path)
+    index_path = os.path.splitext(shapefile_path)[0] + SHAPEFILE_INDEX_EXTENSION
+    header = {"version" : SHAPEFILE_INDEX_VERSION, "field" : field,
+              "stamp" : _shapefile_stamp(shapefile_path)}
+
+
+    # Index loaded in this process, or saved next to the shapefile
+    cached = _shapefile_indexes.get((shapefile_path, field))
+    if cached is not None and cached[0] == header:
+        return cached[1]
+
+    try:
+        with open(index_path, "r") as datafile_id:
+            sidecar = json.load(datafile_id)
+    except (OSError, ValueError):
+        sidecar = {}
+
+    if {key : sidecar.get(key) for key in header} == header:
+        plate_index = {int(plateID) : [(recordNr, tuple(bbox) if bbox else None)
+                                       for recordNr, bbox in records]
+                       for plateID, records in sidecar["plates"].items()}
+
+
+    # Build index (attributes of the plateID field only)
+    else:
+        plate_index = {}
+        with shapefile.Reader(shapefile_path) as reader:
+            for recordNr, shapeRecord in enumerate(reader.iterShapeRecords(fields=[field])):
+
+                plateID = shapeRecord.record[0]
+                if plateID is None or float(plateID) != int(plateID):
+                    continue
+
+                bbox = getattr(shapeRecord.shape, "bbox", None)
+                plate_index.setdefault(int(plateID), []).append(
+                    (recordNr, tuple(float(b) for b in bbox) if bbox is not None else None))
+
+        # Each writer saves its own temporary file, so extractions indexing
+        # the same shapefile concurrently never share one. Unwritable
+        # folders just skip the sidecar
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path),
+                                            prefix=os.path.basename(index_path) + ".", suffix=".tmp")
+        except OSError:
+            tmp_path = None
+
+        if tmp_path is not None:
+            try:
+                with os.fdopen(fd, "w") as datafile_id:
+                    json.dump(dict(header, plates=plate_index), datafile_id)
+                os.replace(tmp_path, index_path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    _shapefile_indexes[(shapefile_path, field)] = (header, plate_index)
+
+    return plate_index
 
 
 
@@ -141,7 +423,8 @@ def SPH_to_coordinates(shapefile_path, plateID):
     shapefile_path : string
         Path to a .SPH polygon file. The file is expected to have the format 
         of a GPlates exported "Reconstructed Geometries" or "Resolved 
-        Topological Geometries" datatype.         
+        Topological Geometries" datatype. Records are looked up through the
+        sidecar plateID index (see SPH_plate_index).
     plateID : int
         ID of the plate, for the given .ROT file.
 
@@ -152,30 +435,33 @@ def SPH_to_coordinates(shapefile_path, plateID):
 
     """    
     
-    from cartopy.io.shapereader import Reader
+    import shapefile
     import shapely
     
-    reader = Reader(shapefile_path)
-    
     try:
-        plateContour = [plate for plate in reader.records() 
-                        if plate.attributes["PLATEID1"] == plateID][0]
+        recordNr = SPH_plate_index(shapefile_path)[plateID][0][0]
         
-    except IndexError:
+    except (KeyError, IndexError):
         raise IndexError("Shapefile does not contain feature with plateID = %d" %plateID)
+    
+    
+    # Read the matching record only
+    with shapefile.Reader(shapefile_path) as reader:
+        shape = reader.shape(recordNr)
+        geometry = shapely.geometry.shape(shape) if shape.shapeType != shapefile.NULL else None
    
     
-    if isinstance(plateContour.geometry, shapely.geometry.multipolygon.MultiPolygon):
+    if isinstance(geometry, shapely.geometry.multipolygon.MultiPolygon):
         coords_list = []
-        for geom in plateContour.geometry.geoms:
+        for geom in geometry.geoms:
             coords_list.append(np.array(geom.exterior.coords))
         
         coords_lonlat = np.vstack([np.vstack([arr,[np.nan, np.nan]]) 
                                    if i < len(coords_list) -1 else arr 
                                    for i, arr in enumerate(coords_list)])
         
-    elif isinstance(plateContour.geometry, shapely.geometry.polygon.Polygon):
-        coords_lonlat = np.array(plateContour.geometry.exterior.coords)
+    elif isinstance(geometry, shapely.geometry.polygon.Polygon):
+        coords_lonlat = np.array(geometry.exterior.coords)
     
     else:
         raise TypeError("Not implemented shapely datatype. Must be Polygon or Multipolygon.")
@@ -188,14 +474,16 @@ def SPH_to_coordinates(shapefile_path, plateID):
 def coordinates_to_MYRIAM(coords_lonlat, output_path):
     """
     Save a .TXT file in MYRIAM input format. The output is a two-column array 
-    of coordinates expressed in longitude (deg) and latitude (deg). 
+    of coordinates expressed in longitude (deg) and latitude (deg). If the 
+    output path has the .ENS extension, the array is saved in the binary 
+    MYRIAM format instead.
 
     Parameters
     ----------
     coords_lonlat : array
         Two-column array on longitudes and latitudes expressed in degrees.
     output_path : string
-        Path to a .TXT file.
+        Path to a .TXT (or .ENS) file.
 
     Returns
     -------
@@ -203,6 +491,13 @@ def coordinates_to_MYRIAM(coords_lonlat, output_path):
 
     """
     
+    from EnsembleFormat import write_ensemble, BINARY_EXTENSION
+    
+    if output_path.lower().endswith(BINARY_EXTENSION):
+        write_ensemble(output_path, coords_lonlat, units="deg", 
+                       coordinates="spherical", columns=["lon", "lat"])
+        return
+    
     with open(output_path, 'w+') as datafile_id: 
          np.savetxt(datafile_id, 
                     coords_lonlat,
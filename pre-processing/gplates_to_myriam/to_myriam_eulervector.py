@@ -6,15 +6,108 @@ Created on Sat Dec 23 02:41:06 2023
 """
 
 # Public dependencies
+import os
+import sys
 import numpy as np
 import pandas as pd
 import pygplates
+from pathlib import Path
+from functools import lru_cache
+
+
+# MYRIAM Python functions (binary ensemble format)
+sys.path.append(str(Path(__file__).parents[2] / "assets" / "PythonFunctions"))
 
 
 # Contains
-# 1. ROT_to_EulerVector
-# 2. CSVsph_to_EulerVector
-# 3. eulerVector_to_MYRIAM
+# 1. load_rotation_model
+# 2. ROT_to_EulerVector
+# 3. ROT_to_EulerVectorTable
+# 4. CSVsph_to_EulerVector
+# 5. eulerVector_to_MYRIAM
+# 6. eulerVectorTable_to_MYRIAM
+
+
+# Rotation models kept in memory per process (least recently used dropped first)
+ROTATION_CACHE_SIZE = 8
+
+# Columns of the Euler-vector tables
+TABLE_COLUMNS = ["plateID", "t_young", "t_old", "lon", "lat", "angle"]
+TABLE_UNITS = ["", "Ma", "Ma", "degE", "degN", "deg/Myr"]
+
+
+
+@lru_cache(maxsize=ROTATION_CACHE_SIZE)
+def _cached_rotation_model(rotation_path, mtime_ns):
+
+    return pygplates.RotationModel(rotation_path)
+
+
+
+def load_rotation_model(rotation_path):
+    """
+    Loads a .ROT file as a pygplates.RotationModel, once per process. The
+    model is reused until the file changes, keeping at most
+    ROTATION_CACHE_SIZE models in memory.
+
+    Parameters
+    ----------
+    rotation_path : string
+        Path to a .ROT file.
+
+    Returns
+    -------
+    pygplates.RotationModel
+
+    """
+
+    rotation_path = os.path.abspath(rotation_path)
+
+    return _cached_rotation_model(rotation_path, os.stat(rotation_path).st_mtime_ns)
+
+
+
+def _segment_paths(rotation_path, times):
+
+    # Rotation file of every time. rotation_path is either a single file or a
+    # list of (t_min, t_max, path) segments, e.g. the 0-250 Ma and 250-410 Ma
+    # files of Matthews et al. (2016); a time on a boundary uses the first
+    # matching segment.
+    if isinstance(rotation_path, (str, os.PathLike)):
+        return [rotation_path] * len(times)
+
+    paths = []
+    for time in times:
+        matches = [path for t_min, t_max, path in rotation_path if t_min <= time <= t_max]
+
+        if not matches:
+            raise ValueError("Reconstruction time %g Ma beyond the available time ranges (%s)."
+                             %(time, ", ".join("%g - %g Ma" %(t_min, t_max)
+                                               for t_min, t_max, _ in rotation_path)))
+        paths.append(matches[0])
+
+    return paths
+
+
+
+def _rotation_quaternions(rotation_path, plateIDs, times, anchor_plateID):
+
+    # Unit quaternions (w, x, y, z) of the total rotations, of shape
+    # (nPlates, nTimes, 4)
+    quaternions = np.empty((len(plateIDs), len(times), 4))
+
+    for j, (time, path) in enumerate(zip(times, _segment_paths(rotation_path, times))):
+        rotation_model = load_rotation_model(path)
+
+        for i, plateID in enumerate(plateIDs):
+            finite_rotation = rotation_model.get_rotation(float(time), int(plateID),
+                                                          anchor_plate_id=anchor_plateID)
+            pole, angle = finite_rotation.get_euler_pole_and_angle()
+
+            quaternions[i, j, 0] = np.cos(angle / 2)
+            quaternions[i, j, 1:] = np.sin(angle / 2) * np.array(pole.to_xyz())
+
+    return quaternions
 
 
 def ROT_to_EulerVector(rotation_path, plateID, reconstruction_times):
@@ -24,9 +117,10 @@ def ROT_to_EulerVector(rotation_path, plateID, reconstruction_times):
 
     Parameters
     ----------
-    rotation_path : string
+    rotation_path : string or list
         Path to a .ROT file. The file is expected to have the format of a 
-        GPlates "Reconstruction Tree" datatype.
+        GPlates "Reconstruction Tree" datatype. Rotations split in several
+        files are given as a list of (t_min, t_max, path) segments.
     plateID : int
         ID of the plate, for the given .ROT file.
     reconstruction_times : tuple
@@ -49,7 +143,11 @@ def ROT_to_EulerVector(rotation_path, plateID, reconstruction_times):
     if reconstruction_times[0] >= reconstruction_times[1]:
         raise ValueError("Input reconstruction_times elements must be increasing in value.")
 
-    rotation_model = pygplates.RotationModel(rotation_path)
+    if not isinstance(rotation_path, (str, os.PathLike)):
+        table = ROT_to_EulerVectorTable(rotation_path, [plateID], reconstruction_times)
+        return table[0, 3:].reshape(3, 1)
+
+    rotation_model = load_rotation_model(rotation_path)
     equivalent_stage_rotation = rotation_model.get_rotation(
         reconstruction_times[0], plateID, reconstruction_times[1])
 
@@ -65,6 +163,91 @@ def ROT_to_EulerVector(rotation_path, plateID, reconstruction_times):
 
 
 
+def ROT_to_EulerVectorTable(rotation_path, plateIDs, time_grid, anchor_plateID = 0):
+    """
+    Calculates the stage Euler vectors of several plates over a whole time
+    grid, one stage per pair of consecutive times. Each .ROT file is loaded
+    once (see load_rotation_model), every total rotation is queried once, and
+    the stage rotations are composed for all plates and stages at once.
+
+    Parameters
+    ----------
+    rotation_path : string or list
+        Path to a .ROT file, or list of (t_min, t_max, path) segments when
+        rotations are split in several files. Stages crossing a segment
+        boundary combine the total rotations of both files.
+    plateIDs : list
+        IDs of the plates, for the given .ROT files.
+    time_grid : array
+        Increasing reconstruction times, e.g. np.arange(0, 401, 1).
+    anchor_plateID : int, optional
+        Fixed plate of the reconstruction. The default is 0.
+
+    Returns
+    -------
+    array
+        Table with one row per plate and stage, and columns plateID, young
+        and old stage times (Ma), Euler pole longitude (deg) and latitude
+        (deg), and angular velocity (deg/Myr).
+
+    """
+
+    time_grid = np.asarray(time_grid, dtype=np.float64)
+
+    if time_grid.ndim != 1 or len(time_grid) < 2:
+        raise ValueError("Input time_grid must contain at least two times.")
+
+    if np.any(np.diff(time_grid) <= 0):
+        raise ValueError("Input time_grid elements must be increasing in value.")
+
+
+    # Total rotations, then stage rotations R(t_young) * R(t_old)^-1 (the
+    # equivalent stage rotation of pygplates) for every plate and stage
+    q = _rotation_quaternions(rotation_path, list(plateIDs), time_grid, anchor_plateID)
+    q0, q1 = q[:, :-1], q[:, 1:] * np.array([1, -1, -1, -1])
+
+    w = q0[..., 0] * q1[..., 0] - np.sum(q0[..., 1:] * q1[..., 1:], axis=-1)
+    v = (q0[..., :1] * q1[..., 1:] + q1[..., :1] * q0[..., 1:] +
+         np.cross(q0[..., 1:], q1[..., 1:]))
+
+
+    # Rotation angle within [0, 180] deg, and pole (north pole for no rotation)
+    v[w < 0] *= -1
+    sinHalf = np.linalg.norm(v, axis=-1)
+    angle = 2 * np.arctan2(sinHalf, np.abs(w))
+
+    noRotation = sinHalf == 0
+    v[noRotation] = [0, 0, 1]
+
+    lon = np.degrees(np.arctan2(v[..., 1], v[..., 0]))
+    lat = np.degrees(np.arctan2(v[..., 2], np.hypot(v[..., 0], v[..., 1])))
+
+
+    # Table rows, plate by plate
+    nPlates, nStages = angle.shape
+    delta_t = np.diff(time_grid)
+
+    table = np.empty((nPlates, nStages, len(TABLE_COLUMNS)))
+    table[..., 0] = np.asarray(plateIDs)[:, np.newaxis]
+    table[..., 1] = time_grid[:-1]
+    table[..., 2] = time_grid[1:]
+    table[..., 3] = lon
+    table[..., 4] = lat
+    table[..., 5] = np.degrees(angle) / delta_t
+
+    return table.reshape(-1, len(TABLE_COLUMNS))
+
+
+
+@lru_cache(maxsize=ROTATION_CACHE_SIZE)
+def _cached_stage_csv(csv_path, mtime_ns):
+
+    data_fr = pd.read_csv(csv_path, skiprows=[0], names=["plateID", "pole_lat", "pole_lon", "angle"])
+
+    return data_fr.drop_duplicates("plateID").set_index("plateID")
+
+
+
 def CSVsph_to_EulerVector(csv_path, plateID, delta_t):
     """
     Calculates an Euler Vector of plate rotation for a given .CSV file, a
@@ -90,8 +273,14 @@ def CSVsph_to_EulerVector(csv_path, plateID, delta_t):
 
     """
     
-    data_fr = pd.read_csv(csv_path, skiprows=[0], names=["plateID", "pole_lat", "pole_lon", "angle"])
-    stg_finrot = data_fr[data_fr["plateID"] == plateID]
+    # The CSV is parsed once per process and indexed by plateID
+    csv_path = os.path.abspath(csv_path)
+    data_fr = _cached_stage_csv(csv_path, os.stat(csv_path).st_mtime_ns)
+
+    if plateID not in data_fr.index:
+        raise IndexError("CSV file does not contain plateID = %d" %plateID)
+
+    stg_finrot = data_fr.loc[plateID]
     euler_vec_sph = np.array([[float(stg_finrot["pole_lon"])],
                               [float(stg_finrot["pole_lat"])],
                               [float(stg_finrot["angle"]) / delta_t],
@@ -104,7 +293,9 @@ def CSVsph_to_EulerVector(csv_path, plateID, delta_t):
 def eulerVector_to_MYRIAM(euler_vec_sph, output_path):
     """
     Saves a .TXT file in MYRIAM input format. The output is a three-column array 
-    of a sigle Euler vector expressed spherical coordinates.
+    of a sigle Euler vector expressed spherical coordinates. If the output 
+    path has the .ENS extension, the array is saved in the binary MYRIAM 
+    format instead.
     
 
     Parameters
@@ -113,7 +304,7 @@ def eulerVector_to_MYRIAM(euler_vec_sph, output_path):
         Euler vector expressed as longitude (deg), latitude (deg) and angular 
         velocity (deg/Myr).
     output_path : string
-        Path to a .TXT file.
+        Path to a .TXT (or .ENS) file.
 
     Returns
     -------
@@ -121,10 +312,57 @@ def eulerVector_to_MYRIAM(euler_vec_sph, output_path):
 
     """
     
+    from EnsembleFormat import write_ensemble, BINARY_EXTENSION
+    
+    if output_path.lower().endswith(BINARY_EXTENSION):
+        write_ensemble(output_path, euler_vec_sph.T, units="degE,degN,deg/Myr", 
+                       coordinates="spherical", columns=["lon", "lat", "angle"])
+        return
+    
     with open(output_path, 'w+') as datafile_id: 
          np.savetxt(datafile_id, 
                     euler_vec_sph.T,
                     comments='!',
                     fmt = ['%1.4e','%1.4e','%1.4e'],
                     header="lon(degE) lat(degN) angle(deg/Myr)",
-                    )  
\ No newline at end of file
+                    )
+
+
+
+def eulerVectorTable_to_MYRIAM(table, output_path):
+    """
+    Saves an Euler-vector table (see ROT_to_EulerVectorTable) in a single
+    write, as a .TXT file with a '!' header line, or in the binary MYRIAM
+    format if the output path has the .ENS extension.
+
+    Parameters
+    ----------
+    table : array
+        Table with columns plateID, t_young (Ma), t_old (Ma), lon (deg),
+        lat (deg) and angle (deg/Myr).
+    output_path : string
+        Path to a .TXT (or .ENS) file.
+
+    Returns
+    -------
+    None.
+
+    """
+
+    from EnsembleFormat import write_ensemble, BINARY_EXTENSION
+
+    if output_path.lower().endswith(BINARY_EXTENSION):
+        write_ensemble(output_path, table, units=",".join(TABLE_UNITS),
+                       coordinates="spherical", columns=TABLE_COLUMNS)
+        return
+
+    header = " ".join("%s(%s)" %(column, unit) if unit else column
+                      for column, unit in zip(TABLE_COLUMNS, TABLE_UNITS))
+
+    with open(output_path, 'w+') as datafile_id:
+         np.savetxt(datafile_id,
+                    table,
+                    comments='!',
+                    fmt = ['%d', '%g', '%g', '%1.4e', '%1.4e', '%1.4e'],
+                    header=header,
+                    )
@@ -5,8 +5,9 @@ Created on Wed Sep 27 08:42:58 2023
 @author: nbt571
 """
 
+import sys
+import numpy as np
 from numpy import pi
-from math import radians, cos
 
 
 # Earth's radius in m:
@@ -18,25 +19,266 @@ muM = 1.5e21
 
 # Gamma (in m) and thickness of asthenosphere and lithosphere (in m).
 gamma = 4.73e5
-Ha = gamma * (muA / muM)**(1/3) # From Paulson & Richards (2009)
 Hl = 180e3
 
-# Euler vector change -- Angular velocity in deg/Myr and rad/s.
+# Euler vector change -- Angular velocity in deg/Myr.
 AV_deg_Myr = 1
-AV_rad_s = radians(AV_deg_Myr) / (1e6*365*24*60*60)
-
-# Radius to the bottom of the lithosphere in m.
-r = Re - Hl
 
 
 # Half-length values:
 # plate_halflength: We try three different values: 2.8, 16.6 and 35.2
-plate_halflength = 2.8
+PLATE_HALFLENGTHS = [2.8, 16.6, 35.2]
+
+
+# Parameter sweeps: DeltaM over the Cartesian grid of the values given for
+# each parameter (the defaults above for parameters not given), evaluated
+# in chunks of SWEEP_CHUNK combinations and saved as one table row each.
+SWEEP_PARAMETERS = ["plate_halflength", "AV_deg_Myr", "muA", "muM", "gamma", "Hl"]
+SWEEP_UNITS = ["deg", "deg/Myr", "Pa*s", "Pa*s", "m", "m"]
+SWEEP_CHUNK = 1000000
+
+
+
+def DeltaM_eq8(plate_halflength, AV_deg_Myr=AV_deg_Myr, muA=muA, muM=muM, gamma=gamma, Hl=Hl, Re=Re):
+    """
+    Torque-change magnitude (DeltaM, in N*m) of the benchmark square plate,
+    from equation 8 of the supplementary file in Espinoza et al. 2023.
+    Inputs may be arrays; they are broadcast against each other.
+
+    Parameters
+    ----------
+    plate_halflength : float or array
+        Plate half-length, in degrees.
+    AV_deg_Myr : float or array, optional
+        Angular velocity of the Euler-vector change, in deg/Myr.
+    muA, muM : float or array, optional
+        Viscosities of asthenosphere and upper mantle, in Pa*s.
+    gamma, Hl : float or array, optional
+        Gamma and lithosphere thickness, in m.
+    Re : float or array, optional
+        Earth's radius, in m.
+
+    Returns
+    -------
+    float or array
+        DeltaM, in N*m.
+
+    """
+
+    # Thickness of asthenosphere, from Paulson & Richards (2009)
+    Ha = gamma * (np.divide(muA, muM))**(1/3)
+
+    # Angular velocity in rad/s
+    AV_rad_s = np.radians(AV_deg_Myr) / (1e6*365*24*60*60)
+
+    # Radius to the bottom of the lithosphere in m.
+    r = np.subtract(Re, Hl)
+
+    lat_rad = np.radians(plate_halflength)
+    colat_rad = pi/2 - lat_rad #colalitude
+
+    # Calculate torque-change magnitude (DeltaM):
+    cosColat = np.cos(pi - colat_rad)
+
+    return (2*(AV_rad_s) * muA * r**4 * (pi-2*colat_rad)/Ha) * (1/3*cosColat**3 - cosColat)
+
+
+
+def _sweep_axes(grids):
+
+    unknown = [name for name in grids if name not in SWEEP_PARAMETERS]
+    if unknown:
+        raise ValueError("Unknown sweep parameters: %s. Must be in: %s."
+                         %(", ".join(unknown), ", ".join(SWEEP_PARAMETERS)))
+
+    defaults = {"plate_halflength" : PLATE_HALFLENGTHS, "AV_deg_Myr" : AV_deg_Myr,
+                "muA" : muA, "muM" : muM, "gamma" : gamma, "Hl" : Hl}
+
+    return [np.atleast_1d(np.asarray(grids.get(name, defaults[name]), dtype=np.float64))
+            for name in SWEEP_PARAMETERS]
+
+
+
+def _sweep_factors(axes):
+
+    # eq8 is a product of one factor per parameter:
+    #   DeltaM = f(halflength) * 2*AV * muA^(2/3) * muM^(1/3) / gamma * (Re - Hl)^4
+    # so each combination only multiplies precomputed factors
+    plate_halflength, AV, muA, muM, gamma, Hl = axes
+
+    colat_rad = pi/2 - np.radians(plate_halflength)
+    cosColat = np.cos(pi - colat_rad)
+
+    return [(pi-2*colat_rad) * (1/3*cosColat**3 - cosColat),
+            2 * np.radians(AV) / (1e6*365*24*60*60),
+            muA**(2/3), muM**(1/3), 1 / gamma, (Re - Hl)**4]
+
+
+
+def _sweep_blocks(axes, chunkSize):
+
+    # The trailing parameters whose grid fits in a chunk form an inner block,
+    # evaluated once (outer product of their factors); each chunk is a set of
+    # leading combinations times that block, always keeping the half-length
+    # among the leading parameters. Yields the grid indices of the leading
+    # combinations, of the inner block and DeltaM (nLead, nInner)
+    factors = _sweep_factors(axes)
+    shape = [len(axis) for axis in axes]
+
+    nLeading = len(shape) - 1
+    while nLeading > 1 and np.prod(shape[nLeading - 1:]) <= chunkSize:
+        nLeading -= 1
+
+    inner = np.ones(1)
+    for factor in factors[nLeading:]:
+        inner = np.multiply.outer(inner, factor).ravel()
+
+    innerIndices = np.unravel_index(np.arange(len(inner)), shape[nLeading:])
+    nLead = int(np.prod(shape[:nLeading]))
+    leadStep = max(chunkSize // len(inner), 1)
+
+    for start in range(0, nLead, leadStep):
+        leadIndices = np.unravel_index(np.arange(start, min(start + leadStep, nLead)), shape[:nLeading])
+
+        lead = factors[0][leadIndices[0]]
+        for factor, index in zip(factors[1:nLeading], leadIndices[1:]):
+            lead = lead * factor[index]
+
+        yield leadIndices, innerIndices, np.multiply.outer(lead, inner)
+
+
+
+def _sweep_rows(axes, leadIndices, innerIndices, DeltaM):
+
+    nLead, nInner = DeltaM.shape
+    columns = [np.repeat(axis[index], nInner) for axis, index in zip(axes, leadIndices)] + \
+              [np.tile(axis[index], nLead) for axis, index in zip(axes[len(leadIndices):], innerIndices)]
+
+    return np.column_stack(columns + [DeltaM.ravel()])
+
+
+
+def sweep_chunks(grids, chunkSize=SWEEP_CHUNK):
+    """
+    Evaluates DeltaM over the Cartesian grid of parameter values, chunk by
+    chunk (the last parameter varies fastest).
+
+    Parameters
+    ----------
+    grids : dict
+        Values of each swept parameter (keys in SWEEP_PARAMETERS). Parameters
+        not given take the module values (PLATE_HALFLENGTHS for the
+        half-length).
+    chunkSize : int, optional
+        Combinations per chunk (at least one grid line of the last
+        parameter). The default is SWEEP_CHUNK.
+
+    Yields
+    ------
+    array
+        Rows of the parameters (SWEEP_PARAMETERS order) and DeltaM.
+
+    """
+
+    axes = _sweep_axes(grids)
+
+    for leadIndices, innerIndices, DeltaM in _sweep_blocks(axes, chunkSize):
+        yield _sweep_rows(axes, leadIndices, innerIndices, DeltaM)
+
+
+
+def sweep_DeltaM(grids, output_path=None, chunkSize=SWEEP_CHUNK, fmt="%.6E"):
+    """
+    DeltaM over the Cartesian grid of parameter values, optionally saved as
+    a table (one "!" header line, then one row per combination), and its
+    envelope for each half-length.
+
+    Parameters
+    ----------
+    grids : dict
+        Values of each swept parameter (see sweep_chunks).
+    output_path : string, optional
+        Path to the output table. The default is None (envelope only).
+    chunkSize : int, optional
+        Combinations per chunk. The default is SWEEP_CHUNK.
+    fmt : string, optional
+        Number format of the table. The default is "%.6E".
+
+    Returns
+    -------
+    array
+        Rows of half-length, smallest and largest DeltaM (N*m) over the
+        other parameters.
+
+    """
+
+    axes = _sweep_axes(grids)
+    halfLengths = axes[0]
+    envelope = np.column_stack([halfLengths, np.full_like(halfLengths, np.inf),
+                                np.full_like(halfLengths, -np.inf)])
+
+    datafile_id = open(output_path, "w") if output_path is not None else None
+
+    try:
+        if datafile_id is not None:
+            datafile_id.write("!" + " ".join("%s(%s)" %(name, unit) for name, unit in
+                                             zip(SWEEP_PARAMETERS + ["DeltaM"], SWEEP_UNITS + ["N*m"])) + "\n")
+
+        for leadIndices, innerIndices, DeltaM in _sweep_blocks(axes, chunkSize):
+
+            # Envelope of each half-length
+            np.minimum.at(envelope[:, 1], leadIndices[0], DeltaM.min(axis=1))
+            np.maximum.at(envelope[:, 2], leadIndices[0], DeltaM.max(axis=1))
+
+            # Whole chunk formatted at once (faster than row-wise savetxt)
+            if datafile_id is not None:
+                chunk = _sweep_rows(axes, leadIndices, innerIndices, DeltaM)
+                rowFormat = " ".join([fmt] * chunk.shape[1]) + "\n"
+                datafile_id.write((rowFormat * len(chunk)) %tuple(chunk.ravel()))
+
+    finally:
+        if datafile_id is not None:
+            datafile_id.close()
+
+    return envelope
+
+
+
+def _parse_values(text):
+
+    # "a,b,c" values, "start:stop:num" linear or "start:stop:num:log"
+    # logarithmic spacing
+    if ":" not in text:
+        return [float(value) for value in text.split(",")]
+
+    start, stop, num, *spacing = text.split(":")
+
+    if spacing == ["log"]:
+        return np.logspace(np.log10(float(start)), np.log10(float(stop)), int(num))
+
+    return np.linspace(float(start), float(stop), int(num))
+
+
+
+if __name__ == "__main__":
+
+    # Cmd inputs: optional half-lengths (deg); the default is PLATE_HALFLENGTHS.
+    # Sweeps: <parameter>=<values> for any of SWEEP_PARAMETERS (see
+    # _parse_values), optional output=<table path> and chunkSize=<int>
+    options = dict(arg.split("=", 1) for arg in sys.argv[1:] if "=" in arg)
+    halfLengths = [float(arg) for arg in sys.argv[1:] if "=" not in arg]
+
+    grids = {name : _parse_values(values) for name, values in options.items() if name in SWEEP_PARAMETERS}
 
+    if not grids:
+        for plate_halflength in halfLengths or PLATE_HALFLENGTHS:
+            print(plate_halflength, DeltaM_eq8(plate_halflength))
 
-lat_rad = radians(plate_halflength)
-colat_rad = pi/2 - lat_rad #colalitude
+    else:
+        if halfLengths:
+            grids.setdefault("plate_halflength", halfLengths)
 
-# Calculate torque-change magnitude (DeltaM):
-DeltaM = (2*(AV_rad_s) * muA * r**4 * (pi-2*colat_rad)/Ha) * (1/3*(cos(pi-colat_rad))**3 - cos(pi-colat_rad))
-print(DeltaM)
\ No newline at end of file
+        envelope = sweep_DeltaM(grids, options.get("output"),
+                                chunkSize=int(options.get("chunkSize", SWEEP_CHUNK)))
+        for plate_halflength, DeltaM_min, DeltaM_max in envelope:
+            print("%g %.6E %.6E" %(plate_halflength, DeltaM_min, DeltaM_max))
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# Times loading and drawing stacked contour rings with ContourIO (ragged
+# arrays, one collection) against the former pandas groupby + one
+# mpatches.Polygon per ring of ContourMap.py.
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import matplotlib.patches as mpatches
+import cartopy.crs as ccrs
+
+sys.path.insert(0, str(Path(__file__).parents[2] / "assets" / "PythonFunctions"))
+from ContourIO import load_contours, write_contours, contour_collection
+
+
+def random_rings(nRings, nVertices, rng):
+
+    angle = np.linspace(0, 2*np.pi, nVertices)
+    centres = np.column_stack([rng.uniform(-170, 170, nRings), rng.uniform(-80, 80, nRings)])
+    radii = rng.uniform(0.2, 3, nRings)
+
+    vertices = (centres[:, np.newaxis, :] + radii[:, np.newaxis, np.newaxis] *
+                np.stack([np.cos(angle), np.sin(angle)], axis=-1)).reshape(-1, 2)
+
+    return vertices, np.arange(nRings + 1) * nVertices
+
+
+def draw_perPolygon(path):
+
+    fig = plt.figure(figsize=(9,9), dpi=72)
+    ax = fig.add_subplot(111, projection=ccrs.PlateCarree())
+    ax.set_global()
+
+    contour = pd.read_csv(path, delimiter=' ', header=None)
+    contour["cntrNr"] = contour.isnull().all(axis=1).cumsum()
+
+    for n, rows in contour.groupby("cntrNr").groups.items():
+        indCntr = contour.iloc[rows].drop(columns="cntrNr").dropna()
+        ax.add_patch(mpatches.Polygon(indCntr, closed=True, ec='r', fill=False, lw=0.8,
+                                      transform=ccrs.PlateCarree(), zorder=9))
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def draw_collection(path):
+
+    fig = plt.figure(figsize=(9,9), dpi=72)
+    ax = fig.add_subplot(111, projection=ccrs.PlateCarree())
+    ax.set_global()
+
+    vertices, offsets = load_contours(path)
+    ax.add_collection(contour_collection([{"vertices" : vertices, "offsets" : offsets}],
+                                         transform=ccrs.PlateCarree()))
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def timeit(function, *args):
+
+    t0 = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - t0
+
+
+
+if __name__ == "__main__":
+
+    rng = np.random.default_rng(0)
+    path = os.path.join(tempfile.mkdtemp(), "CNTR20_bench.txt")
+
+    print("%8s %14s %14s %10s" %("rings", "polygons[s]", "collection[s]", "speed-up"))
+
+    for nRings in [10, 100, 1000, 5000]:
+
+        write_contours(path, *random_rings(nRings, 60, rng))
+
+        tLoop = timeit(draw_perPolygon, path)
+        tBatch = timeit(draw_collection, path)
+
+        print("%8d %14.3f %14.3f %10.1f" %(nRings, tLoop, tBatch, tLoop/tBatch))
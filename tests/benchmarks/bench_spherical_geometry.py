@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+# Times the vectorized SphericalGeometry.cart2sph against the per-element
+# list comprehensions formerly used by RotatedEnsembleMap.py.
+
+import sys
+import time
+import numpy as np
+from math import atan2, sqrt
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[2] / "assets" / "PythonFunctions"))
+from SphericalGeometry import cart2sph, great_circle_distance
+
+
+def cart2sph_perElement(x, y, z):
+
+    lat = [atan2(Az, sqrt(Ax**2 + Ay**2)) for Ax, Ay, Az in zip(x,y,z)]
+    lon = [atan2(Ay, Ax) for Ax, Ay in zip(x,y)]
+
+    return list(np.degrees(lat)), list(np.degrees(lon))
+
+
+def timeit(function, *args):
+
+    t0 = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - t0
+
+
+
+if __name__ == "__main__":
+
+    rng = np.random.default_rng(0)
+
+    print("%10s %14s %14s %10s %14s" %("points", "per-element[s]", "vectorized[s]",
+                                       "speed-up", "distance[s]"))
+
+    for nPoints in [int(1e4), int(1e5), int(1e6), int(1e7)]:
+
+        xyz = rng.normal(size=(nPoints, 3))
+
+        tLoop = timeit(cart2sph_perElement, xyz[:,0].tolist(), xyz[:,1].tolist(), xyz[:,2].tolist())
+        tVec = timeit(cart2sph, xyz)
+
+        lat, lon, _ = cart2sph(xyz)
+        tDist = timeit(great_circle_distance, lat, lon, lat[::-1], lon[::-1])
+
+        print("%10d %14.4f %14.4f %10.1f %14.4f" %(nPoints, tLoop, tVec, tLoop/tVec, tDist))
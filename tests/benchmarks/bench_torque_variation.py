@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# Times the batched torque-variation engine (TorqueVariation.py) on the
+# Anatolia example ensembles against a Python model of the per-member loop
+# of TorqueVariation.Calculate_dM (src/TorqueVariation.cs). The C# binary
+# itself is not run: it needs a built MYRIAM and the lithosphere model of the
+# run (MTX_w2M), neither of which ships with the repository.
+#
+# Optional inputs, all from one MYRIAM run of the Anatolia example:
+#   MTX=<MTX_w2M_<model>.txt>  transformation matrix (a random matrix of
+#                              realistic magnitude is used otherwise)
+#   ENSdM=<ENSdM_STGs_<RUN_LABEL>.txt>, VECdM=<VECdM_STGs_<RUN_LABEL>.txt>
+#                              MYRIAM outputs the Python results must match
+#                              (to the 4 significant digits MYRIAM writes)
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[2] / "assets" / "PythonFunctions"))
+from TorqueVariation import UNITS_TRANSFORMER, load_matrix, calculate_dM
+from EnsembleFormat import text_to_binary
+
+
+EXAMPLE_DIR = Path(__file__).parents[2] / "examples" / "anatolia_plate"
+
+
+def loop_dM(MTX_w2M, EVy, EVo):
+
+    # Per-member products, as in the C# loop
+    dM = np.empty_like(EVy)
+    for i in range(len(EVy)):
+        dEV = (EVy[i] - EVo[i]) * UNITS_TRANSFORMER
+        dM[i, 0] = MTX_w2M[0, 0] * dEV[0] + MTX_w2M[0, 1] * dEV[1] + MTX_w2M[0, 2] * dEV[2]
+        dM[i, 1] = MTX_w2M[1, 0] * dEV[0] + MTX_w2M[1, 1] * dEV[1] + MTX_w2M[1, 2] * dEV[2]
+        dM[i, 2] = MTX_w2M[2, 0] * dEV[0] + MTX_w2M[2, 1] * dEV[1] + MTX_w2M[2, 2] * dEV[2]
+    return dM
+
+
+def timeit(function, *args, **kwargs):
+
+    t0 = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - t0, result
+
+
+
+if __name__ == "__main__":
+
+    options = dict(arg.split("=", 1) for arg in sys.argv[1:])
+    outDir = tempfile.mkdtemp()
+
+    EVy_path = str(EXAMPLE_DIR / "ENS_EV_AT_YOUNG.txt")
+    EVo_path = str(EXAMPLE_DIR / "ENS_EV_AT_OLD.txt")
+
+    if "MTX" in options:
+        MTX_path = options["MTX"]
+    else:
+        MTX_path = os.path.join(outDir, "MTX_w2M_bench.txt")
+        np.savetxt(MTX_path, np.random.default_rng(0).normal(size=(3, 3)) * 1e38)
+
+    MTX_w2M = load_matrix(MTX_path)
+    EVy, EVo = np.loadtxt(EVy_path, comments="!"), np.loadtxt(EVo_path, comments="!")
+
+
+    # Product only
+    tLoop, dM_loop = timeit(loop_dM, MTX_w2M, EVy, EVo)
+    tBatch, _ = timeit(lambda: (EVy - EVo) * UNITS_TRANSFORMER @ MTX_w2M.T)
+
+    print("%d members" %len(EVy))
+    print("%-34s %10.4f s" %("per-member loop (C# layout)", tLoop))
+    print("%-34s %10.4f s   (%.0fx)" %("batched product", tBatch, tLoop/tBatch))
+
+
+    # Whole run: read ensembles, compute, write ENSdM/VECdM
+    for label, inputs, binary in [("text in, text out", (EVy_path, EVo_path), False),
+                                  ("binary in, binary out", (text_to_binary(EVy_path, os.path.join(outDir, "EVy.ens")),
+                                                             text_to_binary(EVo_path, os.path.join(outDir, "EVo.ens"))), True)]:
+        tRun, dMmeans = timeit(calculate_dM, MTX_path, *inputs, DIR_dM_PDD=outDir,
+                               runLabel="STGs_0_1_AT_A5_M15_bench", binary=binary, chunkRows=25000)
+        print("%-34s %10.4f s" %("calculate_dM, " + label, tRun))
+
+
+    # Ensemble and mean vector against MYRIAM's
+    if ("ENSdM" in options or "VECdM" in options) and "MTX" not in options:
+        sys.exit("The MYRIAM references need the MTX_w2M matrix of their run (MTX=<path>).")
+
+    if "ENSdM" in options:
+        reference = np.loadtxt(options["ENSdM"], ndmin=2)
+        dM = np.loadtxt(os.path.join(outDir, "ENSdM_STGs_STGs_0_1_AT_A5_M15_bench.txt"), ndmin=2)
+        assert dM.shape == reference.shape, "ENSdM shapes differ: %s, %s" %(dM.shape, reference.shape)
+        assert np.allclose(dM, reference, rtol=1e-3, atol=1e-3 * np.abs(reference).max()), \
+            "ENSdM differs from %s" %options["ENSdM"]
+        print("ENSdM matches %s" %options["ENSdM"])
+
+    if "VECdM" in options:
+        reference = np.loadtxt(options["VECdM"])
+        assert np.allclose(dMmeans, reference, rtol=1e-3), "VECdM differs from %s" %options["VECdM"]
+        print("VECdM matches %s (largest relative difference %.2e)"
+              %(options["VECdM"], np.max(np.abs(dMmeans - reference) / np.abs(reference))))
@@ -0,0 +1,514 @@
+# -*- coding: utf-8 -*-
+
+# Benchmark suite of the Python stages of MYRIAM: the eq8 analytical check,
+# contour and ensemble loading, every figure script (and its cold import
+# time) and the pre-processing extractors, each timed at several input
+# sizes on synthetic inputs built on the fly. Results are saved as JSON and
+# can be compared against a baseline.
+#
+# Cmd inputs (all optional, key=value):
+#   stages=<name,name,...>   stages to run (default: all, see STAGES)
+#   quick=1                  smallest size of every stage only
+#   repeat=<int>             timed runs per size (default 5)
+#   quality=<draft|final>    render tier of the figure scripts (default draft)
+#   output=<path>            JSON results (default benchmark_results.json)
+#   baseline=<path>          JSON results to compare against
+#   tolerance=<float>        slowdown ratio flagged as a regression (1.25)
+# The exit status is 1 when a regression is flagged.
+#
+# Stages whose dependencies are missing (e.g. pygplates for the extractors)
+# are reported as skipped, with the reason.
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import statistics
+import numpy as np
+from pathlib import Path
+import matplotlib
+matplotlib.use("Agg")
+
+ROOT_DIR = Path(__file__).parents[2]
+sys.path.insert(0, str(ROOT_DIR / "assets" / "PythonFunctions"))
+sys.path.insert(0, str(ROOT_DIR / "pre-processing" / "gplates_to_myriam"))
+sys.path.insert(0, str(ROOT_DIR / "tests" / "benchmark_test_myriam"))
+
+FORMAT_VERSION = 1
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 1.25
+
+# Runs faster than this (in s) are too noisy to flag as regressions
+NOISE_FLOOR = 0.005
+
+
+
+# --- Synthetic inputs
+
+def _rng(size):
+
+    return np.random.default_rng(size)
+
+
+
+def write_plate_contour(path, halfLength=10.0, nVertices=200):
+
+    # Square plate boundary, as BDR_SQUARE_*.txt
+    side = np.linspace(-halfLength, halfLength, nVertices // 4, endpoint=False)
+    lon = np.concatenate([side, np.full_like(side, halfLength), -side, np.full_like(side, -halfLength)])
+    lat = np.concatenate([np.full_like(side, -halfLength), side, np.full_like(side, halfLength), -side])
+
+    np.savetxt(path, np.column_stack([np.append(lon, lon[0]), np.append(lat, lat[0])]), fmt="%.4f")
+
+
+
+def write_rings(path, nVertices, rng, nRings=None):
+
+    # Stacked NaN-separated circles around random centres, as CNTR files
+    from ContourIO import write_contours
+
+    nRings = nRings or max(nVertices // 500, 1)
+    sizes = np.full(nRings, nVertices // nRings)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+
+    angle = np.concatenate([np.linspace(0, 2*np.pi, size) for size in sizes])
+    centres = np.repeat(rng.uniform([-150, -60], [150, 60], (nRings, 2)), sizes, axis=0)
+    radius = np.repeat(rng.uniform(2, 20, nRings), sizes)
+
+    vertices = centres + radius[:, None] * np.column_stack([np.cos(angle), np.sin(angle)])
+    write_contours(path, vertices, offsets)
+
+
+
+def pole_ensemble(nMembers, rng, centre=(30.0, 40.0), spread=5.0):
+
+    # Cartesian torque-variation ensemble clustered around a pole
+    from SphericalGeometry import sph2cart
+
+    lat = centre[1] + rng.normal(0, spread, nMembers)
+    lon = centre[0] + rng.normal(0, spread, nMembers)
+
+    return sph2cart(np.clip(lat, -90, 90), lon) * rng.normal(1e30, 1e29, (nMembers, 1))
+
+
+
+# --- Stages: setup(size, folder) returns the callable to time
+
+def setup_eq8(size, folder):
+
+    from benchmark_eq8 import DeltaM_eq8
+
+    halfLengths = np.linspace(0.5, 45, size)
+
+    return lambda: DeltaM_eq8(halfLengths)
+
+
+
+def setup_eq8_sweep(size, folder):
+
+    from benchmark_eq8 import sweep_DeltaM
+
+    # size: combinations, over half-length, muA and muM grids
+    nValues = max(int(round((size / 3)**0.5)), 1)
+    grids = {"plate_halflength" : [2.8, 16.6, 35.2], "muA" : np.logspace(18, 21, nValues),
+             "muM" : np.logspace(20, 22, nValues)}
+
+    return lambda: sweep_DeltaM(grids)
+
+
+
+def setup_load_contours(size, folder):
+
+    from ContourIO import load_contours
+
+    path = os.path.join(folder, "CNTR68_bench.txt")
+    write_rings(path, size, _rng(size))
+
+    return lambda: load_contours(path)
+
+
+
+def _setup_load_ensemble(size, folder, binary):
+
+    from EnsembleFormat import write_ensemble, load_ensemble
+
+    ensemble = pole_ensemble(size, _rng(size))
+
+    if binary:
+        path = os.path.join(folder, "ENSdM_bench.ens")
+        write_ensemble(path, ensemble, units="N*m")
+    else:
+        path = os.path.join(folder, "ENSdM_bench.txt")
+        np.savetxt(path, ensemble, fmt="%.3E")
+
+    # Touch every value, so memory-mapped ensembles are actually read
+    return lambda: float(np.asarray(load_ensemble(path)[0]).sum())
+
+
+
+def setup_load_ensemble_txt(size, folder):
+
+    return _setup_load_ensemble(size, folder, binary=False)
+
+
+
+def setup_load_ensemble_ens(size, folder):
+
+    return _setup_load_ensemble(size, folder, binary=True)
+
+
+
+def setup_encode_png(size, folder):
+
+    from FigureEncoding import encode_image
+
+    # size: pixels per side of a map-like RGBA canvas (3240 is 9 in at 360 dpi)
+    rng = _rng(size)
+    image = np.full((size, size, 4), 255, dtype=np.uint8)
+    image[::7, :, :3] = rng.integers(0, 256, (len(image[::7]), size, 3), dtype=np.uint8)
+    path = os.path.join(folder, "encode_bench.png")
+
+    return lambda: encode_image(image, path)
+
+
+
+def setup_fig_MagnitudeHistogram(size, folder, quality):
+
+    import MagnitudeHistogram
+
+    magnitudes = np.sort(_rng(size).normal(1e30, 1e29, 10000))
+    counts, edges = np.histogram(magnitudes, size)
+    np.savetxt(os.path.join(folder, "MAGHIST_bench_%d.txt" %size),
+               np.column_stack([(edges[1:] + edges[:-1]) / 2, counts]), fmt=["%.3E", "%d"])
+
+    return lambda: MagnitudeHistogram.main(["bench_%d" %size, folder], quality=quality)
+
+
+
+def setup_fig_ContourMap(size, folder, quality):
+
+    import ContourMap
+
+    rng = _rng(size)
+    write_plate_contour(os.path.join(folder, "BDR_SQ_0_1.txt"))
+    for percent in (20, 68):
+        write_rings(os.path.join(folder, "CNTR%d_bench.txt" %percent), size, rng)
+
+    return lambda: ContourMap.main(["_bench", "SQ", "0_1", folder, folder], quality=quality)
+
+
+
+def setup_fig_RotatedEnsembleMap(size, folder, quality):
+
+    import RotatedEnsembleMap
+    from EnsembleFormat import write_ensemble
+
+    rng = _rng(size)
+    write_plate_contour(os.path.join(folder, "BDR_SQ_0_1.txt"))
+    write_ensemble(os.path.join(folder, "ENSdM.ens"), pole_ensemble(size, rng), units="N*m")
+    write_ensemble(os.path.join(folder, "ENSdM_ROT.ens"), pole_ensemble(size, rng, centre=(0, 0)), units="N*m")
+    write_rings(os.path.join(folder, "CNTR_68.txt"), 2000, rng, nRings=1)
+    write_rings(os.path.join(folder, "CNTR_ROT_68.txt"), 2000, rng, nRings=1)
+
+    return lambda: RotatedEnsembleMap.main(["SQ", "0_1", folder, folder, folder, "bench"], quality=quality)
+
+
+
+def setup_fig_GridMaps(size, folder, quality):
+
+    import GridMaps
+
+    # size: grid nodes per side over the square plate
+    rng = _rng(size)
+    lon, lat = np.meshgrid(np.linspace(-15, 15, size), np.linspace(15, -15, size))
+    layers = {"LON" : lon, "LAT" : lat, "MuA" : 10**rng.uniform(18, 21, lon.shape),
+              "YM" : rng.uniform(1e10, 1e11, lon.shape), "MT" : rng.uniform(0, 10, lon.shape)}
+
+    for name, values in layers.items():
+        np.savetxt(os.path.join(folder, "GRID_%s_bench.txt" %name), values, fmt="%.4E")
+
+    write_plate_contour(os.path.join(folder, "BDR_SQ_0_1.txt"))
+    inside = np.abs(lon.ravel()) <= 10
+    np.savetxt(os.path.join(folder, "BDRin_SQ_0_1.txt"),
+               np.column_stack([lon.ravel()[inside], lat.ravel()[inside], rng.uniform(0, 1, inside.sum())]),
+               fmt="%.4f")
+
+    return lambda: GridMaps.main(["bench", "0_1", "SQ", folder], quality=quality)
+
+
+
+def _setup_startup(module, size, folder):
+
+    import subprocess
+
+    # size: cold interpreter starts, each importing the figure script as
+    # the host does before main runs
+    command = [sys.executable, "-c", "import %s" %module]
+    env = dict(os.environ, PYTHONPATH=str(ROOT_DIR / "assets" / "PythonFunctions"))
+
+    return lambda: [subprocess.run(command, env=env, cwd=folder, check=True) for _ in range(size)]
+
+
+
+def setup_startup_MagnitudeHistogram(size, folder):
+
+    return _setup_startup("MagnitudeHistogram", size, folder)
+
+
+
+def setup_startup_ContourMap(size, folder):
+
+    return _setup_startup("ContourMap", size, folder)
+
+
+
+def setup_startup_RotatedEnsembleMap(size, folder):
+
+    return _setup_startup("RotatedEnsembleMap", size, folder)
+
+
+
+def setup_startup_GridMaps(size, folder):
+
+    return _setup_startup("GridMaps", size, folder)
+
+
+
+def setup_pre_SPH_to_coordinates(size, folder):
+
+    import shapefile
+    from to_myriam_contours import SPH_to_coordinates
+
+    # size: plates in the shapefile, every one looked up once
+    rng = _rng(size)
+    path = os.path.join(folder, "plates_bench.shp")
+
+    with shapefile.Writer(path, shapeType=shapefile.POLYGON) as writer:
+        writer.field("PLATEID1", "N")
+        for plateID in range(size):
+            lon0, lat0 = rng.uniform(-170, 160), rng.uniform(-80, 70)
+            writer.poly([[(lon0, lat0), (lon0, lat0 + 5), (lon0 + 5, lat0 + 5), (lon0 + 5, lat0), (lon0, lat0)]])
+            writer.record(plateID)
+
+    return lambda: [SPH_to_coordinates(path, plateID) for plateID in range(size)]
+
+
+
+def setup_pre_CSVsph_to_EulerVector(size, folder):
+
+    from to_myriam_eulervector import CSVsph_to_EulerVector
+
+    # size: plates in the equivalent-stage CSV, every one looked up once
+    rng = _rng(size)
+    path = os.path.join(folder, "stages_bench.csv")
+    np.savetxt(path, np.column_stack([np.arange(size), rng.uniform(-90, 90, size),
+                                      rng.uniform(-180, 180, size), rng.uniform(0, 10, size)]),
+               fmt=["%d", "%.4f", "%.4f", "%.4f"], delimiter=",",
+               header="PlateID,Latitude,Longitude,Angle", comments="")
+
+    return lambda: [CSVsph_to_EulerVector(path, plateID, 5.0) for plateID in range(size)]
+
+
+
+def setup_pre_ROT_to_EulerVectorTable(size, folder):
+
+    from to_myriam_eulervector import ROT_to_EulerVectorTable
+
+    # size: plates in the rotation file, on a 1-Myr grid from 0 to 50 Ma
+    rng = _rng(size)
+    path = os.path.join(folder, "rotations_bench_%d.rot" %size)
+
+    with open(path, "w") as datafile_id:
+        for plateID in range(101, 101 + size):
+            for reconstructionTime in (0.0, 25.0, 50.0):
+                angle = 0.0 if reconstructionTime == 0 else rng.uniform(1, 20)
+                datafile_id.write("%d %.1f %.4f %.4f %.4f 0 !bench\n"
+                                  %(plateID, reconstructionTime, rng.uniform(-90, 90),
+                                    rng.uniform(-180, 180), angle))
+
+    return lambda: ROT_to_EulerVectorTable(path, list(range(101, 101 + size)), np.arange(0, 51, 1.0))
+
+
+
+# Stage name: (setup function, input sizes, figure script)
+STAGES = {
+    "eq8" : (setup_eq8, [10000, 100000, 1000000], False),
+    "eq8_sweep" : (setup_eq8_sweep, [10000, 1000000, 10000000], False),
+    "load_contours" : (setup_load_contours, [10000, 100000, 1000000], False),
+    "load_ensemble_txt" : (setup_load_ensemble_txt, [10000, 100000, 1000000], False),
+    "load_ensemble_ens" : (setup_load_ensemble_ens, [10000, 100000, 1000000], False),
+    "encode_png" : (setup_encode_png, [720, 1620, 3240], False),
+    "fig_MagnitudeHistogram" : (setup_fig_MagnitudeHistogram, [20, 50, 200], True),
+    "fig_ContourMap" : (setup_fig_ContourMap, [1000, 10000, 100000], True),
+    "fig_RotatedEnsembleMap" : (setup_fig_RotatedEnsembleMap, [10000, 100000, 1000000], True),
+    "fig_GridMaps" : (setup_fig_GridMaps, [50, 150, 400], True),
+    "startup_MagnitudeHistogram" : (setup_startup_MagnitudeHistogram, [1], False),
+    "startup_ContourMap" : (setup_startup_ContourMap, [1], False),
+    "startup_RotatedEnsembleMap" : (setup_startup_RotatedEnsembleMap, [1], False),
+    "startup_GridMaps" : (setup_startup_GridMaps, [1], False),
+    "pre_SPH_to_coordinates" : (setup_pre_SPH_to_coordinates, [10, 100, 1000], False),
+    "pre_CSVsph_to_EulerVector" : (setup_pre_CSVsph_to_EulerVector, [10, 100, 1000], False),
+    "pre_ROT_to_EulerVectorTable" : (setup_pre_ROT_to_EulerVectorTable, [10, 100, 1000], False),
+    }
+
+
+
+# --- Suite
+
+def run_stage(name, size, repeat=DEFAULT_REPEAT, quality="draft"):
+    """
+    Times one stage at one input size. The setup (synthetic inputs, imports)
+    and a warm-up run are not timed.
+
+    Returns
+    -------
+    dict
+        "stage", "size" and either the run times ("times", "min", "median",
+        in s) or the reason the stage was skipped.
+
+    """
+
+    setup, _, isFigure = STAGES[name]
+    folder = tempfile.mkdtemp(prefix="myriam_bench_")
+    result = {"stage" : name, "size" : size}
+
+    try:
+        function = setup(size, folder, quality) if isFigure else setup(size, folder)
+        function()
+
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - t0)
+
+    except ImportError as error:
+        result["skipped"] = "missing dependency: %s" %error
+        return result
+
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    result.update({"times" : times, "min" : min(times), "median" : statistics.median(times)})
+
+    return result
+
+
+
+def run_suite(stages=None, quick=False, repeat=DEFAULT_REPEAT, quality="draft", log=print):
+    """
+    Times every stage at each of its input sizes.
+
+    Returns
+    -------
+    dict
+        "meta" (environment of the run) and "results" (see run_stage).
+
+    """
+
+    import matplotlib.pyplot as plt
+
+    results = []
+    for name in stages or list(STAGES):
+
+        if name not in STAGES:
+            raise ValueError("Unknown stage: %s. Must be in: %s." %(name, ", ".join(STAGES)))
+
+        for size in STAGES[name][1][:1] if quick else STAGES[name][1]:
+            result = run_stage(name, size, repeat=repeat, quality=quality)
+            results.append(result)
+            plt.close("all")
+
+            if log is not None:
+                log(format_result(result))
+
+    meta = {"version" : FORMAT_VERSION, "timestamp" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python" : platform.python_version(), "numpy" : np.__version__,
+            "matplotlib" : matplotlib.__version__, "platform" : platform.platform(),
+            "cpus" : os.cpu_count(), "repeat" : repeat, "quality" : quality}
+
+    return {"meta" : meta, "results" : results}
+
+
+
+def format_result(result):
+
+    label = "%-28s %9d" %(result["stage"], result["size"])
+
+    if "skipped" in result:
+        return "%s   skipped (%s)" %(label, result["skipped"])
+
+    return "%s %10.4f s (min %.4f s)" %(label, result["median"], result["min"])
+
+
+
+def compare_results(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares the median times of two suite runs.
+
+    Parameters
+    ----------
+    current, baseline : dict
+        Suite results (see run_suite).
+    tolerance : float, optional
+        Slowdown ratio flagged as a regression. The default is 1.25.
+
+    Returns
+    -------
+    list
+        One dict per stage and size found in both runs, with "stage",
+        "size", "baseline", "current", "ratio" and "regression".
+
+    """
+
+    reference = {(result["stage"], result["size"]) : result for result in baseline["results"]
+                 if "median" in result}
+
+    comparison = []
+    for result in current["results"]:
+
+        previous = reference.get((result["stage"], result["size"]))
+        if previous is None or "median" not in result:
+            continue
+
+        ratio = result["median"] / previous["median"] if previous["median"] > 0 else np.inf
+        regression = ratio > tolerance and result["median"] - previous["median"] > NOISE_FLOOR
+
+        comparison.append({"stage" : result["stage"], "size" : result["size"],
+                           "baseline" : previous["median"], "current" : result["median"],
+                           "ratio" : ratio, "regression" : bool(regression)})
+
+    return comparison
+
+
+
+if __name__ == "__main__":
+
+    options = dict(arg.split("=", 1) for arg in sys.argv[1:])
+
+    suite = run_suite(stages=options["stages"].split(",") if "stages" in options else None,
+                      quick=options.get("quick", "0") not in ("0", "false", "False"),
+                      repeat=int(options.get("repeat", DEFAULT_REPEAT)),
+                      quality=options.get("quality", "draft"))
+
+    outputPath = options.get("output", "benchmark_results.json")
+    with open(outputPath, "w") as datafile_id:
+        json.dump(suite, datafile_id, indent=1)
+    print("results saved to %s" %outputPath)
+
+
+    # Regressions against a stored run
+    if "baseline" in options:
+        with open(options["baseline"], "r") as datafile_id:
+            baseline = json.load(datafile_id)
+
+        comparison = compare_results(suite, baseline, float(options.get("tolerance", DEFAULT_TOLERANCE)))
+        for entry in comparison:
+            print("%-28s %9d %10.4f s -> %10.4f s  x%.2f%s"
+                  %(entry["stage"], entry["size"], entry["baseline"], entry["current"], entry["ratio"],
+                    "  REGRESSION" if entry["regression"] else ""))
+
+        sys.exit(1 if any(entry["regression"] for entry in comparison) else 0)
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+# Make the figure scripts and their helpers in assets/PythonFunctions importable
+sys.path.insert(0, str(Path(__file__).parents[2] / "assets" / "PythonFunctions"))
+
+
+import numpy as np
+import pytest
+
+RUN_LABEL = "STGs_0_1_SQ_A5_M15_HL180"
+
+
+@pytest.fixture
+def run_folders(tmp_path, monkeypatch):
+    # DIR_dM_PPD / DIR_MTX_w2M pair of a single run, with an empty figure cache
+    monkeypatch.setenv("MYRIAM_CACHE_DIR", str(tmp_path / "Cache"))
+    pddDir, mtxDir = tmp_path / "PDD", tmp_path / "MTX"
+    pddDir.mkdir()
+    mtxDir.mkdir()
+
+    np.savetxt(pddDir / ("MAGHIST_%s_20.txt" %RUN_LABEL),
+               np.column_stack([np.linspace(1e29, 2e29, 20), np.arange(20)]), fmt="%.3E %d")
+
+    angle = np.linspace(0, 2*np.pi, 50)
+    for level, radius in [("20", 4), ("68", 8)]:
+        np.savetxt(pddDir / ("CNTR%s_%s_r1.txt" %(level, RUN_LABEL)),
+                   np.column_stack([30 + radius*np.cos(angle), 40 + radius*np.sin(angle)]), fmt="%.3f")
+
+    square = np.array([[-10, -10], [10, -10], [10, 10], [-10, 10], [-10, -10]])
+    np.savetxt(mtxDir / "BDR_SQ_0_1.txt", square, fmt="%.3f")
+    np.savetxt(mtxDir / "BDRin_SQ_0_1.txt", square, fmt="%.3f")
+
+    return str(pddDir), str(mtxDir)
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+import MagnitudeStatistics
+from MagnitudeStatistics import (new_sketch, update_sketch, merge_sketches, sketch_quantiles,
+                                 magnitude_statistics, magnitude_histogram)
+from EnsembleFormat import write_ensemble
+
+## ==========================
+
+def _ensemble(size=60000):
+    rng = np.random.default_rng(5)
+    return rng.normal([3e29, 1e29, -2e29], 5e28, (size, 3))
+
+
+def test_sketch_quantiles_and_merge():
+    values = np.linalg.norm(_ensemble(), axis=1)
+    q = [0, 0.025, 0.5, 0.975, 1]
+
+    whole = update_sketch(new_sketch(), values)
+    exact = np.quantile(values, q, method="inverted_cdf")
+    assert np.all(np.abs(sketch_quantiles(whole, q) / exact - 1) <= MagnitudeStatistics.RELATIVE_ACCURACY)
+    assert sketch_quantiles(whole, 0) == values.min() and sketch_quantiles(whole, 1) == values.max()
+
+    # Sketches of separate blocks merge into the sketch of the whole
+    parts = [update_sketch(new_sketch(), block) for block in np.array_split(values, 7)]
+    merged = merge_sketches(*parts)
+    assert merged["count"] == len(values)
+    assert np.array_equal(sketch_quantiles(merged, q), sketch_quantiles(whole, q))
+
+    with pytest.raises(ValueError):
+        merge_sketches(whole, new_sketch(0.01))
+
+
+def test_sketch_memory_bounded(monkeypatch):
+    monkeypatch.setattr(MagnitudeStatistics, "MAX_BUCKETS", 100)
+
+    sketch = update_sketch(new_sketch(), np.logspace(-20, 20, 10000))
+    assert len(sketch["buckets"]) == 100 and sketch["count"] == 10000
+    assert np.isclose(sketch_quantiles(sketch, 0.99), np.quantile(np.logspace(-20, 20, 10000), 0.99), rtol=0.01)
+
+
+def test_magnitude_histogram(tmp_path):
+    ensemble = _ensemble()
+    magnitudes = np.linalg.norm(ensemble, axis=1)
+
+    binPath = str(tmp_path / "ENSdM_STGs_STGs_0_1_AT_A5_M15_test.ens")
+    write_ensemble(binPath, ensemble, units="N*m")
+    txtPath = str(tmp_path / "ENSdM_STGs_STGs_0_1_AT_A5_M15_test.txt")
+    np.savetxt(txtPath, ensemble, fmt="%.6E")
+
+    statistics = magnitude_histogram(binPath, str(tmp_path), "STGs_0_1_AT_A5_M15_test", nBins=40, chunkRows=7000)
+    assert np.array_equal(statistics["histogram"]["counts"], np.histogram(magnitudes, 40)[0])
+
+    lower, upper = statistics["intervals"][68]
+    assert abs(np.mean((magnitudes >= lower) & (magnitudes <= upper)) - 0.68) < 0.01
+
+    magHist = np.loadtxt(tmp_path / "MAGHIST_STGs_0_1_AT_A5_M15_test_40.txt")
+    assert magHist.shape == (40, 2) and magHist[:, 1].sum() == len(ensemble)
+    assert np.loadtxt(tmp_path / "MAGPCT_STGs_0_1_AT_A5_M15_test.txt").shape == (2, 3)
+
+    # Same statistics from text and from a fixed range in one pass
+    textStatistics = magnitude_statistics(txtPath, nBins=40, chunkRows=9000)
+    assert np.allclose(textStatistics["median"], statistics["median"], rtol=0.011)
+
+    fixed = magnitude_statistics(binPath, nBins=40, magRange=(magnitudes.min(), magnitudes.max()))
+    assert np.array_equal(fixed["histogram"]["counts"], statistics["histogram"]["counts"])
+
+
+def test_equal_magnitudes(tmp_path):
+    binPath = str(tmp_path / "ENSdM_STGs_0_1_AT_equal.ens")
+    write_ensemble(binPath, np.tile([3e29, 4e29, 0], (1000, 1)), units="N*m")
+
+    for nWorkers in (1, 2):
+        statistics = magnitude_statistics(binPath, nBins=5, nWorkers=nWorkers)
+        edges, counts = statistics["histogram"]["edges"], statistics["histogram"]["counts"]
+
+        assert list(counts) == [0, 0, 1000, 0, 0] and edges[0] < 5e29 < edges[-1]
+        assert np.isclose(statistics["median"], 5e29, rtol=0.01)
+
+
+def test_outputs_describe_one_run(tmp_path):
+    from PoleContours import ensemble_contours
+    from BatchRender import find_jobs
+
+    runLabel = "STGs_0_1_AT_A5_M15_test"
+    ensemblePath = str(tmp_path / ("ENSdM_STGs_%s.txt" %runLabel))
+    np.savetxt(ensemblePath, _ensemble(), fmt="%.6E")
+
+    magnitude_histogram(ensemblePath, str(tmp_path), runLabel, nBins=20)
+    ensemble_contours(ensemblePath, str(tmp_path), runLabel)
+
+    # ENSdM, CNTR and MAGHIST names give the same run label
+    jobs, skipped = find_jobs(str(tmp_path), str(tmp_path), TMP_Dir=str(tmp_path))
+    assert [job["args"][0] for job in jobs] == [runLabel + "_20"]
+    assert [reply["error"] for reply in skipped if reply["script"] == "RotatedEnsembleMap.py"] == \
+        ["Incomplete TMP files in %s." %tmp_path]
+
+    with pytest.raises(ValueError):
+        magnitude_histogram(ensemblePath, str(tmp_path), "0_1_AT_A5_M15_test")
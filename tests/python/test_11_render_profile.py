@@ -0,0 +1,85 @@
+import json
+
+import numpy as np
+import pytest
+
+import MagnitudeHistogram
+from RenderProfile import (profiling_mode, start_profile, profile_stage, finish_profile,
+                           load_profiles, aggregate_profiles)
+
+## ==========================
+
+def _magHist(folder):
+    np.savetxt(folder / "MAGHIST_test.txt", np.column_stack([np.linspace(1e29, 2e29, 20), np.arange(20)]),
+               fmt="%.3E %d")
+
+
+def test_profiling_mode(monkeypatch):
+    monkeypatch.delenv("MYRIAM_PROFILE", raising=False)
+    assert profiling_mode() == "off"
+    assert profiling_mode(True) == "time" and profiling_mode("0") == "off"
+
+    monkeypatch.setenv("MYRIAM_PROFILE", "memory")
+    assert profiling_mode() == "memory"
+
+    with pytest.raises(ValueError):
+        profiling_mode("fast")
+
+
+def test_sidecar_written(tmp_path):
+    _magHist(tmp_path)
+
+    figpath, = MagnitudeHistogram.main(["test", str(tmp_path)], quality="draft", profile="memory")
+
+    with open(figpath[:-4] + ".profile.json") as datafile_id:
+        record = json.load(datafile_id)
+
+    assert record["script"] == "MagnitudeHistogram" and record["mode"] == "memory"
+    assert [stage["name"] for stage in record["stages"]] == ["load_histogram", "hist", "savefig"]
+    assert all(stage["wall_s"] >= 0 and stage["peakTraced_MB"] >= 0 for stage in record["stages"])
+
+
+def test_memory_mode_without_reset_peak(tmp_path, monkeypatch):
+    # Python 3.8 has no tracemalloc.reset_peak
+    import tracemalloc
+    monkeypatch.delattr(tracemalloc, "reset_peak", raising=False)
+    _magHist(tmp_path)
+
+    figpath, = MagnitudeHistogram.main(["test", str(tmp_path)], quality="draft", profile="memory")
+
+    with open(figpath[:-4] + ".profile.json") as datafile_id:
+        record = json.load(datafile_id)
+
+    assert all(stage["peakTraced_MB"] >= 0 for stage in record["stages"])
+    assert not tracemalloc.is_tracing()
+
+
+def test_no_sidecar_when_off(tmp_path, monkeypatch):
+    monkeypatch.delenv("MYRIAM_PROFILE", raising=False)
+    _magHist(tmp_path)
+
+    MagnitudeHistogram.main(["test", str(tmp_path)], quality="draft")
+
+    assert not list(tmp_path.glob("*.profile.json"))
+
+
+def test_nested_stages_and_aggregate(tmp_path):
+    profile = start_profile("test", profile="time")
+
+    with profile_stage("shared"):
+        with profile_stage("inner"):
+            pass
+    for figName in ("A.png", "B.png"):
+        with profile_stage("save", figure=figName):
+            pass
+
+    sidecars = finish_profile(profile, [str(tmp_path / "A.png"), str(tmp_path / "B.png")])
+    records = load_profiles(str(tmp_path))
+
+    assert len(sidecars) == len(records) == 2
+    assert [(stage["name"], stage["parent"]) for stage in records[0]["stages"]] == \
+        [("inner", "shared"), ("shared", None), ("save", None)]
+
+    # Shared stages are counted once per run
+    counts = {entry["stage"] : entry["count"] for entry in aggregate_profiles(records)}
+    assert counts == {"inner" : 1, "shared" : 1, "save" : 2}
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+import matplotlib.pyplot as plt
+from PIL import Image
+
+import FigureEncoding
+from FigureEncoding import (compression_level, figure_rgba, encode_image, start_encoder, stop_encoder,
+                            save_image, wait_encoder, save_figure)
+
+## ==========================
+
+def _figure(ylabel=""):
+    fig = plt.figure(figsize=(4, 3), dpi=72)
+    ax = fig.add_subplot(111)
+    ax.plot([0, 1], [0, 1])
+    ax.set_ylabel(ylabel, labelpad=60)
+    return fig
+
+
+def test_compression_level(monkeypatch):
+    monkeypatch.delenv("MYRIAM_COMPRESSION", raising=False)
+    assert compression_level() == FigureEncoding.DEFAULT_COMPRESSION
+    assert compression_level({"compression" : 1}) == 1
+
+    monkeypatch.setenv("MYRIAM_COMPRESSION", "9")
+    assert compression_level({"compression" : 1}) == 9
+
+    monkeypatch.setenv("MYRIAM_COMPRESSION", "12")
+    with pytest.raises(ValueError):
+        compression_level()
+
+
+def test_encode_roundtrip(tmp_path):
+    image = np.random.default_rng(0).integers(0, 256, (40, 60, 4), dtype=np.uint8)
+    image[:, :30] = 255     # Compressible half
+
+    for name, compression in [("fast.png", 0), ("small.png", 9), ("lossless.webp", 4)]:
+        encode_image(image, str(tmp_path / name), compression, dpi=72)
+        assert np.array_equal(np.asarray(Image.open(tmp_path / name)), image)
+
+    assert (tmp_path / "fast.png").stat().st_size > (tmp_path / "small.png").stat().st_size
+
+    with pytest.raises(ValueError):
+        encode_image(image, str(tmp_path / "figure.jpg"))
+
+
+def test_figure_rgba_matches_savefig(tmp_path):
+    for ylabel in ["", "far outside the canvas"]:
+        fig = _figure(ylabel)
+        fig.savefig(tmp_path / "reference.png", bbox_inches="tight", dpi=72)
+        reference = np.asarray(Image.open(tmp_path / "reference.png"))
+
+        image, bbox = figure_rgba(fig)
+        assert abs(image.shape[0] - reference.shape[0]) <= 1 and abs(image.shape[1] - reference.shape[1]) <= 1
+
+        # A fixed crop is used as given
+        fixed, _ = figure_rgba(fig, "0,0,2,1")
+        assert fixed.shape == (72, 144, 4)
+        plt.close(fig)
+
+
+def test_encoder_pool(tmp_path):
+    fig = _figure()
+    start_encoder(2)
+
+    try:
+        bbox = save_figure(fig, str(tmp_path / "A.png"))
+        save_figure(fig, str(tmp_path / "B.png"), bbox=bbox)
+        assert sorted(wait_encoder()) == [str(tmp_path / "A.png"), str(tmp_path / "B.png")]
+        assert np.array_equal(np.asarray(Image.open(tmp_path / "A.png")), np.asarray(Image.open(tmp_path / "B.png")))
+
+        # Encoding errors are raised by wait_encoder
+        save_image(np.zeros((4, 4, 4), dtype=np.uint8), str(tmp_path / "C.gif"))
+        with pytest.raises(ValueError):
+            wait_encoder()
+
+    finally:
+        stop_encoder()
+        plt.close(fig)
+
+    assert FigureEncoding._encoder is None
@@ -0,0 +1,70 @@
+import io
+import uuid
+
+import numpy as np
+import pytest
+
+import ArrayHandoff
+from ArrayHandoff import (pack_arrays, write_arrays, read_arrays, share_arrays, open_shared_arrays,
+                          handoff_arrays)
+
+## ==========================
+
+@pytest.fixture
+def arrays():
+    rng = np.random.default_rng(3)
+    contour = rng.normal(size=(31, 2))
+    contour[15] = np.nan
+    return {"ENSdM" : rng.normal(size=(1000, 3)), "CNTR_68" : contour,
+            "COUNTS" : np.arange(7, dtype=np.int32)}
+
+
+def test_stream_roundtrip(arrays):
+    stream = io.BytesIO()
+    write_arrays(stream, arrays, extra={"ENSdM" : {"units" : "N*m"}})
+
+    stream.seek(0)
+    received, header = read_arrays(stream)
+
+    assert list(received) == list(arrays)
+    for name, data in arrays.items():
+        assert np.array_equal(received[name], data, equal_nan=True) and received[name].dtype == data.dtype
+        assert header[name]["offset"] % ArrayHandoff.ALIGNMENT == 0
+    assert header["ENSdM"]["units"] == "N*m"
+
+
+def test_malformed_stream(arrays):
+    message = pack_arrays(arrays)
+
+    with pytest.raises(EOFError):
+        read_arrays(io.BytesIO(message[:len(message) // 2]))
+    with pytest.raises(ValueError):
+        read_arrays(io.BytesIO(b"NOTAHAND" + message[8:]))
+
+
+def test_shared_memory(arrays):
+    name = "myr_%s" %uuid.uuid4().hex[:12]
+    segment = share_arrays(name, arrays)
+
+    try:
+        views, _, reader = open_shared_arrays(name)
+        assert not views["ENSdM"].flags.writeable
+        assert np.array_equal(views["CNTR_68"], arrays["CNTR_68"], equal_nan=True)
+        del views
+        reader.close()
+
+        # Copies outlive the segment
+        received = handoff_arrays(ArrayHandoff.SHARED_PREFIX + name)
+
+    finally:
+        segment.close()
+        segment.unlink()
+
+    assert np.array_equal(received["ENSdM"], arrays["ENSdM"])
+
+
+def test_handoff_sources():
+    assert handoff_arrays(None) == {}
+
+    with pytest.raises(ValueError):
+        handoff_arrays("pipe")
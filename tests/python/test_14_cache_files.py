@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from GeometryCache import save_cache_file
+
+## ==========================
+
+def test_concurrent_cache_writers(tmp_path):
+    cachePath = str(tmp_path / "GEOM_test.npz")
+    image = np.arange(300000, dtype=np.float64)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        moved = list(pool.map(lambda i: save_cache_file(cachePath, image=image + i, writer=i), range(8)))
+
+    assert all(isinstance(result, bool) for result in moved)
+    with np.load(cachePath) as arrays:
+        assert np.array_equal(arrays["image"], image + arrays["writer"])
+
+    # No temporary file is left behind
+    assert [path.name for path in tmp_path.iterdir()] == ["GEOM_test.npz"]
+
+
+def test_evicted_basemap_rendered_again(tmp_path, monkeypatch):
+    from BaseMapCache import basemap_figure, save_basemap_figure, evict_basemaps
+
+    monkeypatch.setenv("MYRIAM_CACHE_DIR", str(tmp_path / "Cache"))
+    fig, ax = basemap_figure(np.arange(-180, 181, 60), np.arange(-90, 91, 45), figsize=(2, 2), dpi=40,
+                             simplify=1.0)
+
+    # Another worker evicts the layer between drawing and saving
+    evict_basemaps(maxVariants=0)
+    save_basemap_figure(fig, str(tmp_path / "map.png"))
+
+    plt.close(fig)
+    assert (tmp_path / "map.png").exists() and len(list((tmp_path / "Cache").glob("BASEMAP_*.npz"))) == 1
@@ -0,0 +1,82 @@
+import io
+import json
+
+import pytest
+
+import RenderWorker
+from RenderWorker import load_scripts, start_job, finish_job, run_job, serve_stream
+from FigureEncoding import start_encoder, stop_encoder
+from conftest import RUN_LABEL
+
+## ==========================
+
+@pytest.fixture(scope="module")
+def modules():
+    return load_scripts()
+
+
+def _histogram_job(pddDir, jobId="hist"):
+    return {"id" : jobId, "script" : "MagnitudeHistogram.py", "args" : [RUN_LABEL + "_20", pddDir],
+            "options" : {"quality" : "draft"}}
+
+
+def test_run_job(modules, run_folders):
+    pddDir, _ = run_folders
+
+    reply = run_job(modules, _histogram_job(pddDir))
+    assert reply["status"] == "ok" and reply["id"] == "hist"
+    assert reply["outputs"][0].endswith(".png") and reply["wall_s"] >= 0
+
+
+def test_job_errors(modules, run_folders):
+    pddDir, _ = run_folders
+
+    reply = run_job(modules, {"script" : "Unknown.py", "args" : []})
+    assert reply["status"] == "error" and "Unknown script" in reply["error"]
+
+    reply = run_job(modules, {"script" : "ContourMap.py", "args" : ["a", "b"]})
+    assert reply["status"] == "error" and "expects %d arguments" %RenderWorker.SCRIPTS["ContourMap.py"] \
+        in reply["error"]
+
+    # The worker's stdin is never a handoff stream
+    reply = run_job(modules, dict(_histogram_job(pddDir), script="RotatedEnsembleMap.py",
+                                  args=["SQ", "0_1", pddDir, pddDir, pddDir, "run"], options={"handoff" : "stdin"}))
+    assert reply["status"] == "error" and "shm:<name>" in reply["error"]
+
+    # Errors raised by the script are replied, not raised
+    reply = run_job(modules, dict(_histogram_job(pddDir), args=["missing", pddDir]))
+    assert reply["status"] == "error" and reply["outputs"] == []
+
+
+def test_deferred_encoding(modules, run_folders):
+    pddDir, _ = run_folders
+    start_encoder(1)
+
+    try:
+        reply, pending = start_job(modules, _histogram_job(pddDir))
+        assert len(pending) == 1
+
+        reply = finish_job(reply, pending)
+        assert reply["status"] == "ok" and all(future.done() for future in pending)
+
+    finally:
+        stop_encoder()
+
+
+def test_serve_stream(modules, run_folders):
+    pddDir, _ = run_folders
+    lines = [json.dumps(_histogram_job(pddDir, "first")), "", "not json",
+             json.dumps(_histogram_job(pddDir, "second")), json.dumps({"command" : "exit"}),
+             json.dumps(_histogram_job(pddDir, "ignored"))]
+
+    stream_out = io.StringIO()
+    start_encoder(1)
+    try:
+        serve_stream(modules, io.StringIO("\n".join(lines) + "\n"), stream_out)
+    finally:
+        stop_encoder()
+
+    # One reply per job, in order
+    replies = [json.loads(line) for line in stream_out.getvalue().splitlines()]
+    assert [reply.get("id") for reply in replies] == ["first", None, "second"]
+    assert [reply["status"] for reply in replies] == ["ok", "error", "ok"]
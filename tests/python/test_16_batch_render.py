@@ -0,0 +1,61 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import BatchRender
+from BatchRender import parse_runLabel, find_jobs, tier_jobs
+from conftest import RUN_LABEL
+
+## ==========================
+
+def test_parse_runLabel():
+    assert parse_runLabel("STGs_0_1_AT_A5_M15_HL180_GLBL_fHA1p0_D0") == \
+        ("0_1", "AT", "A5_M15_HL180_GLBL_fHA1p0_D0")
+    assert parse_runLabel("RUN_0_1_AT") is None
+
+
+def test_find_jobs(run_folders):
+    pddDir, mtxDir = run_folders
+    os.remove(os.path.join(mtxDir, "BDRin_SQ_0_1.txt"))
+
+    jobs, skipped = find_jobs(pddDir, mtxDir, TMP_Dir=pddDir)
+
+    assert [job["script"] for job in jobs] == ["MagnitudeHistogram.py"]
+    assert jobs[0]["args"] == [RUN_LABEL + "_20", pddDir]
+
+    reasons = {reply["script"] : reply["error"] for reply in skipped}
+    assert "Plate boundary files" in reasons["ContourMap.py"]
+    assert "Incomplete TMP files" in reasons["RotatedEnsembleMap.py"]
+
+
+def test_tier_jobs():
+    jobs = [{"id" : "MagnitudeHistogram.py:a", "script" : "MagnitudeHistogram.py", "args" : ["a", "b"]}]
+
+    tiered = tier_jobs(jobs, ["draft", "final"])
+    assert [job["id"] for job in tiered] == ["MagnitudeHistogram.py:a:draft", "MagnitudeHistogram.py:a:final"]
+    assert [job["options"]["quality"] for job in tiered] == ["draft", "final"]
+    assert "options" not in jobs[0]
+
+
+def test_batch_two_workers(run_folders, tmp_path):
+    pddDir, mtxDir = run_folders
+    summaryPath = str(tmp_path / "BATCH_SUMMARY.json")
+
+    # Two contour maps drawn at once by two workers, with a cold base-map cache
+    for level in ["20", "68"]:
+        shutil.copy(os.path.join(pddDir, "CNTR%s_%s_r1.txt" %(level, RUN_LABEL)),
+                    os.path.join(pddDir, "CNTR%s_%s_r2.txt" %(level, RUN_LABEL)))
+
+    process = subprocess.run([sys.executable, BatchRender.__file__, "--pair", pddDir, mtxDir,
+                              "-w", "2", "-q", "draft", "-s", summaryPath],
+                             capture_output=True, text=True, env=os.environ.copy())
+    assert process.returncode == 0, process.stdout + process.stderr
+
+    with open(summaryPath) as datafile_id:
+        summary = json.load(datafile_id)
+
+    assert summary["workers"] == 2 and summary["counts"] == {"ok" : 3}
+    for reply in summary["figures"]:
+        assert all(os.path.exists(figpath) for figpath in reply["outputs"])
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from SphericalGeometry import (cart2sph, sph2cart, great_circle_distance,
+                               azimuth, rotation_matrix, rotate_points)
+
+## ==========================
+
+@pytest.fixture
+def poles():
+    rng = np.random.default_rng(1)
+    return rng.normal(size=(1000, 3)) * 1e24
+
+
+def test_cart2sph_roundtrip(poles):
+    lat, lon, mag = cart2sph(poles)
+    assert np.allclose(sph2cart(lat, lon, mag), poles, rtol=1e-12, atol=0)
+    assert lat.flags.c_contiguous and lon.flags.c_contiguous
+
+
+def test_cart2sph_matches_scalar_math(poles):
+    from math import atan2, sqrt, degrees
+    lat, lon, _ = cart2sph(poles)
+    x, y, z = poles[0]
+    assert lat[0] == pytest.approx(degrees(atan2(z, sqrt(x**2 + y**2))))
+    assert lon[0] == pytest.approx(degrees(atan2(y, x)))
+
+
+def test_great_circle_distance_and_azimuth():
+    assert great_circle_distance(0, 0, 0, 90) == pytest.approx(90)
+    assert great_circle_distance(90, 0, -90, 0) == pytest.approx(180)
+    assert great_circle_distance(10, 20, 10, 20) == pytest.approx(0)
+    assert azimuth(0, 0, 10, 0) == pytest.approx(0)
+    assert azimuth(0, 0, 0, 10) == pytest.approx(90)
+    assert azimuth(0, 0, -10, 0) == pytest.approx(180)
+
+
+def test_rotate_points():
+    matrix = rotation_matrix(90, 0, 90)
+    rotated = rotate_points(sph2cart([0], [0]), matrix)
+    lat, lon, _ = cart2sph(rotated)
+    assert lat[0] == pytest.approx(0, abs=1e-12)
+    assert lon[0] == pytest.approx(90)
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+
+from EnsembleFormat import (write_ensemble, open_ensemble, load_ensemble,
+                            text_to_binary, binary_to_text, is_binary_ensemble, find_ensemble)
+
+## ==========================
+
+@pytest.fixture
+def ensemble():
+    rng = np.random.default_rng(2)
+    return rng.normal(size=(2500, 3))
+
+
+def test_write_and_memory_map(tmp_path, ensemble):
+    path = str(tmp_path / "ENS.ens")
+    write_ensemble(path, ensemble, units="N*m")
+
+    data, header = open_ensemble(path)
+    assert isinstance(data, np.memmap)
+    assert header["shape"] == [2500, 3] and header["units"] == "N*m"
+    assert np.array_equal(data, ensemble)
+
+
+def test_text_binary_roundtrip(tmp_path, ensemble):
+    txtPath = str(tmp_path / "ENS_EV.txt")
+    with open(txtPath, "w") as datafile_id:
+        np.savetxt(datafile_id, ensemble, fmt="%1.5e",
+                   header="x(deg/Myr) y(deg/Myr) z(deg/Myr)", comments="!")
+
+    binPath = text_to_binary(txtPath, chunk_rows=1000)
+    assert is_binary_ensemble(binPath) and not is_binary_ensemble(txtPath)
+
+    data, header = load_ensemble(binPath)
+    assert header["units"] == "deg/Myr" and header["coordinates"] == "cartesian"
+    assert np.allclose(data, ensemble, rtol=1e-5)
+
+    backPath = binary_to_text(binPath, str(tmp_path / "ENS_EV_back.txt"))
+    back, backHeader = load_ensemble(backPath)
+    assert backHeader["columns"] == ["x", "y", "z"]
+    assert np.allclose(back, data, rtol=1e-5)
+
+
+def test_headerless_text(tmp_path, ensemble):
+    txtPath = str(tmp_path / "ENSdM.txt")
+    np.savetxt(txtPath, ensemble, fmt="%.3E")
+
+    data, header = load_ensemble(txtPath)
+    assert data.shape == (2500, 3) and header["columns"] == ["x", "y", "z"]
+
+
+def test_find_ensemble_skips_stale_binary(tmp_path, ensemble):
+    txtPath = str(tmp_path / "ENSdM.txt")
+    np.savetxt(txtPath, ensemble, fmt="%.3E")
+    binPath = text_to_binary(txtPath)
+    os.utime(binPath, ns=(10**18, 10**18))
+    os.utime(txtPath, ns=(10**18, 10**18))
+
+    assert find_ensemble(str(tmp_path), "ENSdM") == binPath
+
+    # The host rewrote the text ensemble after the conversion
+    os.utime(txtPath, ns=(10**18 + 10**9, 10**18 + 10**9))
+    assert find_ensemble(str(tmp_path), "ENSdM") == txtPath
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+
+from GridBundle import (grid_geometry, write_bundle, open_bundle,
+                        text_to_bundle, load_grids, bundle_path)
+
+## ==========================
+
+def write_textGrids(folder, modelLabel, lon, lat, rng):
+
+    layers = {"LON" : lon, "LAT" : lat}
+    for name in ["MuA", "YM", "MT"]:
+        layers[name] = 10**rng.uniform(18, 21, size=lon.shape)
+
+    for name, values in layers.items():
+        fmt = "%.1f" if name in ("LON", "LAT") else "%.4E"
+        np.savetxt(str(folder / ("GRID_%s_%s.txt" %(name, modelLabel))), values, fmt=fmt)
+
+    return layers
+
+
+def test_regular_grid_stores_geometry(tmp_path):
+    rng = np.random.default_rng(4)
+    lon, lat = np.meshgrid(np.arange(-180, 180.1, 2.5), np.arange(90, -90.1, -2.5))
+    layers = write_textGrids(tmp_path, "A5_M15", lon, lat, rng)
+
+    path = text_to_bundle(str(tmp_path), "A5_M15")
+    bundle, header = open_bundle(path)
+
+    assert set(header["layers"]) == {"MuA", "YM", "MT"}
+    assert header["geometry"]["lonStep"] == 2.5
+    assert np.allclose(bundle["LON"], lon) and np.allclose(bundle["LAT"], lat)
+    assert np.allclose(bundle["MuA"], layers["MuA"], rtol=1e-4)
+
+    grids = load_grids(str(tmp_path), "A5_M15")
+    assert isinstance(grids["YM"], np.memmap)
+
+
+def test_irregular_grid_keeps_coordinates(tmp_path):
+    lon, lat = np.meshgrid([0., 1., 3., 7.], [10., 5., 0.])
+    assert grid_geometry(lon, lat) is None
+
+    path = bundle_path(str(tmp_path), "M")
+    write_bundle(path, {"LON" : lon, "LAT" : lat, "MuA" : lon * lat})
+
+    bundle, header = open_bundle(path)
+    assert header["geometry"] is None
+    assert np.array_equal(bundle["LON"], lon) and np.array_equal(bundle["MuA"], lon * lat)
+
+
+def test_stale_bundle_ignored(tmp_path):
+    rng = np.random.default_rng(5)
+    lon, lat = np.meshgrid(np.arange(-10, 10.1, 2.5), np.arange(10, -10.1, -2.5))
+    write_textGrids(tmp_path, "A5_M15", lon, lat, rng)
+    path = text_to_bundle(str(tmp_path), "A5_M15")
+    os.utime(path, ns=(10**18, 10**18))
+
+    # MYRIAM rewrote one layer after the bundle was made
+    layers = write_textGrids(tmp_path, "A5_M15", lon, lat, rng)
+    for name in layers:
+        os.utime(str(tmp_path / ("GRID_%s_A5_M15.txt" %name)), ns=(10**18 - 10**9, 10**18 - 10**9))
+    os.utime(str(tmp_path / "GRID_MuA_A5_M15.txt"), ns=(10**18 + 10**9, 10**18 + 10**9))
+
+    grids = load_grids(str(tmp_path), "A5_M15")
+    assert not isinstance(grids["MuA"], np.memmap)
+    assert np.allclose(grids["MuA"], layers["MuA"], rtol=1e-4)
@@ -0,0 +1,44 @@
+import os
+import json
+import numpy as np
+
+from GridBundle import bundle_path, write_bundle
+from GridTiles import export_tiles, tile_bounds, tile_range
+
+## ==========================
+
+def write_grid(folder, scale=1.0):
+    geometry = {"lonMin" : 20.0, "latMax" : 45.0, "lonStep" : 0.5, "latStep" : 0.5}
+    lat = np.linspace(45, 30, 31)[:, np.newaxis] * np.ones((1, 41))
+
+    write_bundle(bundle_path(str(folder), "M"),
+                 {"MuA" : 10**(18 + lat/30) * scale, "YM" : lat * 1e9, "MT" : lat / 5},
+                 geometry)
+
+
+def test_tile_range_covers_extent():
+    xRange, yRange = tile_range(3, 19.75, 29.75, 40.25, 45.25)
+    lonMin, latMin, _, _ = tile_bounds(3, xRange[0], yRange[-1])
+    _, _, lonMax, latMax = tile_bounds(3, xRange[-1], yRange[0])
+
+    assert lonMin <= 19.75 and lonMax >= 40.25
+    assert latMin <= 29.75 and latMax >= 45.25
+
+
+def test_tiles_regenerate_only_on_change(tmp_path):
+    write_grid(tmp_path)
+    manifestPath = export_tiles(str(tmp_path), "M", ["MuA", "MT"], maxZoom=3, nWorkers=1)
+
+    with open(manifestPath) as datafile_id:
+        manifest = json.load(datafile_id)
+
+    tilePath = os.path.join(str(tmp_path), "TILES_M", "MuA", "3", "4", "3.png")
+    assert manifest["layers"]["MuA"]["count"] == 5 and os.path.exists(tilePath)
+
+    os.utime(tilePath, (0, 0))
+    export_tiles(str(tmp_path), "M", ["MuA", "MT"], maxZoom=3, nWorkers=1)
+    assert os.path.getmtime(tilePath) == 0
+
+    write_grid(tmp_path, scale=2.0)
+    export_tiles(str(tmp_path), "M", ["MuA", "MT"], maxZoom=3, nWorkers=1)
+    assert os.path.getmtime(tilePath) > 0
@@ -0,0 +1,45 @@
+import numpy as np
+
+from ContourIO import split_rings, load_contours, write_contours, contour_collection
+
+## ==========================
+
+def test_split_rings_drops_empty_rings():
+    nan = [np.nan, np.nan]
+    coordinates = [[0, 0], [1, 0], [1, 1], nan, nan, [5, 5], [6, 5], [6, 6], [5, 6], nan]
+
+    vertices, offsets = split_rings(coordinates)
+
+    assert vertices.shape == (7, 2)
+    assert offsets.tolist() == [0, 3, 7]
+
+
+def test_write_load_roundtrip(tmp_path):
+    vertices = np.array([[10., 20.], [11., 20.], [11., 21.], [-50., 5.], [-49., 5.], [-49., 6.]])
+    offsets = np.array([0, 3, 6])
+
+    path = str(tmp_path / "CNTR68_test.txt")
+    write_contours(path, vertices, offsets)
+
+    with open(path) as datafile_id:
+        assert datafile_id.read().splitlines()[3] == "nan nan"
+
+    loaded, loadedOffsets = load_contours(path)
+    assert np.allclose(loaded, vertices) and loadedOffsets.tolist() == [0, 3, 6]
+
+
+def test_empty_file_and_collection(tmp_path):
+    path = tmp_path / "CNTR20_empty.txt"
+    path.write_text("")
+
+    emptyVertices, emptyOffsets = load_contours(str(path))
+    assert emptyVertices.shape == (0, 2) and emptyOffsets.tolist() == [0]
+
+    vertices, offsets = split_rings([[0, 0], [1, 0], [1, 1], [np.nan, np.nan], [3, 3], [4, 3], [4, 4]])
+    collection = contour_collection([
+        {"vertices" : emptyVertices, "offsets" : emptyOffsets},
+        {"vertices" : vertices, "offsets" : offsets, "edgecolor" : "b", "linewidth" : 1.2},
+        ])
+
+    assert len(collection.get_paths()) == 2
+    assert np.allclose(collection.get_linewidths(), 1.2)
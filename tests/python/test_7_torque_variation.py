@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from TorqueVariation import UNITS_TRANSFORMER, torque_variation, ensemble_mean, calculate_dM
+from EnsembleFormat import write_ensemble, load_ensemble
+
+## ==========================
+
+@pytest.fixture
+def run(tmp_path):
+    rng = np.random.default_rng(4)
+    MTX_w2M = rng.normal(size=(3, 3)) * 1e38
+    EVy, EVo = rng.normal(1, 0.2, size=(2, 5000, 3))
+
+    paths = {"MTX" : str(tmp_path / "MTX_w2M_model.txt"), "EVy" : str(tmp_path / "ENS_EV_YOUNG.txt"),
+             "EVo" : str(tmp_path / "ENS_EV_OLD.ens")}
+    np.savetxt(paths["MTX"], MTX_w2M)
+    np.savetxt(paths["EVy"], EVy, fmt="%1.5e", header="x(deg/Myr) y(deg/Myr) z(deg/Myr)", comments="!")
+    write_ensemble(paths["EVo"], EVo, units="deg/Myr")
+
+    EVy = np.loadtxt(paths["EVy"], comments="!")
+    return MTX_w2M, EVy, EVo, paths
+
+
+def test_matches_per_member_loop(run):
+    MTX_w2M, EVy, EVo, _ = run
+
+    # Loop of TorqueVariation.Calculate_dM
+    expected = np.array([MTX_w2M @ ((y - o) * UNITS_TRANSFORMER) for y, o in zip(EVy, EVo)])
+
+    assert np.allclose(torque_variation(MTX_w2M, EVy, EVo), expected, rtol=1e-9, atol=1e-9 * np.abs(expected).max())
+
+
+def test_chunked_run_outputs(run, tmp_path):
+    MTX_w2M, EVy, EVo, paths = run
+    dM = torque_variation(MTX_w2M, EVy, EVo)
+
+    dMmeans = calculate_dM(paths["MTX"], paths["EVy"], paths["EVo"], str(tmp_path), "STGs_0_1_AT_A5_M15_model",
+                           binary=True, chunkRows=700)
+
+    saved, header = load_ensemble(str(tmp_path / "ENSdM_STGs_STGs_0_1_AT_A5_M15_model.ens"))
+    assert header["units"] == "N*m" and np.allclose(saved, dM, rtol=1e-12)
+
+    assert np.allclose(dMmeans[:3], dM.mean(axis=0))
+    assert np.allclose(dMmeans[6:], np.cov(dM.T, bias=True)[np.triu_indices(3)])
+    assert np.allclose(ensemble_mean(dM), dMmeans)
+
+    VECdM = np.loadtxt(str(tmp_path / "VECdM_STGs_STGs_0_1_AT_A5_M15_model.txt"))
+    assert VECdM.shape == (12,) and np.allclose(VECdM, dMmeans, rtol=1e-3)
+
+
+def test_length_mismatch(run, tmp_path):
+    _, EVy, _, paths = run
+    write_ensemble(paths["EVo"], EVy[:-1])
+
+    with pytest.raises(ValueError):
+        calculate_dM(paths["MTX"], paths["EVy"], paths["EVo"], chunkRows=1000)
+
+    # Outputs are named after the full MYRIAM run label
+    with pytest.raises(ValueError):
+        calculate_dM(paths["MTX"], paths["EVy"], paths["EVo"], str(tmp_path), "0_1_AT_A5_M15_model")
+
+
+def test_stage_inputs_are_sampled(run, tmp_path):
+    _, _, _, paths = run
+    stagePath = str(tmp_path / "STG_dEV.txt")
+    np.savetxt(stagePath, [[28.66, 41.38, 1.71, 9.8e-06, 6.4e-06, 9.5e-06, 4.3e-06, 6.2e-06, 9.2e-06, 3000]])
+
+    dMmeans = calculate_dM(paths["MTX"], stagePath, seed=2, chunkRows=1000)
+    assert np.allclose(dMmeans, calculate_dM(paths["MTX"], stagePath, seed=2, chunkRows=2048))
@@ -0,0 +1,56 @@
+import numpy as np
+
+import EulerVectorEnsemble
+from EulerVectorEnsemble import parse_stage, ensemble_blocks, generate_ensemble, stage_to_ensemble
+from EnsembleFormat import load_ensemble
+
+## ==========================
+
+STAGE = [28.66, 41.38, 1.71, 9.82e-06, 6.45e-06, 9.50e-06, 4.26e-06, 6.25e-06, 9.21e-06, 25000]
+
+
+def test_parse_stage():
+    stage = parse_stage(STAGE)
+
+    assert stage["size"] == 25000
+    assert np.isclose(np.linalg.norm(stage["mean"]), 1.71)
+    assert np.isclose(stage["cov"][0, 1], 6.45e-06 * (180 / np.pi)**2)
+
+    # No covariance: 5% of the angular velocity, default size
+    stage = parse_stage(STAGE[:3])
+    assert stage["size"] == EulerVectorEnsemble.DEFAULT_SIZE
+    assert np.allclose(np.diag(stage["cov"]), (0.05 * 1.71)**2)
+
+
+def test_reproducible_and_splittable(monkeypatch):
+    monkeypatch.setattr(EulerVectorEnsemble, "BLOCK_SIZE", 4000)
+
+    ensemble = generate_ensemble(STAGE, seed=7)
+    assert ensemble.shape == (25000, 3)
+    assert np.array_equal(ensemble, generate_ensemble(STAGE, seed=7))
+    assert not np.array_equal(ensemble, generate_ensemble(STAGE, seed=8))
+
+    # Any split of the member range gives the same members
+    parts = [np.concatenate(list(ensemble_blocks(STAGE, 7, start, stop)))
+             for start, stop in [(0, 5000), (5000, 17123), (17123, None)]]
+    assert np.array_equal(np.concatenate(parts), ensemble)
+
+    stage = parse_stage(STAGE)
+    assert np.allclose(ensemble.mean(axis=0), stage["mean"], atol=1e-3)
+    assert np.allclose(np.cov(ensemble.T), stage["cov"], rtol=0.05)
+
+
+def test_stage_to_ensemble(tmp_path):
+    stagePath = str(tmp_path / "STG_EV_TEST.txt")
+    np.savetxt(stagePath, [STAGE], header="lon(degE) lat(degN) w(deg/Myr) cov(rad^2/Myr^2) ensSize",
+               comments="!")
+
+    binPath = str(tmp_path / "ENS_EV_TEST.ens")
+    assert stage_to_ensemble(stagePath, binPath, seed=1) == 25000
+
+    data, header = load_ensemble(binPath)
+    assert header["units"] == "deg/Myr" and np.array_equal(data, generate_ensemble(STAGE, seed=1))
+
+    txtPath = str(tmp_path / "ENS_EV_TEST.txt")
+    stage_to_ensemble(stagePath, txtPath, seed=1, size=10)
+    assert np.allclose(load_ensemble(txtPath)[0], data[:10], rtol=1e-5)
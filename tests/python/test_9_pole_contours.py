@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+import pytest
+from matplotlib.path import Path
+from shapely.geometry import Polygon
+
+from PoleContours import pole_histogram, confidence_levels, marching_squares, pole_contours, ensemble_contours
+from SphericalGeometry import sph2cart
+from ContourIO import load_contours
+
+## ==========================
+
+
+def _fraction_inside(vertices, offsets, lon, lat):
+    points = np.column_stack([lon, lat])
+    inside = np.zeros(len(points), dtype=bool)
+    for ring in np.split(vertices, offsets[1:-1])[:len(offsets) - 1]:
+        inside ^= Path(ring).contains_points(points)
+    return inside.mean()
+
+
+def _poles(centreLon, centreLat, size=200000):
+    rng = np.random.default_rng(3)
+    lon = (centreLon + rng.normal(0, 6, size) + 180) % 360 - 180
+    return lon, centreLat + rng.normal(0, 4, size)
+
+
+def test_histogram_and_levels():
+    counts, lonEdges, latEdges = pole_histogram([-180, 179.9, 0.5, 180, 0], [-90, 0, 0.5, 90, 95], 2)
+
+    assert counts.shape == (90, 180) and counts.sum() == 4
+    assert counts[0, 0] == 1 and counts[45, 90] == 1 and counts[-1, -1] == 1
+    assert len(lonEdges) == 181 and latEdges[-1] == 90
+
+    # Bins holding at least the threshold gather the requested share
+    counts = np.array([[5, 1], [3, 1]])
+    assert list(confidence_levels(counts, [50, 80, 100])) == [5, 3, 1]
+
+
+def test_marching_squares_closed_rings():
+    x = np.arange(10.0)
+    values = np.zeros((10, 10))
+    values[2:5, 2:5] = values[6:8, 6:8] = 1
+
+    vertices, offsets = marching_squares(values, x, x, 0.5)
+
+    assert len(offsets) == 3
+    for start, stop in zip(offsets[:-1], offsets[1:]):
+        assert np.array_equal(vertices[start], vertices[stop - 1])
+
+    areas = sorted(Polygon(vertices[start:stop]).area for start, stop in zip(offsets[:-1], offsets[1:]))
+    assert np.allclose(areas, [3.5, 8.5])   # squares with cut corners
+
+
+def test_pole_contours_enclose_percentages():
+    for centreLon in (30, 178):
+        lon, lat = _poles(centreLon, 20)
+        contours = pole_contours(lon, lat, percents=[20, 68], gStep=2)
+
+        for percent, (vertices, offsets) in contours.items():
+            assert np.all(np.abs(vertices[:, 0]) <= 180)
+            assert abs(_fraction_inside(vertices, offsets, lon, lat) - percent / 100) < 0.03
+
+        # Split at the dateline
+        assert (len(contours[68][1]) > 2) == (centreLon == 178)
+
+
+def test_ensemble_contours(tmp_path):
+    runLabel = "STGs_0_1_AT_A5_M15_test"
+    ensemblePath = str(tmp_path / ("ENSdM_STGs_%s.txt" %runLabel))
+    lon, lat = _poles(179, 60, 50000)
+    np.savetxt(ensemblePath, sph2cart(lat, lon) * 1e18, fmt="%.3E")
+
+    paths = ensemble_contours(ensemblePath, str(tmp_path), runLabel,
+                              percents=[20, 68], bins=[2.5, -180, 180, -90, 90], chunkRows=7000)
+
+    assert [os.path.basename(p) for p in paths] == ["CNTR20_%s_r2p5.txt" %runLabel,
+                                                 "CNTR68_%s_r2p5.txt" %runLabel]
+
+    vertices, offsets = load_contours(paths[1])
+    assert len(offsets) > 1
+    assert abs(_fraction_inside(vertices, offsets, lon, lat) - 0.68) < 0.03
+
+    # Labels without the STGs_ prefix of MYRIAM's RUN_LABEL are rejected
+    with pytest.raises(ValueError):
+        ensemble_contours(ensemblePath, str(tmp_path), "0_1_AT_A5_M15_test")
+
+
+def test_contours_found_by_batch_render(tmp_path):
+    from BatchRender import find_jobs
+
+    runLabel = "STGs_0_1_AT_A5_M15_test"
+    ensemblePath = str(tmp_path / ("ENSdM_STGs_%s.txt" %runLabel))
+    lon, lat = _poles(30, 20, 20000)
+    np.savetxt(ensemblePath, sph2cart(lat, lon) * 1e18, fmt="%.3E")
+    ensemble_contours(ensemblePath, str(tmp_path), runLabel)
+
+    for prefix in ["BDR", "BDRin"]:
+        np.savetxt(tmp_path / ("%s_AT_0_1.txt" %prefix), [[0, 0], [10, 0], [10, 10], [0, 0]], fmt="%.1f")
+
+    jobs, skipped = find_jobs(str(tmp_path), str(tmp_path))
+
+    assert [job["args"][:3] for job in jobs] == [["_%s_r4" %runLabel, "AT", "0_1"]]
+    assert not skipped